@@ -3,7 +3,11 @@ Module with functions needed to provide hashes
 '''
 
 import os
+import ast
+import types
+import inspect
 import hashlib
+import textwrap
 from typing  import Any
 from pathlib import Path
 
@@ -66,3 +70,175 @@ def hash_file(path : str | Path) -> str:
 
     return value[:10]
 # ------------------------------------
+class _DocstringRemover(ast.NodeTransformer):
+    '''
+    Removes docstrings from modules, classes and functions
+    '''
+    def _remove(self, node : ast.AST) -> ast.AST:
+        self.generic_visit(node)
+
+        body = getattr(node, 'body')
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+            body = body[1:] or [ast.Pass()]
+
+        setattr(node, 'body', body)
+
+        return node
+
+    visit_Module          = _remove
+    visit_ClassDef        = _remove
+    visit_FunctionDef     = _remove
+    visit_AsyncFunctionDef= _remove
+# ------------------------------------
+def _is_in_packages(obj : Any, packages : set[str]) -> bool:
+    module = getattr(obj, '__module__', None) if not isinstance(obj, types.ModuleType) else obj.__name__
+    if not isinstance(module, str):
+        return False
+
+    return module.split('.')[0] in packages
+# ------------------------------------
+def _get_references(tree : ast.AST) -> list[list[str]]:
+    '''
+    Returns
+    ----------------
+    List of names and chains of attributes used in code, e.g. [['np', 'sum'], ['fun']]
+    '''
+    l_ref = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            l_ref.append([node.id])
+            continue
+
+        if not isinstance(node, ast.Attribute):
+            continue
+
+        l_name = [node.attr]
+        value  = node.value
+        while isinstance(value, ast.Attribute):
+            l_name.insert(0, value.attr)
+            value = value.value
+
+        if isinstance(value, ast.Name):
+            l_ref.append([value.id] + l_name)
+
+    return l_ref
+# ------------------------------------
+def _resolve(names : list[str], scope : dict[str,Any]) -> Any:
+    if names[0] not in scope:
+        return None
+
+    obj = scope[names[0]]
+    for name in names[1:]:
+        # Only follow attributes of modules and classes, e.g. module.function
+        if not isinstance(obj, (types.ModuleType, type)):
+            break
+
+        obj = getattr(obj, name, None)
+
+    return obj
+# ------------------------------------
+def _is_literal(value : Any) -> bool:
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return True
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_literal(val) for val in value)
+
+    if isinstance(value, dict):
+        return all(_is_literal(key) and _is_literal(val) for key, val in value.items())
+
+    return False
+# ------------------------------------
+def _literal_to_string(value : Any) -> str:
+    # Order of sets changes between sessions, due to hash randomization
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(_literal_to_string(val) for val in value))
+
+    return repr(value)
+# ------------------------------------
+def _code_to_string(code : types.CodeType) -> str:
+    '''
+    Returns
+    ----------------
+    String with bytecode, constants and names used by code object, as well as nested ones, e.g. lambdas
+    '''
+    l_const = []
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            l_const.append(_code_to_string(const))
+        else:
+            l_const.append(_literal_to_string(const))
+
+    return repr((code.co_code.hex(), l_const, code.co_names, code.co_varnames))
+# ------------------------------------
+def _get_tree(obj : Any) -> ast.AST:
+    '''
+    Returns
+    ----------------
+    Syntax tree of object, without docstrings
+    If the source code cannot be found, e.g. lambdas in a larger expression,
+    the bytecode is used
+    '''
+    try:
+        source = textwrap.dedent(inspect.getsource(obj))
+        tree   = ast.parse(source)
+    except (OSError, TypeError, SyntaxError) as exc:
+        code = getattr(obj, '__code__', None)
+        if code is None:
+            raise ValueError(f'Cannot find code for: {obj}') from exc
+
+        log.debug(f'Using bytecode for: {obj}')
+        # Bytes, not string, otherwise it would be removed as a docstring
+        tree = ast.Module(body=[ast.Expr(value=ast.Constant(value=_code_to_string(code).encode('utf-8')))], type_ignores=[])
+
+    return _DocstringRemover().visit(tree)
+# ------------------------------------
+def hash_code(obj : Any, packages : list[str]) -> str:
+    '''
+    Parameters
+    ----------------
+    obj     : Class or function whose code has to be hashed
+    packages: Names of top level packages, e.g. dmu, whose code will be followed
+
+    Returns
+    ----------------
+    A string representing the hash of the syntax trees, i.e. without comments, docstrings or formatting, of:
+
+    - The object passed
+    - Its base classes, as well as the classes and functions that it uses, within `packages`
+    - Recursively, the code used by the latter
+    - Module level constants used, e.g. strings, numbers, lists of those, etc.
+    '''
+    s_package         = set(packages)
+    l_pending         = [obj]
+    d_code : dict[str,str] = {}
+    s_seen : set[int] = set()
+    while l_pending:
+        this = inspect.unwrap(l_pending.pop())
+        if id(this) in s_seen:
+            continue
+
+        s_seen.add(id(this))
+        name   = f'{this.__module__}.{this.__qualname__}'
+        tree   = _get_tree(obj=this)
+        d_code[name] = ast.dump(tree)
+
+        module = inspect.getmodule(this)
+        scope  = {} if module is None else vars(module)
+        if isinstance(this, type):
+            l_pending += [ base for base in this.__bases__ if _is_in_packages(base, s_package) ]
+
+        for l_name in _get_references(tree=tree):
+            value = _resolve(names=l_name, scope=scope)
+            if isinstance(value, (type, types.FunctionType)) and _is_in_packages(value, s_package):
+                l_pending.append(value)
+                continue
+
+            if l_name[0] in scope and _is_literal(value) and len(l_name) == 1:
+                d_code[f'{this.__module__}.{l_name[0]}'] = _literal_to_string(value)
+
+    string = '\n'.join(f'{key}:{val}' for key, val in sorted(d_code.items()))
+    value  = hashlib.sha256(string.encode('utf-8')).hexdigest()
+
+    return value[:10]
+# ------------------------------------
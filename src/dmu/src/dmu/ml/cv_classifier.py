@@ -3,9 +3,12 @@ Module holding cv_classifier class
 '''
 import os
 from typing                  import Union
-from sklearn.ensemble        import GradientBoostingClassifier
+from sklearn.ensemble        import GradientBoostingClassifier, HistGradientBoostingClassifier
 
 import yaml
+import numpy
+import pandas as pnd
+
 from dmu.logging.log_store import LogStore
 import dmu.ml.utilities    as ut
 
@@ -20,6 +23,12 @@ class CVSameData(Exception):
 class CVClassifier(GradientBoostingClassifier):
     '''
     Derived class meant to implement features needed for cross-validation
+
+    The learner is picked with `training/backend` in the configuration:
+
+    exact: Default, uses the `GradientBoostingClassifier` this class derives from
+    hist : Uses a `HistGradientBoostingClassifier`, held by this class, which bins the features
+           and is much faster to train and evaluate on large samples
     '''
     # pylint: disable = too-many-ancestors, abstract-method
     # ----------------------------------
@@ -32,10 +41,18 @@ class CVClassifier(GradientBoostingClassifier):
 
         self._cfg = cfg
 
-        d_hyp = self._cfg['training']['hyper']
-        super().__init__(**d_hyp)
+        d_hyp         = self._cfg['training']['hyper']
+        self._backend = self._cfg['training'].get('backend', 'exact')
+        if   self._backend == 'exact':
+            super().__init__(**d_hyp)
+            self._estimator = None
+        elif self._backend == 'hist':
+            super().__init__()
+            self._estimator = HistGradientBoostingClassifier(**d_hyp)
+        else:
+            raise ValueError(f'Invalid backend: {self._backend}')
 
-        self._s_hash    = set()
+        self._arr_hash  = numpy.array([], dtype=numpy.uint64)
         self._data      = {}
         self._l_ft_name : list[str]
     # ----------------------------------
@@ -47,11 +64,51 @@ class CVClassifier(GradientBoostingClassifier):
         return self._l_ft_name
     # ----------------------------------
     @property
-    def hashes(self) -> set[str]:
+    def backend(self) -> str:
         '''
-        Will return set with hashes of training data
+        Returns name of learner used, exact or hist
         '''
-        return self._s_hash
+        # Models pickled before backends were introduced do not have this attribute
+        return getattr(self, '_backend', 'exact')
+    # ----------------------------------
+    @property
+    def feature_importances_(self) -> numpy.ndarray:
+        '''
+        Returns array with importances of features, normalized to one.
+        For the hist backend these are the total gains of the splits made on each feature
+        '''
+        if self.backend == 'exact':
+            return super().feature_importances_
+
+        arr_imp = numpy.zeros(self._estimator.n_features_in_)
+        for l_predictor in self._estimator._predictors: # pylint: disable = protected-access
+            for predictor in l_predictor:
+                arr_node = predictor.nodes[~predictor.nodes['is_leaf'].astype(bool)]
+                numpy.add.at(arr_imp, arr_node['feature_idx'], arr_node['gain'])
+
+        total = arr_imp.sum()
+        if total > 0:
+            arr_imp = arr_imp / total
+
+        return arr_imp
+    # ----------------------------------
+    @property
+    def hashes(self) -> Union[numpy.ndarray, set[str]]:
+        '''
+        Will return sorted array with 64 bits hashes of training data.
+        For models trained with older versions of this class, it will return
+        the set of string hashes saved with the model.
+        '''
+        if self._is_legacy():
+            return self._s_hash
+
+        return self._arr_hash
+    # ----------------------------------
+    def _is_legacy(self) -> bool:
+        '''
+        True if the model was trained, and pickled, when the hashes were strings
+        '''
+        return not hasattr(self, '_arr_hash')
     # ----------------------------------
     @property
     def cfg(self):
@@ -76,11 +133,12 @@ class CVClassifier(GradientBoostingClassifier):
         log.info(f'Saved config to: {path}')
     # ----------------------------------
     def __str__(self):
-        nhash = len(self._s_hash)
+        nhash = len(self.hashes)
 
         msg = 40 * '-' + '\n'
         msg+= f'{"Attribute":<20}{"Value":<20}\n'
         msg+= 40 * '-' + '\n'
+        msg += f'{"Backend":<20}{self.backend:<20}\n'
         msg += f'{"Hashes":<20}{nhash:<20}\n'
         msg+= 40 * '-'
 
@@ -95,29 +153,50 @@ class CVClassifier(GradientBoostingClassifier):
         df_ft           = args[0]
         self._l_ft_name = list(df_ft.columns)
 
-        self._s_hash = ut.get_hashes(df_ft)
-        log.debug(f'Saving {len(self._s_hash)} hashes')
+        self._arr_hash = numpy.unique(ut.get_fingerprints(df_ft))
+        log.debug(f'Saving {len(self._arr_hash)} hashes')
 
-        super().fit(*args, **kwargs)
+        if self.backend == 'exact':
+            super().fit(*args, **kwargs)
+        else:
+            self._estimator.fit(*args, **kwargs)
 
         return self
     # ----------------------------------
+    def in_training(self, df_ft : pnd.DataFrame) -> numpy.ndarray:
+        '''
+        Parameters
+        -------------
+        df_ft: Dataframe with features
+
+        Returns
+        -------------
+        Array of booleans, true for the rows that were used to train this model
+        '''
+        if len(self.hashes) == 0:
+            raise ValueError('Found no hashes in model')
+
+        if not self._is_legacy():
+            arr_hash = ut.get_fingerprints(df_ft)
+
+            return ut.in_hashes(arr_hash=arr_hash, arr_ref=self._arr_hash)
+
+        log.debug('Using string hashes from model trained with older version')
+        l_hash = ut.get_hashes(df_ft, rvalue='list')
+
+        return numpy.array([ hsh in self._s_hash for hsh in l_hash ], dtype=bool)
+    # ----------------------------------
     def _check_hashes(self, df_ft):
         '''
         Will check that the hashes of the passed features do not intersect with the
         hashes of the features used for the training.
         Else it will raise CVSameData exception
         '''
+        arr_in = self.in_training(df_ft)
 
-        if len(self._s_hash) == 0:
-            raise ValueError('Found no hashes in model')
-
-        s_hash  = ut.get_hashes(df_ft)
-        s_inter = self._s_hash.intersection(s_hash)
-
-        nh1 = len(self._s_hash)
-        nh2 = len(      s_hash)
-        nh3 = len(s_inter)
+        nh1 = len(self.hashes)
+        nh2 = len(arr_in)
+        nh3 = arr_in.sum()
 
         if nh3 > 0:
             raise CVSameData(f'Found non empty intersection of size: {nh1} ^ {nh2} = {nh3}')
@@ -138,5 +217,8 @@ class CVClassifier(GradientBoostingClassifier):
         else:
             log.debug(f'Passing to scikit-learn {len(X)} samples to predict')
 
-        return super().predict_proba(X)
+        if self.backend == 'exact':
+            return super().predict_proba(X)
+
+        return self._estimator.predict_proba(X)
 # ---------------------------------------
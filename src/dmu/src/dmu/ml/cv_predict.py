@@ -1,17 +1,21 @@
 '''
 Module holding CVPredict class
 '''
+import math
+
 import pandas as pnd
 import numpy
 import tqdm
 
-from ROOT.RDF import RNode # type: ignore
+from ROOT     import IsImplicitMTEnabled # type: ignore
+from ROOT.RDF import RNode               # type: ignore
 
 import dmu.ml.utilities     as ut
 
-from dmu.ml.cv_classifier  import CVClassifier
+from dmu.ml.cv_classifier  import CVClassifier, CVSameData
 from dmu.logging.log_store import LogStore
 from dmu.rdataframe        import utilities as rut
+from dmu.rdataframe.expression_library import ExpressionLibrary
 
 log = LogStore.add_logger('dmu:ml:cv_predict')
 # ---------------------------------------
@@ -22,19 +26,27 @@ class CVPredict:
     '''
     def __init__(
         self,
-        rdf    : RNode,
-        models : list[CVClassifier]):
+        rdf        : RNode,
+        models     : list[CVClassifier],
+        chunk_size : int | None = None):
         '''
         Will take a list of CVClassifier models and a ROOT dataframe
 
-        rdf   : ROOT dataframe where features will be extracted
-        models: List of models, one per fold
+        rdf       : ROOT dataframe where features will be extracted
+        models    : List of models, one per fold
+        chunk_size: If passed, features will be read and scores calculated in chunks of this many entries,
+                    such that memory usage does not grow with the size of the dataframe. By default, read everything at once
         '''
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError(f'Invalid chunk size: {chunk_size}')
+
         self._l_model   = models
+        self._chunk_size= chunk_size
         self._rdf       = rdf
         self._nrows     : int
         self._l_column  : list[str]
         self._d_nan_rep : dict[str,str]
+        self._data      = None # Lazy result of AsNumpy, set by `book`
 
         # Value of score used when no score has been assigned
         self._dummy_score = -1.0
@@ -45,12 +57,17 @@ class CVPredict:
         # name of attribute of features dataframe where array of indices to skip are stored
         self._index_skip  = 'skip_mva_prediction'
     # --------------------------------------------
-    def _initialize(self):
+    def _initialize(self, lazy : bool = False):
+        '''
+        lazy: If True, will not run the event loop to count the entries
+        '''
         self._rdf       = self._remove_periods(self._rdf)
         self._rdf       = self._define_columns(self._rdf)
         self._d_nan_rep = self._get_nan_replacements()
         self._l_column  = self._get_column_names()
-        self._nrows     = self._rdf.Count().GetValue()
+
+        if not lazy:
+            self._nrows = self._rdf.Count().GetValue()
     # ----------------------
     def _get_column_names(self) -> list[str]:
         '''
@@ -131,22 +148,20 @@ class CVPredict:
             log.info('No definitions found')
             return self._rdf
 
-        dexc = None
         log.debug(60 * '-')
         log.info('Defining columns in RDF before evaluating classifier')
         log.debug(60 * '-')
+        exl = ExpressionLibrary(rdf=rdf)
         for name, expr in d_def.items():
             expr = expr.replace('.', '_')
 
             log.debug(f'{name:<20}{"<---":20}{expr:<100}')
-            try:
-                rdf = rdf.Define(name, expr)
-            except TypeError as exc:
-                log.error(f'Cannot define {name}={expr}')
-                dexc = exc
+            exl = exl.Define(name, expr)
 
-        if dexc is not None:
-            raise TypeError('Could not define at least one column') from dexc
+        try:
+            rdf = exl.get_rdf()
+        except ValueError as exc:
+            raise ValueError('Could not define at least one column') from exc
 
         return rdf
     # --------------------------------------------
@@ -177,10 +192,11 @@ class CVPredict:
 
         return df_ft
     # --------------------------------------------
-    def _df_from_rdf(self, features : list[str]) -> pnd.DataFrame:
+    def _df_from_rdf(self, rdf : RNode, features : list[str]) -> pnd.DataFrame:
         '''
         Parameters
         -------------
+        rdf     : ROOT dataframe, full or a chunk of it
         features: List of feature names
 
         Returns
@@ -198,20 +214,39 @@ class CVPredict:
                 log.info(column)
             raise ValueError('At least one column is missing')
 
-        data = self._rdf.AsNumpy(features)
+        data = self._get_data(rdf=rdf, columns=features)
         df   = pnd.DataFrame(data)
 
         return df
     # --------------------------------------------
-    def _get_df(self) -> pnd.DataFrame:
+    def _get_data(self, rdf : RNode, columns : list[str]) -> dict[str,numpy.ndarray]:
         '''
-        Will make ROOT rdf into dataframe and return it
+        Parameters
+        -------------
+        rdf    : ROOT dataframe, full or a chunk of it
+        columns: Names of columns
+
+        Returns
+        -------------
+        Dictionary with arrays for columns, taken from what was booked with `book`,
+        if it was called, otherwise from running the event loop
+        '''
+        if self._data is None:
+            return rdf.AsNumpy(columns)
+
+        data = self._data.GetValue()
+
+        return { name : data[name] for name in columns }
+    # --------------------------------------------
+    def _get_df(self, rdf : RNode) -> pnd.DataFrame:
+        '''
+        Will make ROOT rdf, full or a chunk of it, into dataframe and return it
         '''
         model = self._l_model[0]
         l_ft  = model.features
-        df_ft = self._df_from_rdf(features=l_ft)
+        df_ft = self._df_from_rdf(rdf=rdf, features=l_ft)
         df_ft = self._replace_nans(df_ft=df_ft)
-        df_ft = self._tag_skipped(df_ft=df_ft)
+        df_ft = self._tag_skipped(rdf=rdf, df_ft=df_ft)
         df_ft = ut.tag_nans(
             df      = df_ft,
             indexes = self._index_skip)
@@ -223,7 +258,7 @@ class CVPredict:
 
         return df_ft
     # --------------------------------------------
-    def _tag_skipped(self, df_ft : pnd.DataFrame) -> pnd.DataFrame:
+    def _tag_skipped(self, rdf : RNode, df_ft : pnd.DataFrame) -> pnd.DataFrame:
         '''
         Will drop rows with features where column with name _skip_name (currently "_skip_mva_prediction") has values of 1
         '''
@@ -232,7 +267,7 @@ class CVPredict:
             return df_ft
 
         log.info(f'Dropping rows through: {self._skip_index_column}')
-        arr_drop                = self._rdf.AsNumpy([self._skip_index_column])[self._skip_index_column]
+        arr_drop                = self._get_data(rdf=rdf, columns=[self._skip_index_column])[self._skip_index_column]
 
         if self._index_skip in df_ft.attrs:
             raise ValueError(f'Feature dataframe already contains attribute: {self._index_skip}')
@@ -245,15 +280,9 @@ class CVPredict:
         '''
         Will return True if hashes of model and data do not overlap
         '''
+        arr_in = model.in_training(df_ft)
 
-        s_mod_hash = model.hashes
-        s_dff_hash = ut.get_hashes(df_ft)
-
-        s_int = s_mod_hash.intersection(s_dff_hash)
-        if len(s_int) == 0:
-            return True
-
-        return False
+        return not arr_in.any()
     # --------------------------------------------
     def _predict_with_overlap(self, df_ft : pnd.DataFrame) -> numpy.ndarray:
         '''
@@ -262,29 +291,33 @@ class CVPredict:
         Will return numpy array of prediction probabilities when there is an overlap
         of data and model hashes
         '''
-        df_ft      = ut.index_with_hashes(df_ft)
-        d_prob     = {}
+        arr_prob   = None
+        arr_done   = numpy.zeros(len(df_ft), dtype=bool)
         ntotal     = len(df_ft)
         log.debug(30 * '-')
         log.info(f'Total size: {ntotal}')
         log.debug(30 * '-')
         for model in tqdm.tqdm(self._l_model, ascii=' -'):
-            d_prob_tmp = self._evaluate_model(model, df_ft)
-            d_prob.update(d_prob_tmp)
+            arr_keep, arr_prob_tmp = self._evaluate_model(model, df_ft)
+            if arr_prob_tmp is None:
+                continue
+
+            if arr_prob is None:
+                arr_prob = numpy.zeros((ntotal, arr_prob_tmp.shape[1]))
 
-        ndata  = len(df_ft)
-        nprob  = len(d_prob)
-        if ndata != nprob:
-            log.warning(f'Dataset size ({ndata}) and probabilities size ({nprob}) differ, likely there are repeated entries')
+            arr_prob[arr_keep] = arr_prob_tmp
+            arr_done          |= arr_keep
 
-        l_prob = [ d_prob[hsh] for hsh in df_ft.index ]
+        nmiss = (~arr_done).sum()
+        if arr_prob is None or nmiss > 0:
+            raise CVSameData(f'Found {nmiss}/{ntotal} samples used to train every model')
 
-        return numpy.array(l_prob)
+        return arr_prob
     # --------------------------------------------
     def _evaluate_model(
-        self, 
-        model : CVClassifier, 
-        df_ft : pnd.DataFrame) -> dict[str, float]:
+        self,
+        model : CVClassifier,
+        df_ft : pnd.DataFrame) -> tuple[numpy.ndarray, numpy.ndarray|None]:
         '''
         Parameters:
         ------------------------
@@ -293,36 +326,31 @@ class CVPredict:
 
         Returns
         ------------------------
-        Dictionary with:
+        Tuple with:
 
-        Key  : Hash representing the features
-        Value: Probability
+        - Array of booleans, true for the samples not used to train the model
+        - Array of probabilities for those samples, None if all were used to train the model
         '''
-        s_dat_hash : set[str] = set(df_ft.index)
-        s_mod_hash : set[str] = model.hashes
+        arr_keep = ~model.in_training(df_ft)
 
-        s_dif_hash = s_dat_hash - s_mod_hash
-        if not s_dif_hash:
-            log.warning(f'All {len(s_dat_hash)} were used to train fold, skipping prediction')
-            return dict()
+        ndat = len(arr_keep)
+        ndif = arr_keep.sum()
+        if ndif == 0:
+            log.warning(f'All {ndat} were used to train fold, skipping prediction')
+            return arr_keep, None
 
-        ndif = len(s_dif_hash)
-        ndat = len(s_dat_hash)
-        nmod = len(s_mod_hash)
+        nmod = len(model.hashes)
         log.debug(f'{ndif:<10}{"=":5}{ndat:<10}{"-":5}{nmod:<10}')
 
-        df_ft_group= df_ft.loc[df_ft.index.isin(s_dif_hash)]
-
-        l_prob = model.predict_proba(df_ft_group)
-        l_hash = list(df_ft_group.index)
-        d_prob = dict(zip(l_hash, l_prob))
-        nfeat  = len(df_ft_group)
-        nprob  = len(l_prob)
+        df_ft_group= df_ft.loc[arr_keep]
+        arr_prob   = model.predict_proba(df_ft_group, on_training_ok=True)
+        nfeat      = len(df_ft_group)
+        nprob      = len(arr_prob)
 
         if nfeat != nprob:
             raise ValueError(f'Number of features and probabilities do not agree: {nfeat} != {nprob}')
 
-        return d_prob
+        return arr_keep, arr_prob
     # --------------------------------------------
     def _predict_signal_probabilities(
         self,
@@ -348,13 +376,18 @@ class CVPredict:
 
         return arr_sig_prb
     # --------------------------------------------
-    def predict(self) -> numpy.ndarray:
+    def _predict_rdf(self, rdf : RNode, nrows : int) -> numpy.ndarray:
         '''
-        Will return array of prediction probabilities for the signal category
-        '''
-        self._initialize()
+        Parameters
+        ----------------
+        rdf  : ROOT dataframe, full or a chunk of it
+        nrows: Number of entries in dataframe
 
-        df_ft = self._get_df()
+        Returns
+        ----------------
+        Array of prediction probabilities for the signal category
+        '''
+        df_ft = self._get_df(rdf=rdf)
         model = self._l_model[0]
 
         arr_keep = None
@@ -382,8 +415,67 @@ class CVPredict:
         if arr_skip is None:
             return arr_sig_prb
 
-        arr_all_sig_prb           = numpy.full(self._nrows, self._dummy_score)
+        arr_all_sig_prb           = numpy.full(nrows, self._dummy_score)
         arr_all_sig_prb[arr_keep] = arr_sig_prb
 
         return arr_all_sig_prb
+    # --------------------------------------------
+    def _predict_in_chunks(self, chunk_size : int) -> numpy.ndarray:
+        '''
+        Will read the dataframe in ranges of `chunk_size` entries, calculate their
+        scores and fill them in an array with the scores for the whole dataframe
+        '''
+        if IsImplicitMTEnabled():
+            raise ValueError('Predicting in chunks requires ROOT multithreading to be disabled')
+
+        arr_sig_prb = numpy.full(self._nrows, self._dummy_score)
+        nchunk      = math.ceil(self._nrows / chunk_size)
+        log.info(f'Predicting {self._nrows} entries in {nchunk} chunks')
+        for start in tqdm.tqdm(range(0, self._nrows, chunk_size), total=nchunk, ascii=' -'):
+            stop = min(start + chunk_size, self._nrows)
+            rdf  = self._rdf.Range(start, stop)
+
+            arr_sig_prb[start:stop] = self._predict_rdf(rdf=rdf, nrows=stop - start)
+
+        return arr_sig_prb
+    # --------------------------------------------
+    def book(self) -> None:
+        '''
+        Will book the reading of the features, without running the event loop.
+        This allows several objects of this class, and other lazy actions, to read their
+        inputs from dataframes with a common source in a single event loop, the one that
+        runs when any of them is first needed, e.g. when calling `predict`.
+        '''
+        if self._chunk_size is not None:
+            raise ValueError('Features cannot be booked when predicting in chunks')
+
+        if self._data is not None:
+            log.debug('Features already booked')
+            return
+
+        self._initialize(lazy=True)
+
+        l_col = list(self._l_model[0].features)
+        if self._skip_index_column in self._l_column:
+            l_col.append(self._skip_index_column)
+
+        log.debug(f'Booking {len(l_col)} columns')
+        self._data = self._rdf.AsNumpy(l_col, lazy=True)
+    # --------------------------------------------
+    def predict(self) -> numpy.ndarray:
+        '''
+        Will return array of prediction probabilities for the signal category
+        '''
+        if self._data is not None:
+            name        = self._l_model[0].features[0]
+            self._nrows = len(self._data.GetValue()[name])
+
+            return self._predict_rdf(rdf=self._rdf, nrows=self._nrows)
+
+        self._initialize()
+
+        if self._chunk_size is not None:
+            return self._predict_in_chunks(chunk_size=self._chunk_size)
+
+        return self._predict_rdf(rdf=self._rdf, nrows=self._nrows)
 # ---------------------------------------
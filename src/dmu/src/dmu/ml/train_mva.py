@@ -5,10 +5,13 @@ Module with TrainMva class
 import os
 import copy
 import math
+import tempfile
+import multiprocessing
 
 from contextlib import contextmanager
 from typing     import Union
 from functools  import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import tqdm
 import joblib
@@ -85,9 +88,35 @@ class TrainMva:
 
         self._rdm_state = 42 # Random state for training classifier
         self._nworkers  =  1 # Used to set number of workers for ANY process. Can be overriden with `use` context manager
+        self._share_dir : str | None = None # Directory with features and labels as .npy files, used by fold workers
 
         optuna.logging.set_verbosity(optuna.logging.WARNING)
     # ---------------------------------------------
+    def __getstate__(self) -> dict:
+        '''
+        Used to send this object to the processes training folds.
+        ROOT dataframes cannot be pickled and are dropped. If the features were shared
+        through files, they will be read from there, memory mapped, instead of copied.
+        '''
+        d_state = self.__dict__.copy()
+        for name in ['_rdf_sig_org', '_rdf_bkg_org', '_rdf_sig', '_rdf_bkg', '_pbar']:
+            d_state[name] = None
+
+        if self._share_dir is not None:
+            d_state['_df_ft'] = None
+            d_state['_l_lab'] = None
+
+        return d_state
+    # ---------------------------------------------
+    def __setstate__(self, d_state : dict) -> None:
+        self.__dict__.update(d_state)
+        if self._share_dir is None:
+            return
+
+        arr_ft      = numpy.load(f'{self._share_dir}/features.npy', mmap_mode='r')
+        self._l_lab = numpy.load(f'{self._share_dir}/labels.npy'  , mmap_mode='r')
+        self._df_ft = pnd.DataFrame(arr_ft, columns=self._l_ft_name, copy=False)
+    # ---------------------------------------------
     def _get_extra_columns(self, rdf : RDF.RNode, df : pnd.DataFrame) -> list[str]:
         d_plot = self._cfg['plotting']['features']['plots']
         l_expr = list(d_plot)
@@ -264,6 +293,81 @@ class TrainMva:
 
         return model
     # ---------------------------------------------
+    def _train_fold(self, ifold : int, arr_itr : NPA, arr_its : NPA) -> tuple[cls, NPA, NPA, NPA, NPA]:
+        '''
+        Trains model for one fold and makes the plots and tables associated to it
+
+        Parameters
+        ---------------
+        ifold  : Index of fold
+        arr_itr: Indexes of training samples
+        arr_its: Indexes of testing samples
+
+        Returns
+        ---------------
+        Tuple with model and, for the testing samples, the labels as well as the
+        signal probabilities for all the samples, the signal and the background samples
+        '''
+        log.debug(20 * '-')
+        log.info(f'Training fold: {ifold}')
+        log.debug(20 * '-')
+        model = self._get_model(arr_itr)
+
+        arr_sig_tr, arr_bkg_tr, arr_all_tr, arr_lab_tr = self._get_scores(model, arr_itr, on_training_ok= True)
+        arr_sig_ts, arr_bkg_ts, arr_all_ts, arr_lab_ts = self._get_scores(model, arr_its, on_training_ok=False)
+
+        self._save_feature_importance(model, ifold)
+        self._plot_correlations(arr_itr, ifold)
+        self._plot_scores(
+            ifold  =     ifold,
+            sig_trn=arr_sig_tr,
+            sig_tst=arr_sig_ts,
+            bkg_trn=arr_bkg_tr,
+            bkg_tst=arr_bkg_ts)
+
+        xval_ts, yval_ts, _ = TrainMva.plot_roc(arr_lab_ts, arr_all_ts, kind='Test' , ifold=ifold)
+        xval_tr, yval_tr, _ = TrainMva.plot_roc(arr_lab_tr, arr_all_tr, kind='Train', ifold=ifold)
+        self._plot_probabilities(xval_tr, yval_tr, arr_all_tr, arr_lab_tr)
+        self._save_roc_plot(ifold=ifold)
+
+        self._save_roc_json(xval=xval_ts, yval=yval_ts, kind='Test' , ifold=ifold)
+        self._save_roc_json(xval=xval_tr, yval=yval_tr, kind='Train', ifold=ifold)
+
+        return model, arr_lab_ts, arr_all_ts, arr_sig_ts, arr_bkg_ts
+    # ---------------------------------------------
+    def _train_folds_in_parallel(self, l_split : list[tuple[NPA,NPA]]) -> list[tuple[cls, NPA, NPA, NPA, NPA]]:
+        '''
+        Trains folds in separate processes, at most `nworkers` at a time.
+        Features and labels are saved once to .npy files, which the workers memory map.
+        Processes are spawned, not forked, because ROOT might be running threads in this one.
+
+        Parameters
+        ---------------
+        l_split: List of pairs of training and testing indexes, one per fold
+
+        Returns
+        ---------------
+        List of outputs of `_train_fold`, one per fold
+        '''
+        nworkers = min(self._nworkers, len(l_split))
+        log.info(f'Training {len(l_split)} folds with {nworkers} workers')
+
+        with tempfile.TemporaryDirectory(prefix='train_mva_') as share_dir:
+            arr_ft = self._df_ft[self._l_ft_name].to_numpy(dtype='float64')
+            numpy.save(f'{share_dir}/features.npy', arr_ft)
+            numpy.save(f'{share_dir}/labels.npy'  , self._l_lab)
+
+            self._share_dir = share_dir
+            try:
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=nworkers, mp_context=context) as pool:
+                    l_future = [ pool.submit(self._train_fold, ifold, arr_itr, arr_its) for ifold, (arr_itr, arr_its) in enumerate(l_split) ]
+                    l_result = [ future.result() for future in l_future ]
+            finally:
+                self._share_dir = None
+
+        return l_result
+    # ---------------------------------------------
     def _get_models(self, load_trained : bool) -> list[cls]:
         '''
         Will create models, train them and return them
@@ -277,46 +381,13 @@ class TrainMva:
 
         kfold = StratifiedKFold(n_splits=nfold, shuffle=True, random_state=rdmst)
 
-        l_model=[]
-        ifold=0
-
-        l_arr_lab_ts = []
-        l_arr_all_ts = []
-        l_arr_sig_ts = []
-        l_arr_bkg_ts = []
-        for arr_itr, arr_its in kfold.split(self._df_ft, self._l_lab):
-            log.debug(20 * '-')
-            log.info(f'Training fold: {ifold}')
-            log.debug(20 * '-')
-            model = self._get_model(arr_itr)
-            l_model.append(model)
-
-            arr_sig_tr, arr_bkg_tr, arr_all_tr, arr_lab_tr = self._get_scores(model, arr_itr, on_training_ok= True)
-            arr_sig_ts, arr_bkg_ts, arr_all_ts, arr_lab_ts = self._get_scores(model, arr_its, on_training_ok=False)
-
-            self._save_feature_importance(model, ifold)
-            self._plot_correlations(arr_itr, ifold)
-            self._plot_scores(
-                ifold  =     ifold,
-                sig_trn=arr_sig_tr,
-                sig_tst=arr_sig_ts,
-                bkg_trn=arr_bkg_tr,
-                bkg_tst=arr_bkg_ts)
-
-            xval_ts, yval_ts, _ = TrainMva.plot_roc(arr_lab_ts, arr_all_ts, kind='Test' , ifold=ifold)
-            xval_tr, yval_tr, _ = TrainMva.plot_roc(arr_lab_tr, arr_all_tr, kind='Train', ifold=ifold)
-            self._plot_probabilities(xval_tr, yval_tr, arr_all_tr, arr_lab_tr)
-            self._save_roc_plot(ifold=ifold)
-
-            self._save_roc_json(xval=xval_ts, yval=yval_ts, kind='Test' , ifold=ifold)
-            self._save_roc_json(xval=xval_tr, yval=yval_tr, kind='Train', ifold=ifold)
-
-            ifold+=1
+        l_split = list(kfold.split(self._df_ft, self._l_lab))
+        if self._nworkers > 1:
+            l_result = self._train_folds_in_parallel(l_split=l_split)
+        else:
+            l_result = [ self._train_fold(ifold, arr_itr, arr_its) for ifold, (arr_itr, arr_its) in enumerate(l_split) ]
 
-            l_arr_lab_ts.append(arr_lab_ts)
-            l_arr_all_ts.append(arr_all_ts)
-            l_arr_sig_ts.append(arr_sig_ts)
-            l_arr_bkg_ts.append(arr_bkg_ts)
+        l_model, l_arr_lab_ts, l_arr_all_ts, l_arr_sig_ts, l_arr_bkg_ts = map(list, zip(*l_result))
 
         arr_lab_ts = numpy.concatenate(l_arr_lab_ts)
         arr_all_ts = numpy.concatenate(l_arr_all_ts)
@@ -733,7 +804,7 @@ class TrainMva:
         ft = self._df_ft
         lab= self._l_lab
 
-        if not issubclass(cls, GradientBoostingClassifier):
+        if self._cfg['training'].get('backend', 'exact') != 'exact':
             raise NotImplementedError('Hyperparameter optimization only implemented for GradientBoostingClassifier')
 
         nft = len(ft.columns)
@@ -92,11 +92,10 @@ def _remove_nans(df : pnd.DataFrame) -> pnd.DataFrame:
     return df
 # ---------------------------------------------
 def _remove_repeated(df : pnd.DataFrame) -> pnd.DataFrame:
-    l_hash = get_hashes(df, rvalue='list')
-    s_hash = set(l_hash)
+    arr_hash = get_fingerprints(df)
 
-    ninit = len(l_hash)
-    nfinl = len(s_hash)
+    ninit = len(arr_hash)
+    nfinl = len(numpy.unique(arr_hash))
 
     if ninit == nfinl:
         log.debug('No overlap between training and application found')
@@ -104,8 +103,7 @@ def _remove_repeated(df : pnd.DataFrame) -> pnd.DataFrame:
 
     log.warning(f'Overlap between training and application found, cleaning up: {ninit} -> {nfinl}')
 
-    df['hash_index'] = l_hash
-    df               = df.set_index('hash_index', drop=True)
+    df               = df.set_index(pnd.Index(arr_hash, name='hash_index'), drop=True)
     df_clean         = df[~df.index.duplicated(keep='first')]
 
     if not isinstance(df_clean, pnd.DataFrame):
@@ -114,9 +112,63 @@ def _remove_repeated(df : pnd.DataFrame) -> pnd.DataFrame:
     return df_clean
 # ----------------------------------
 # ---------------------------------------------
+def _mix(arr : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Finalizer of SplitMix64, takes and returns array of uint64, scrambles the bits
+    '''
+    arr = (arr ^ (arr >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+    arr = (arr ^ (arr >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+    arr =  arr ^ (arr >> numpy.uint64(31))
+
+    return arr
+# ---------------------------------------------
+def get_fingerprints(df_ft : pnd.DataFrame) -> numpy.ndarray:
+    '''
+    Will return 64 bits hashes for each row in the feature dataframe.
+    These are made from the bytes of the values, after casting them to float64,
+    column by column, i.e. without looping over rows.
+
+    Parameters
+    ----------------
+    df_ft: Dataframe with features
+
+    Returns
+    ----------------
+    Array of uint64 with one hash per row
+    '''
+    arr_hash = numpy.full(len(df_ft), 0xcbf29ce484222325, dtype=numpy.uint64)
+    for name in df_ft.columns:
+        # Adding zero turns -0.0 into 0.0, such that both have the same hash
+        arr_val  = df_ft[name].to_numpy(dtype=numpy.float64) + 0.0
+        arr_bit  = numpy.ascontiguousarray(arr_val).view(numpy.uint64)
+        arr_hash = _mix(arr_hash * numpy.uint64(0x100000001b3) + _mix(arr_bit))
+
+    return arr_hash
+# ---------------------------------------------
+def in_hashes(arr_hash : numpy.ndarray, arr_ref : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Parameters
+    ----------------
+    arr_hash: Array of uint64 hashes, e.g. from `get_fingerprints`
+    arr_ref : Sorted array of uint64 hashes
+
+    Returns
+    ----------------
+    Array of booleans, true for the hashes found in `arr_ref`
+    '''
+    if len(arr_ref) == 0:
+        return numpy.zeros(len(arr_hash), dtype=bool)
+
+    arr_ind = numpy.searchsorted(arr_ref, arr_hash)
+    arr_ind = numpy.minimum(arr_ind, len(arr_ref) - 1)
+
+    return arr_ref[arr_ind] == arr_hash
+# ---------------------------------------------
 def get_hashes(df_ft : pnd.DataFrame, rvalue : str ='set') -> Union[set[str], list[str]]:
     '''
-    Will return hashes for each row in the feature dataframe
+    Will return hashes for each row in the feature dataframe.
+    These are slow to compute, they are only needed for models trained
+    before `get_fingerprints` was introduced.
 
     rvalue (str): Return value, can be a set or a list
     '''
@@ -151,12 +203,12 @@ def index_with_hashes(df):
     '''
     Will:
     - take dataframe with features
-    - calculate hashes and add them as the index column
+    - calculate 64 bits hashes and add them as the index column
     - drop old index column
     '''
 
-    l_hash = get_hashes(df, rvalue='list')
-    ind_hsh= pnd.Index(l_hash)
+    arr_hash = get_fingerprints(df)
+    ind_hsh  = pnd.Index(arr_hash)
 
     df = df.set_index(ind_hsh, drop=True)
 
@@ -0,0 +1,478 @@
+'''
+Module containing ExpressionLibrary class
+'''
+# pylint: disable=no-name-in-module
+
+import os
+import re
+import sys
+import shlex
+import shutil
+import hashlib
+import subprocess
+
+from dataclasses import dataclass
+from pathlib     import Path
+from contextlib  import contextmanager
+
+import ROOT
+from ROOT import RDF # type: ignore
+
+from dmu.logging.log_store import LogStore
+from dmu.rdataframe        import utilities as rut
+
+log = LogStore.add_logger('dmu:rdataframe:expression_library')
+
+_INCLUDES  = [
+    '<cmath>', '<string>', '<vector>', '<utility>', '<typeinfo>',
+    '"RtypesCore.h"', '"TMath.h"', '"ROOT/RVec.hxx"', '"ROOT/RDF/Utils.hxx"',
+    '"Math/Vector3D.h"', '"Math/Vector4D.h"', '"Math/GenVector/VectorUtil.h"']
+# ---------------------------------------------------------------------
+def _get_default_cache_dir() -> Path:
+    '''
+    Returns
+    -------------
+    Per user directory where libraries are cached, under $XDG_CACHE_HOME or ~/.cache
+    '''
+    cache_home = os.environ.get('XDG_CACHE_HOME', '')
+    root       = Path(cache_home) if cache_home else Path.home() / '.cache'
+
+    return root / 'dmu' / 'expression_library'
+# ---------------------------------------------------------------------
+@dataclass
+class _Operation:
+    '''
+    Class representing a Define, Redefine or Filter call
+    '''
+    kind : str
+    name : str
+    expr : str
+# ---------------------------------------------------------------------
+@dataclass
+class _Function:
+    '''
+    Class representing C++ function made from an expression
+
+    columns: Names of columns used by the expression, i.e. arguments of the function
+    types  : C++ types of the arguments, for columns defined in the same library
+             these are aliases of types of functions
+    body   : Expression with columns replaced by names of arguments
+    '''
+    columns : list[str]
+    types   : list[str]
+    body    : str
+# ---------------------------------------------------------------------
+class _CompilerError(RuntimeError):
+    '''
+    Raised when the compiler fails with the expressions, unlike problems with
+    the environment, e.g. missing compiler, this will happen again with the same inputs
+    '''
+# ---------------------------------------------------------------------
+class ExpressionLibrary:
+    '''
+    Class meant to collect `Define`, `Redefine` and `Filter` string expressions
+    and apply them to a dataframe through functions compiled into a shared library.
+
+    The library is keyed by a hash of the expressions and the types of the columns,
+    it is compiled by the first process that needs it and loaded by the rest, i.e.
+    these processes do not need to JIT the expressions. Only the calls to the
+    compiled functions are left to be JITted by ROOT.
+
+    If the library cannot be made, e.g. the expressions use functions only
+    declared in the interpreter, the string expressions are used as they are.
+
+    Usage:
+
+    exl = ExpressionLibrary(rdf=rdf)
+    exl = exl.Define('x', 'a + b')
+    exl = exl.Filter('x > 0', 'positive')
+    rdf = exl.get_rdf()
+    '''
+    _cache_dir : Path                  = _get_default_cache_dir()
+    _d_loaded  : dict[str,str]         = {} # Hash of library -> namespace, libraries already loaded by this process
+    _l_command : list[str] | None      = None
+    _enabled   : bool                  = True
+    # ----------------------
+    def __init__(self, rdf : RDF.RNode, includes : list[str] | None = None):
+        '''
+        Parameters
+        -------------
+        rdf     : ROOT dataframe where expressions will be applied
+        includes: Headers needed by the expressions, on top of the default ones, e.g. ['"Math/Vector4D.h"']
+        '''
+        self._rdf        = rdf
+        self._l_include  = _INCLUDES + ([] if includes is None else includes)
+        self._l_op       : list[_Operation] = []
+    # ----------------------
+    def Define(self, name : str, expr : str) -> 'ExpressionLibrary': # pylint: disable=invalid-name
+        '''
+        Books definition of column, same interface as RDataFrame
+        '''
+        self._l_op.append(_Operation(kind='Define', name=name, expr=expr))
+
+        return self
+    # ----------------------
+    def Redefine(self, name : str, expr : str) -> 'ExpressionLibrary': # pylint: disable=invalid-name
+        '''
+        Books redefinition of column, same interface as RDataFrame
+        '''
+        self._l_op.append(_Operation(kind='Redefine', name=name, expr=expr))
+
+        return self
+    # ----------------------
+    def Filter(self, expr : str, name : str = '') -> 'ExpressionLibrary': # pylint: disable=invalid-name
+        '''
+        Books filter, same interface as RDataFrame
+        '''
+        self._l_op.append(_Operation(kind='Filter', name=name, expr=expr))
+
+        return self
+    # ----------------------
+    def _get_functions(self) -> list[_Function]:
+        '''
+        Returns
+        -------------
+        List of functions, one per operation, with the columns each expression uses
+        '''
+        s_column = { name.c_str() for name in self._rdf.GetColumnNames() }
+        s_column|= {'rdfentry_', 'rdfslot_'}
+        d_type   : dict[str,str] = {}
+
+        l_fun = []
+        for index, op in enumerate(self._l_op):
+            body, l_col = rut.replace_columns(expr=op.expr, columns=s_column)
+            l_type  = [ d_type[col] if col in d_type else self._rdf.GetColumnType(col) for col in l_col ]
+            if any(ctype == '' for ctype in l_type):
+                raise ValueError(f'Cannot find types of columns in: {op.expr}')
+
+            l_fun.append(_Function(columns=l_col, types=l_type, body=body))
+
+            if op.kind == 'Filter':
+                continue
+
+            s_column.add(op.name)
+            d_type[op.name] = f'type_{index}'
+
+        return l_fun
+    # ----------------------
+    def _get_hash(self, l_fun : list[_Function]) -> str:
+        l_line = [ROOT.gROOT.GetVersion()] + self._l_include
+        for op, fun in zip(self._l_op, l_fun):
+            l_line += [op.kind, fun.body] + fun.types
+
+        value = hashlib.sha256('\n'.join(l_line).encode('utf-8')).hexdigest()
+
+        return value[:20]
+    # ----------------------
+    @staticmethod
+    def _get_arguments(fun : _Function, l_type : list[str], declval : bool = False) -> str:
+        if declval:
+            l_arg = [ f'std::declval<const {ctype}&>()' for ctype in l_type ]
+        else:
+            l_arg = [ f'const {ctype} &var{index}' for index, ctype in enumerate(l_type) ]
+
+        if len(l_arg) != len(fun.columns):
+            raise ValueError('Number of types and columns differ')
+
+        return ', '.join(l_arg)
+    # ----------------------
+    @staticmethod
+    def _get_block(body : str) -> str:
+        '''
+        Returns
+        -------------
+        Body of function, expressions with statements, e.g. `auto x = a + b; return x;`
+        are used as they are, like ROOT does with string expressions
+        '''
+        if re.search(r'\breturn\b', body):
+            return f'{{ {body} }}'
+
+        return f'{{ return {body}; }}'
+    # ----------------------
+    def _get_source(self, namespace : str, l_fun : list[_Function]) -> str:
+        '''
+        Returns
+        -------------
+        C++ code with functions, return types are deduced and
+        `get_types` returns their names, needed to make header
+        '''
+        l_line = [ f'#include {include}' for include in self._l_include ]
+        l_line+= [f'namespace {namespace} {{', 'using namespace ROOT::VecOps;']
+        l_name = []
+        for index, (op, fun) in enumerate(zip(self._l_op, l_fun)):
+            if op.kind == 'Filter':
+                l_line.append(f'bool fun_{index}({self._get_arguments(fun, fun.types)}) {self._get_block(fun.body)}')
+                continue
+
+            l_line.append(f'auto fun_{index}({self._get_arguments(fun, fun.types)}) {self._get_block(fun.body)}')
+            l_line.append(f'using type_{index} = decltype(fun_{index}({self._get_arguments(fun, fun.types, declval=True)}));')
+            l_name.append(f'ROOT::Internal::RDF::TypeID2TypeName(typeid(type_{index}))')
+
+        l_line.append(f'std::vector<std::string> get_types() {{ return {{ {", ".join(l_name)} }}; }}')
+        l_line.append('}')
+
+        return '\n'.join(l_line) + '\n'
+    # ----------------------
+    def _get_header(self, namespace : str, l_fun : list[_Function], l_return : list[str]) -> str:
+        '''
+        Parameters
+        -------------
+        l_return: Names of types returned by functions of Define and Redefine operations
+
+        Returns
+        -------------
+        C++ code with declarations of functions, with types spelled out
+        '''
+        it_return = iter(l_return)
+        d_type    : dict[str,str] = {}
+
+        l_line = [ f'#include {include}' for include in self._l_include ]
+        l_line+= [f'namespace {namespace} {{']
+        for index, (op, fun) in enumerate(zip(self._l_op, l_fun)):
+            l_type = [ d_type.get(ctype, ctype) for ctype in fun.types ]
+            if op.kind == 'Filter':
+                l_line.append(f'bool fun_{index}({self._get_arguments(fun, l_type)});')
+                continue
+
+            rtype = next(it_return)
+            if rtype == '':
+                raise RuntimeError(f'Cannot find name of type returned by: {op.expr}')
+
+            d_type[f'type_{index}'] = rtype
+            l_line.append(f'{rtype} fun_{index}({self._get_arguments(fun, l_type)});')
+
+        l_line.append('}')
+
+        return '\n'.join(l_line) + '\n'
+    # ----------------------
+    @classmethod
+    def _get_command(cls) -> list[str]:
+        '''
+        Returns
+        -------------
+        Compiler command, with flags, taken from `root-config`
+        '''
+        if cls._l_command is not None:
+            return cls._l_command
+
+        if shutil.which('root-config') is None:
+            raise RuntimeError('Cannot find root-config')
+
+        cxx    = subprocess.run(['root-config', '--cxx'   ], capture_output=True, text=True, check=True).stdout
+        cflags = subprocess.run(['root-config', '--cflags'], capture_output=True, text=True, check=True).stdout
+
+        l_command = shlex.split(cxx) + shlex.split(cflags) + ['-O2', '-fPIC', '-shared']
+        # Symbols from ROOT are resolved when loading the library
+        if sys.platform == 'darwin':
+            l_command += ['-undefined', 'dynamic_lookup']
+
+        cls._l_command = l_command
+
+        return l_command
+    # ----------------------
+    def _build(self, tmp_dir : Path, namespace : str, l_fun : list[_Function]) -> str:
+        '''
+        Compiles library in `tmp_dir`, loads it and writes header
+
+        Returns
+        -------------
+        Header with declarations of compiled functions
+        '''
+        src_path = tmp_dir / 'expressions.cxx'
+        lib_path = tmp_dir / 'libexpressions.so'
+        src_path.write_text(self._get_source(namespace=namespace, l_fun=l_fun), encoding='utf-8')
+
+        command = self._get_command() + ['-o', str(lib_path), str(src_path)]
+        result  = subprocess.run(command, capture_output=True, text=True, check=False)
+        if result.returncode != 0:
+            (tmp_dir / 'compiler.log').write_text(result.stderr, encoding='utf-8')
+            raise _CompilerError('Cannot compile expressions, see compiler.log')
+
+        self._load_library(lib_path=lib_path)
+        if not ROOT.gInterpreter.Declare(f'namespace {namespace} {{ std::vector<std::string> get_types(); }}'):
+            raise RuntimeError(f'Cannot declare types function of: {lib_path}')
+
+        l_return = [ str(name) for name in getattr(ROOT, namespace).get_types() ]
+        header   = self._get_header(namespace=namespace, l_fun=l_fun, l_return=l_return)
+        (tmp_dir / 'expressions.h').write_text(header, encoding='utf-8')
+
+        return header
+    # ----------------------
+    def _compile(self, hsh : str, namespace : str, l_fun : list[_Function]) -> str:
+        '''
+        Builds library in temporary directory and moves the directory to the cache.
+        If the compiler fails, the directory is moved with a `failed` file, such that other
+        processes do not retry. Other failures are not cached.
+
+        Returns
+        -------------
+        Header with declarations of compiled functions
+        '''
+        lib_dir = ExpressionLibrary._cache_dir / hsh
+        tmp_dir = ExpressionLibrary._cache_dir / f'.{hsh}.{os.getpid()}'
+        # Only this user can write, the library will be loaded by other processes
+        tmp_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+
+        log.info(f'Compiling {len(l_fun)} expressions into: {lib_dir}')
+        try:
+            header = self._build(tmp_dir=tmp_dir, namespace=namespace, l_fun=l_fun)
+        except _CompilerError as exc:
+            (tmp_dir / 'failed').write_text(str(exc), encoding='utf-8')
+            self._move(source=tmp_dir, target=lib_dir)
+            raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self._move(source=tmp_dir, target=lib_dir)
+
+        return header
+    # ----------------------
+    @staticmethod
+    def _move(source : Path, target : Path) -> None:
+        '''
+        Moves directory in one step, if other process already made it, drop this one
+        '''
+        try:
+            os.rename(source, target)
+        except OSError:
+            log.debug(f'Library already made by other process: {target}')
+            shutil.rmtree(source, ignore_errors=True)
+    # ----------------------
+    @staticmethod
+    def _check_owner(lib_path : Path) -> None:
+        '''
+        Raises if the library or its directory belong to another user, or if the directory
+        can be written by other users, i.e. the library could have been replaced
+        '''
+        uid = os.getuid()
+        for path in [lib_path.parent, lib_path]:
+            if path.stat().st_uid != uid:
+                raise RuntimeError(f'Not loading, owned by other user: {path}')
+
+        if lib_path.parent.stat().st_mode & 0o022:
+            raise RuntimeError(f'Not loading, directory writable by other users: {lib_path.parent}')
+    # ----------------------
+    @classmethod
+    def _load_library(cls, lib_path : Path) -> None:
+        cls._check_owner(lib_path=lib_path)
+        if ROOT.gSystem.Load(str(lib_path)) < 0:
+            raise RuntimeError(f'Cannot load: {lib_path}')
+    # ----------------------
+    def _load(self, hsh : str, namespace : str, l_fun : list[_Function]) -> None:
+        '''
+        Loads library and declares its functions, compiling it if not found in cache
+        '''
+        if hsh in ExpressionLibrary._d_loaded:
+            log.debug(f'Library already loaded: {hsh}')
+            return
+
+        lib_dir = ExpressionLibrary._cache_dir / hsh
+        if (lib_dir / 'failed').exists():
+            raise RuntimeError(f'Library failed to compile before, see: {lib_dir}/failed')
+
+        hdr_path = lib_dir / 'expressions.h'
+        if hdr_path.exists():
+            log.debug(f'Loading library from: {lib_dir}')
+            self._load_library(lib_path=lib_dir / 'libexpressions.so')
+            header = hdr_path.read_text(encoding='utf-8')
+        else:
+            header = self._compile(hsh=hsh, namespace=namespace, l_fun=l_fun)
+
+        if not ROOT.gInterpreter.Declare(header):
+            raise RuntimeError(f'Cannot declare functions of library: {lib_dir}')
+
+        ExpressionLibrary._d_loaded[hsh] = namespace
+    # ----------------------
+    def _get_expressions(self) -> list[str]:
+        '''
+        Returns
+        -------------
+        List of expressions calling the compiled functions, one per operation
+        '''
+        l_fun     = self._get_functions()
+        hsh       = self._get_hash(l_fun=l_fun)
+        namespace = f'dmu_expr_{hsh}'
+
+        self._load(hsh=hsh, namespace=namespace, l_fun=l_fun)
+
+        return [ f'{namespace}::fun_{index}({", ".join(fun.columns)})' for index, fun in enumerate(l_fun) ]
+    # ----------------------
+    def _apply(self, l_expr : list[str]) -> RDF.RNode:
+        '''
+        Books operations in dataframe, this is where invalid expressions fail,
+        the calls are JITted by ROOT
+
+        Raises
+        -------------
+        ValueError naming the operation that could not be applied
+        '''
+        rdf = self._rdf
+        for op, expr in zip(self._l_op, l_expr):
+            try:
+                if op.kind == 'Filter':
+                    rdf = rdf.Filter(expr, op.name)
+                else:
+                    rdf = getattr(rdf, op.kind)(op.name, expr)
+            except Exception as exc:
+                raise ValueError(f'Cannot apply {op.kind} {op.name} = {op.expr}') from exc
+
+        return rdf
+    # ----------------------
+    def get_rdf(self) -> RDF.RNode:
+        '''
+        Returns
+        -------------
+        Dataframe with operations applied
+        '''
+        if len(self._l_op) == 0:
+            return self._rdf
+
+        if not ExpressionLibrary._enabled:
+            log.debug('Library disabled, using string expressions')
+            return self._apply(l_expr=[ op.expr for op in self._l_op ])
+
+        try:
+            l_expr = self._get_expressions()
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            log.warning(f'Using string expressions, cannot use library: {exc}')
+            l_expr = [ op.expr for op in self._l_op ]
+
+        return self._apply(l_expr=l_expr)
+    # ----------------------
+    @classmethod
+    def cache_dir(cls, path : Path):
+        '''
+        Context manager used to set directory where libraries are cached
+
+        Parameters
+        -------------
+        path: Path to directory, by default $XDG_CACHE_HOME/dmu/expression_library, with ~/.cache if not set
+        '''
+        old_val = cls._cache_dir
+        @contextmanager
+        def _context():
+            cls._cache_dir = Path(path)
+            try:
+                yield
+            finally:
+                cls._cache_dir = old_val
+
+        return _context()
+    # ----------------------
+    @classmethod
+    def enabled(cls, value : bool):
+        '''
+        Context manager used to turn on (default) or off the use of libraries
+        '''
+        old_val = cls._enabled
+        @contextmanager
+        def _context():
+            cls._enabled = value
+            try:
+                yield
+            finally:
+                cls._enabled = old_val
+
+        return _context()
+# ---------------------------------------------------------------------
@@ -11,7 +11,7 @@ import pandas  as pnd
 import awkward as ak
 import numpy
 
-from ROOT import RDataFrame, RDF, Numba # type: ignore
+from ROOT import RDataFrame, RDF, Numba, GetThreadPoolSize # type: ignore
 
 from dmu.logging.log_store import LogStore
 
@@ -24,6 +24,9 @@ class Data:
     '''
     l_good_type = [int, numpy.bool_, numpy.int32, numpy.uint32, numpy.int64, numpy.uint64, numpy.float32, numpy.float64]
     d_cast_type = {'bool': numpy.int32}
+    # Identifiers, possibly with dots, e.g. friend tree columns like `hop.hop_mass`
+    # not preceded by `::` or `.`, to skip namespaces and members
+    token_rgx   = re.compile(r'(?<![\w:.])[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*')
 # ---------------------------------------------------------------------
 def columns_from_rdf(rdf : RDF.RNode) -> list[str]:
     '''
@@ -100,7 +103,14 @@ def add_column_with_numba(
 
     The `identifier` argument is a string need in order to avoid collisions
     when using Numba to define a function to get the value from.
+
+    The values are picked with `rdfentry_`, which is not the entry number with
+    implicit multithreading, thus this function raises ValueError when it is enabled.
     '''
+    nthreads = GetThreadPoolSize()
+    if nthreads > 1:
+        raise ValueError(f'Cannot add column {name} with numba and multithreading, using {nthreads} threads')
+
     identifier=f'fun_{identifier}'
 
     @Numba.Declare(['int'], 'float', name=identifier)
@@ -188,3 +198,41 @@ def rdf_to_df(
 
     return df
 # ---------------------------------------------------------------------
+def replace_columns(
+    expr    : str,
+    columns : set[str],
+    prefix  : str = 'var') -> tuple[str, list[str]]:
+    '''
+    Parameters
+    ---------------
+    expr   : Expression, as used in `Define` or `Filter`
+    columns: Names of columns in dataframe
+    prefix : Prefix of names used to replace columns
+
+    Returns
+    ---------------
+    Tuple with:
+
+    - Expression where each column was replaced by {prefix}{index}, e.g. var0, var1...
+    - List of columns used in expression, {prefix}{index} replaced the column at this index
+    '''
+    l_col = []
+    def _replace(mtch : re.Match) -> str:
+        token  = mtch.group(0)
+        column = token
+        # E.g. `vec.size`, where `vec` is a column
+        while column not in columns and '.' in column:
+            column = column.rsplit('.', 1)[0]
+
+        if column not in columns:
+            return token
+
+        if column not in l_col:
+            l_col.append(column)
+
+        return f'{prefix}{l_col.index(column)}' + token[len(column):]
+
+    body = Data.token_rgx.sub(_replace, expr)
+
+    return body, l_col
+# ---------------------------------------------------------------------
@@ -1,3 +1,5 @@
-from .cache import Cache
+from .cache         import Cache
+from .blob_store    import BlobStore
+from .cache_metrics import CacheMetrics
 
-__all__  = ['Cache']
+__all__  = ['Cache', 'BlobStore', 'CacheMetrics']
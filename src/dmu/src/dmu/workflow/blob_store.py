@@ -0,0 +1,321 @@
+'''
+Module containing BlobStore class
+'''
+import os
+import time
+import stat
+import errno
+import fcntl
+import shutil
+import hashlib
+
+from pathlib    import Path
+from contextlib import contextmanager
+from typing     import Iterator
+
+from dmu.logging.log_store import LogStore
+
+log=LogStore.add_logger('dmu:workflow:blob_store')
+# ---------------------------
+class BlobStore:
+    '''
+    Class meant to store files by content, used by `Cache` to:
+
+    - Move outputs into the store through hard links, instead of copying them
+    - Deduplicate files with the same content, across hashed directories
+    - Write hashed directories atomically and under file locks, such that
+      several processes can cache the same outputs concurrently
+
+    The store lives in `{root}/.store` and has:
+
+    blobs: Files named after the SHA256 of their content, e.g. `blobs/ab/abcd...`
+           Hashed directories hold hard links to these files, thus the number of links
+           of a blob, minus one, is the number of times it is used
+    locks: Lock files, one per hashed directory, plus `store.lock`, used to stop
+           blobs from being deleted while directories are being cached
+    '''
+    _chunk_size = 1024 * 1024
+    # ---------------------------
+    def __init__(self, root : Path):
+        '''
+        Parameters
+        ---------------
+        root: Directory used as cache root, the store will be placed in `root/.store`
+        '''
+        self._root      = root
+        self._store_dir = root / '.store'
+        self._blob_dir  = self._store_dir / 'blobs'
+        self._lock_dir  = self._store_dir / 'locks'
+
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_dir.mkdir(parents=True, exist_ok=True)
+    # ---------------------------
+    @contextmanager
+    def _lock(self, path : Path, shared : bool = False, blocking : bool = True) -> Iterator[bool]:
+        '''
+        Parameters
+        ---------------
+        path    : Path to lock file
+        shared  : If True, will take a shared lock, otherwise exclusive
+        blocking: If False, will not wait for lock
+
+        Returns
+        ---------------
+        Context manager yielding True if lock was acquired
+        '''
+        kind = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            kind |= fcntl.LOCK_NB
+
+        with open(path, 'a', encoding='utf-8') as ofile:
+            try:
+                fcntl.flock(ofile, kind)
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(ofile, fcntl.LOCK_UN)
+    # ---------------------------
+    def _get_lock_path(self, hash_dir : Path) -> Path:
+        rel_path = hash_dir.resolve().relative_to(self._root.resolve())
+        name     = str(rel_path).replace(os.sep, '%')
+
+        return self._lock_dir / f'{name}.lock'
+    # ---------------------------
+    def lock(self, hash_dir : Path, blocking : bool = True):
+        '''
+        Parameters
+        ---------------
+        hash_dir: Hashed directory, i.e. out_path/.cache/{hash}
+        blocking: If False, will not wait for lock
+
+        Returns
+        ---------------
+        Context manager with exclusive lock for hashed directory, yields True if acquired
+        '''
+        return self._lock(path=self._get_lock_path(hash_dir=hash_dir), blocking=blocking)
+    # ---------------------------
+    def _get_digest(self, path : Path) -> str:
+        hsh = hashlib.sha256()
+        with open(path, 'rb') as ifile:
+            for chunk in iter(lambda: ifile.read(self._chunk_size), b''):
+                hsh.update(chunk)
+
+        return hsh.hexdigest()
+    # ---------------------------
+    def _ingest(self, source : Path) -> tuple[Path,int]:
+        '''
+        Parameters
+        ---------------
+        source: Path to file to be added to store
+
+        Returns
+        ---------------
+        Tuple with path to blob with same content as source and number of bytes added to store
+        '''
+        digest = self._get_digest(path=source)
+        blob   = self._blob_dir / digest[:2] / digest
+        if blob.exists():
+            log.debug(f'Found blob for: {source}')
+            return blob, 0
+
+        blob.parent.mkdir(exist_ok=True)
+        tmp_path = blob.parent / f'.{digest}.{os.getpid()}'
+        try:
+            os.link(source, tmp_path)
+        except OSError as exc:
+            if exc.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                raise
+
+            log.debug(f'Cannot hard link, copying: {source}')
+            shutil.copy2(source, tmp_path)
+
+        # Blobs are shared, they should not be modified in place
+        mode = os.stat(tmp_path).st_mode
+        os.chmod(tmp_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        os.replace(tmp_path, blob)
+
+        return blob, blob.stat().st_size
+    # ---------------------------
+    def _add_tree(self, source : Path, target : Path, skip : Path) -> int:
+        '''
+        Parameters
+        ---------------
+        source: File or directory to be added
+        target: Path where it will be placed, as hard links to blobs
+        skip  : Path that will not be added
+
+        Returns
+        ---------------
+        Number of bytes added to store
+        '''
+        if source == skip:
+            return 0
+
+        if source.is_dir():
+            target.mkdir(exist_ok=True)
+
+            return sum(self._add_tree(source=path, target=target / path.name, skip=skip) for path in source.iterdir())
+
+        blob, size = self._ingest(source=source)
+        os.link(blob, target)
+
+        return size
+    # ---------------------------
+    def add(self, source : Path, hash_dir : Path) -> int:
+        '''
+        Stores contents of directory in hashed directory, if the latter does not exist already.
+        The directory is built in a temporary directory, which is renamed at the end.
+
+        Parameters
+        ---------------
+        source  : Directory with outputs, out_path
+        hash_dir: Hashed directory, i.e. out_path/.cache/{hash}
+
+        Returns
+        ---------------
+        Number of bytes added to store, i.e. not deduplicated
+        '''
+        if hash_dir.is_dir():
+            log.debug(f'Hashed directory already made: {hash_dir}')
+            return 0
+
+        tmp_dir = hash_dir.parent / f'.{hash_dir.name}.{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        size = 0
+        try:
+            with self._lock(path=self._store_dir / 'store.lock', shared=True):
+                for path in source.iterdir():
+                    size += self._add_tree(source=path, target=tmp_dir / path.name, skip=hash_dir.parent)
+
+            os.rename(tmp_dir, hash_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return size
+    # ---------------------------
+    @staticmethod
+    def touch(hash_dir : Path) -> None:
+        '''
+        Updates modification time of hashed directory, used to find least recently used outputs
+        '''
+        os.utime(hash_dir)
+    # ---------------------------
+    def get_hash_dirs(self) -> list[Path]:
+        '''
+        Returns
+        ---------------
+        List of hashed directories under the root directory
+        '''
+        l_path = []
+        for cache_dir in self._root.rglob('.cache'):
+            if not cache_dir.is_dir() or self._store_dir in cache_dir.parents:
+                continue
+
+            l_path += [ path for path in cache_dir.iterdir() if path.is_dir() and not path.name.startswith('.') ]
+
+        return l_path
+    # ---------------------------
+    def _get_blobs(self) -> list[Path]:
+        return [ path for path in self._blob_dir.glob('*/*') if not path.name.startswith('.') ]
+    # ---------------------------
+    def summary(self) -> dict[str,int]:
+        '''
+        Returns
+        ---------------
+        Dictionary with number of hashed directories and blobs, as well as:
+
+        size   : Space in bytes used by blobs
+        logical: Space in bytes that would be used without deduplication
+        unused : Number of blobs not used by any hashed directory
+        '''
+        d_sum = {'directories' : len(self.get_hash_dirs()), 'blobs' : 0, 'size' : 0, 'logical' : 0, 'unused' : 0}
+        for blob in self._get_blobs():
+            info = blob.stat()
+            nuse = info.st_nlink - 1
+
+            d_sum['blobs'  ] += 1
+            d_sum['size'   ] += info.st_size
+            d_sum['logical'] += info.st_size * nuse
+            d_sum['unused' ] += nuse == 0
+
+        return d_sum
+    # ---------------------------
+    def _get_unique_size(self, hash_dir : Path) -> int:
+        '''
+        Returns
+        ---------------
+        Size in bytes that would be freed by removing hashed directory
+        '''
+        size = 0
+        for path in hash_dir.rglob('*'):
+            if not path.is_file() or path.is_symlink():
+                continue
+
+            info = path.stat()
+            if info.st_nlink <= 2:
+                size += info.st_size
+
+        return size
+    # ---------------------------
+    def _remove_unused_blobs(self) -> int:
+        '''
+        Returns
+        ---------------
+        Number of bytes freed
+        '''
+        size = 0
+        with self._lock(path=self._store_dir / 'store.lock'):
+            for blob in self._get_blobs():
+                info = blob.stat()
+                if info.st_nlink > 1:
+                    continue
+
+                size += info.st_size
+                blob.unlink()
+
+        return size
+    # ---------------------------
+    def prune(self, max_size : int | None = None, max_age : float | None = None) -> int:
+        '''
+        Removes hashed directories, least recently used first, and then unused blobs
+
+        Parameters
+        ---------------
+        max_size: Size in bytes, directories will be removed until blobs use less than this
+        max_age : Time in seconds, directories not used since longer than this will be removed
+
+        Returns
+        ---------------
+        Number of hashed directories removed
+        '''
+        l_hash_dir = sorted(self.get_hash_dirs(), key=lambda path : path.stat().st_mtime)
+        size       = self.summary()['size']
+        now        = time.time()
+        nremoved   = 0
+        for hash_dir in l_hash_dir:
+            too_old = max_age  is not None and now - hash_dir.stat().st_mtime > max_age
+            too_big = max_size is not None and size > max_size
+            if not too_old and not too_big:
+                continue
+
+            with self.lock(hash_dir=hash_dir, blocking=False) as locked:
+                if not locked:
+                    log.warning(f'Directory in use, not removing: {hash_dir}')
+                    continue
+
+                log.debug(f'Removing: {hash_dir}')
+                size -= self._get_unique_size(hash_dir=hash_dir)
+                shutil.rmtree(hash_dir)
+                nremoved += 1
+
+        size = self._remove_unused_blobs()
+        log.info(f'Removed {nremoved} directories and freed {size / 1024 ** 2:.1f} MB')
+
+        return nremoved
+# ---------------------------
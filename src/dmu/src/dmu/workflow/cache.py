@@ -3,6 +3,7 @@ This module contains
 '''
 import os
 import sys
+import time
 import shutil
 
 from pathlib    import Path
@@ -10,6 +11,8 @@ from contextlib import contextmanager
 
 from dmu.generic           import hashing
 from dmu.logging.log_store import LogStore
+from dmu.workflow.blob_store    import BlobStore
+from dmu.workflow.cache_metrics import CacheMetrics
 
 log=LogStore.add_logger('dmu:workflow:cache')
 # ---------------------------
@@ -27,6 +30,21 @@ class Cache:
     hash_dir : Subdirectory of out_dir, ${out_dir}/.cache/{hash}
                Where {hash} is a 10 alphanumeric representing the has of the inputs
 
+    # On storage
+
+    The files in the hashed directories are hard links to files in a content addressed
+    store, `${cache_root}/.store`, see `BlobStore`. Thus:
+
+    - Outputs are moved into the store, not copied
+    - Identical files, e.g. in different hashed directories, are stored once
+    - Hashed directories are made atomically and under a lock, such that processes
+      caching the same outputs do not interfere
+
+    # On metrics
+
+    Hits, misses, time spent and bytes written are recorded for every class and hash
+    through `CacheMetrics`. Misses also record which inputs changed.
+
     # On skipping caching
 
     This is controlled by `_l_skip_class` which is a list of class names:
@@ -34,9 +52,23 @@ class Cache:
     - These classes will have the caching turned off
     - If the list is empty, caching runs for everything
     - If the list is None, caching is turned off for everything
+
+    # On code hashing
+
+    By default the hash of the inputs includes the hash of the file where the derived class
+    is defined. Derived classes can change this with the class attributes:
+
+    _code_hashing : If `ast`, the hash will be made from the syntax trees of the class and the functions
+                    and classes it uses, within its top level package and those in `_l_code_package`.
+                    Changes in comments, docstrings or formatting will not invalidate the hash
+    _cache_version: If not None, this value is used instead of the code, i.e. the hash is invalidated
+                    only when it is changed
     '''
     _cache_root     : Path     | None = None
     _l_skip_class   : list[str]| None = []
+    _code_hashing   : str             = 'file'
+    _cache_version  : str | int| None = None
+    _l_code_package : list[str]       = []
     # ---------------------------
     def __init__(self, out_path : Path, **kwargs):
         '''
@@ -67,15 +99,32 @@ class Cache:
         self._out_path.mkdir(parents=True, exist_ok=True)
 
         self._hsh       = hashing.hash_object(kwargs)
+        self._d_inp_hsh = { key : hashing.hash_object([val]) for key, val in kwargs.items() }
         self._cache_dir = self._get_dir(kind='cache')
         self._hash_dir  : Path
+        self._miss_time : float | None = None
+        self._miss_kind : str          = 'miss'
     # ---------------------------
     def _get_code_hash(self) -> str:
         '''
         If `MyTool` inherits from `Cache`. `mytool.py` git commit hash
-        should be returned
+        should be returned, unless the class sets `_cache_version` or `_code_hashing`
         '''
         cls   = self.__class__
+        if cls._cache_version is not None:
+            log.debug(f'Using version {cls._cache_version} for {cls.__name__}, instead of code')
+            return hashing.hash_object([cls.__name__, cls._cache_version])
+
+        if cls._code_hashing == 'ast':
+            l_package = [cls.__module__.split('.')[0]] + cls._l_code_package
+            val       = hashing.hash_code(obj=cls, packages=l_package)
+            log.debug(f'Using hash of syntax trees for {cls.__name__}, in {l_package} = {val}')
+
+            return val
+
+        if cls._code_hashing != 'file':
+            raise ValueError(f'Invalid code hashing: {cls._code_hashing}')
+
         mod   = sys.modules.get(cls.__module__)
         if mod is None:
             raise ValueError(f'Module not found: {cls.__module__}')
@@ -120,25 +169,84 @@ class Cache:
         It will copy all the outputs of the processing
         to a hashed directory
         '''
-        self._hash_dir  = self._get_dir(kind= 'hash')
+        self._hash_dir  = self._get_dir(kind= 'hash', make=False)
         log.info(f'Caching outputs to: {self._hash_dir}')
 
-        for source in self._out_path.glob('*'):
-            if source == self._cache_dir:
-                continue
+        compute_time = None if self._miss_time is None else time.time() - self._miss_time
+        size         = sum(path.stat().st_size for path in self._out_path.rglob('*') if path.is_file() and self._cache_dir not in path.parents)
 
-            log.debug(str(source))
-            log.debug('-->')
-            log.debug(self._hash_dir)
-            log.debug('')
+        store = self._get_store()
+        with store.lock(hash_dir=self._hash_dir):
+            start     = time.time()
+            new_size  = store.add(source=self._out_path, hash_dir=self._hash_dir)
+            store_time= time.time() - start
 
-            if source.is_dir():
-                shutil.copytree(source, self._hash_dir / source.name, dirs_exist_ok=True)
-            else:
-                shutil.copy2(source, self._hash_dir)
+            self._delete_from_output()
+            self._copy_from_hashdir()
+            link_time = time.time() - start - store_time
+
+        metrics = self._get_metrics()
+        changed = metrics.get_changed(
+            kind    =self.__class__.__name__,
+            out_path=self._get_relative_path(),
+            hsh     =self._hsh,
+            inputs  =self._d_inp_hsh)
+
+        if changed is not None:
+            log.info(f'Recomputed outputs, changed inputs: {changed}')
+
+        self._record(
+            status      = self._miss_kind,
+            changed     = changed,
+            compute_time= compute_time,
+            store_time  = store_time,
+            link_time   = link_time,
+            size        = size,
+            new_size    = new_size)
+    # ---------------------------
+    def _get_relative_path(self) -> str:
+        if Cache._cache_root is None:
+            raise ValueError('Caching directory not set')
 
-        self._delete_from_output()
-        self._copy_from_hashdir()
+        return str(self._out_path.relative_to(Cache._cache_root))
+    # ---------------------------
+    def _get_metrics(self) -> CacheMetrics:
+        '''
+        Returns
+        ---------------
+        Object used to record metrics
+        '''
+        if Cache._cache_root is None:
+            raise ValueError('Caching directory not set')
+
+        return CacheMetrics(root=Cache._cache_root)
+    # ---------------------------
+    def _record(self, status : str, **kwargs) -> None:
+        '''
+        Parameters
+        ---------------
+        status: hit, miss or skip
+        kwargs: Other fields of record, see CacheMetrics
+        '''
+        metrics = self._get_metrics()
+        metrics.record(
+            kind    = self.__class__.__name__,
+            out_path= self._get_relative_path(),
+            hash    = self._hsh,
+            status  = status,
+            inputs  = self._d_inp_hsh,
+            **kwargs)
+    # ---------------------------
+    def _get_store(self) -> BlobStore:
+        '''
+        Returns
+        ---------------
+        Store where the cached files are kept
+        '''
+        if Cache._cache_root is None:
+            raise ValueError('Caching directory not set')
+
+        return BlobStore(root=Cache._cache_root)
     # ---------------------------
     def _delete_from_output(self) -> None:
         '''
@@ -149,11 +257,12 @@ class Cache:
                 log.debug(f'Skipping cache dir: {self._cache_dir}')
                 continue
 
+            # Other process working on the same outputs could have deleted them already
             log.debug(f'Deleting {path}')
             if path.is_dir() and not path.is_symlink():
-                shutil.rmtree(path)
+                shutil.rmtree(path, ignore_errors=True)
             else:
-                path.unlink()
+                path.unlink(missing_ok=True)
     # ---------------------------
     def _copy_from_hashdir(self) -> None:
         '''
@@ -212,19 +321,36 @@ class Cache:
             # new outputs
             self._delete_from_output()
             log.info('Not picking already cached outputs, remaking them')
+            self._miss_kind = 'skip'
+            self._miss_time = time.time()
             return False
 
         hash_dir = self._get_dir(kind='hash', make=False)
         if not os.path.isdir(hash_dir):
             log.info(f'Hash directory {hash_dir} not found, not caching')
             self._delete_from_output()
+            self._miss_time = time.time()
             return False
 
         self._hash_dir = hash_dir
         log.debug(f'Data found in hash directory: {self._hash_dir}')
 
-        self._delete_from_output()
-        self._copy_from_hashdir()
+        store = self._get_store()
+        with store.lock(hash_dir=self._hash_dir):
+            # Could have been pruned while waiting for lock
+            if not os.path.isdir(hash_dir):
+                log.info(f'Hash directory {hash_dir} removed, not caching')
+                self._delete_from_output()
+                self._miss_time = time.time()
+                return False
+
+            start = time.time()
+            store.touch(hash_dir=hash_dir)
+            self._delete_from_output()
+            self._copy_from_hashdir()
+            link_time = time.time() - start
+
+        self._record(status='hit', link_time=link_time)
 
         return True
     # ---------------------------
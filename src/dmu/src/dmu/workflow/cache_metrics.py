@@ -0,0 +1,163 @@
+'''
+Module containing CacheMetrics class
+'''
+import os
+import json
+import time
+import fcntl
+import socket
+
+from pathlib import Path
+from typing  import Any
+
+import pandas as pnd
+
+from dmu.logging.log_store import LogStore
+
+log=LogStore.add_logger('dmu:workflow:cache_metrics')
+# ---------------------------
+class CacheMetrics:
+    '''
+    Class meant to record what `Cache` does, one JSON line per event, in `{root}/.store/metrics.jsonl`.
+    Each record has:
+
+    time        : Unix time of event
+    host, pid   : Where it happened
+    kind        : Name of class inheriting from Cache
+    out_path    : Output path, relative to cache root
+    hash        : Hash of inputs
+    status      : hit, miss or skip, the latter for outputs remade because caching was turned off
+    inputs      : Dictionary between names of arguments used for hashing and hashes of their values
+    changed     : For misses, names of arguments that differ with respect to the closest
+                  previously cached hash for the same class and output path, None if there was none
+    compute_time: Seconds between finding a miss and caching the outputs
+    store_time  : Seconds spent moving outputs into the store
+    link_time   : Seconds spent linking outputs from hashed directory
+    size        : Bytes in outputs
+    new_size    : Bytes actually added to the store, i.e. not found already
+    '''
+    # ---------------------------
+    def __init__(self, root : Path):
+        '''
+        Parameters
+        ---------------
+        root: Directory used as cache root
+        '''
+        self._root = root
+        self._path = root / '.store' / 'metrics.jsonl'
+    # ---------------------------
+    def record(self, **kwargs : Any) -> None:
+        '''
+        Appends record to metrics file, failures are only logged
+
+        Parameters
+        ---------------
+        kwargs: Fields of record
+        '''
+        data = {'time' : time.time(), 'host' : socket.gethostname(), 'pid' : os.getpid()}
+        data.update(kwargs)
+        line = json.dumps(data, default=str) + '\n'
+
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._path, 'a', encoding='utf-8') as ofile:
+                fcntl.flock(ofile, fcntl.LOCK_EX)
+                ofile.write(line)
+                fcntl.flock(ofile, fcntl.LOCK_UN)
+        except OSError as exc:
+            log.warning(f'Cannot save metrics to {self._path}: {exc}')
+    # ---------------------------
+    def get_records(self) -> list[dict[str,Any]]:
+        '''
+        Returns
+        ---------------
+        List of records, oldest first
+        '''
+        if not self._path.exists():
+            return []
+
+        l_record = []
+        with open(self._path, encoding='utf-8') as ifile:
+            for line in ifile:
+                try:
+                    l_record.append(json.loads(line))
+                except json.JSONDecodeError:
+                    log.debug(f'Skipping malformed line: {line}')
+
+        return l_record
+    # ---------------------------
+    def get_changed(
+        self,
+        kind     : str,
+        out_path : str,
+        hsh      : str,
+        inputs   : dict[str,str]) -> list[str] | None:
+        '''
+        Parameters
+        ---------------
+        kind    : Name of class
+        out_path: Output path, relative to cache root
+        hsh     : Hash of inputs
+        inputs  : Dictionary between names of arguments and hashes of their values
+
+        Returns
+        ---------------
+        Names of arguments that changed with respect to the closest hash used before
+        for the same class and output path. None if no other hash was found
+        '''
+        d_previous : dict[str,dict[str,str]] = {}
+        for record in self.get_records():
+            if record.get('kind') != kind or record.get('out_path') != out_path:
+                continue
+
+            if record.get('hash') == hsh or not record.get('inputs'):
+                continue
+
+            d_previous[record['hash']] = record['inputs']
+
+        l_changed = None
+        for previous in d_previous.values():
+            s_key   = set(previous) | set(inputs)
+            changed = sorted(key for key in s_key if previous.get(key) != inputs.get(key))
+            if l_changed is None or len(changed) < len(l_changed):
+                l_changed = changed
+
+        return l_changed
+    # ---------------------------
+    def get_report(self) -> pnd.DataFrame:
+        '''
+        Returns
+        ---------------
+        Pandas dataframe with one row per class and:
+
+        hits, misses, rate   : Number of hits and misses and hit rate
+        compute, store, link : Time in seconds spent computing, storing and linking outputs
+        size, new_size       : Bytes in outputs, and bytes added to store
+        '''
+        l_column = ['kind', 'hits', 'misses', 'rate', 'compute', 'store', 'link', 'size', 'new_size']
+        l_record = self.get_records()
+        if not l_record:
+            return pnd.DataFrame(columns=l_column)
+
+        df = pnd.DataFrame(l_record)
+        for column in ['compute_time', 'store_time', 'link_time', 'size', 'new_size']:
+            if column not in df:
+                df[column] = 0
+
+        df['hits'  ] = df['status'] == 'hit'
+        df['misses'] = df['status'] == 'miss'
+
+        df = df.groupby('kind').agg(
+            hits    =('hits'        , 'sum'),
+            misses  =('misses'      , 'sum'),
+            compute =('compute_time', 'sum'),
+            store   =('store_time'  , 'sum'),
+            link    =('link_time'   , 'sum'),
+            size    =('size'        , 'sum'),
+            new_size=('new_size'    , 'sum'))
+
+        df['rate'] = df['hits'] / (df['hits'] + df['misses']).replace(0, pnd.NA)
+        df         = df.reset_index()
+
+        return df[l_column]
+# ---------------------------
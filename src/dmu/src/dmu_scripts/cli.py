@@ -3,8 +3,9 @@ Entry point for CLI utilities of DMU project
 '''
 import xml.etree.ElementTree as ET
 import typer
-from pathlib import Path
-from dmu     import LogStore
+from pathlib      import Path
+from dmu          import LogStore
+from dmu.workflow import BlobStore, CacheMetrics
 
 app = typer.Typer(help=__doc__)
 log = LogStore.add_logger('dmu:cli')
@@ -63,6 +64,67 @@ def check_jobs_status(
         log.info('All tests passed')
 # ----------------------
 @app.command()
+def inspect_cache(
+        root : Path = typer.Option(..., '--root', '-r', help='Root directory used for caching')):
+    '''
+    Prints summary of outputs cached by classes inheriting from dmu.workflow.Cache
+    '''
+    if not root.is_dir():
+        log.error(f'Cannot find: {root}')
+        raise typer.Exit(code=2)
+
+    store = BlobStore(root=root)
+    d_sum = store.summary()
+
+    log.info(f'{"Directories:":<20}{d_sum["directories"]:<20}')
+    log.info(f'{"Blobs:":<20}{d_sum["blobs"]:<20}')
+    log.info(f'{"Unused blobs:":<20}{d_sum["unused"]:<20}')
+    log.info(f'{"Size [MB]:":<20}{d_sum["size"]    / 1024 ** 2:<20.1f}')
+    log.info(f'{"Logical [MB]:":<20}{d_sum["logical"] / 1024 ** 2:<20.1f}')
+# ----------------------
+@app.command()
+def prune_cache(
+        root     : Path         = typer.Option(...,  '--root'    , '-r', help='Root directory used for caching'),
+        max_size : float | None = typer.Option(None, '--max_size', '-s', help='Maximum size in GB, least recently used outputs are removed first'),
+        max_age  : float | None = typer.Option(None, '--max_age' , '-a', help='Outputs not used in this number of days are removed')):
+    '''
+    Removes outputs cached by classes inheriting from dmu.workflow.Cache
+    and files in the store not used anymore
+    '''
+    if not root.is_dir():
+        log.error(f'Cannot find: {root}')
+        raise typer.Exit(code=2)
+
+    store = BlobStore(root=root)
+    store.prune(
+        max_size = None if max_size is None else int(max_size * 1024 ** 3),
+        max_age  = None if max_age  is None else max_age * 24 * 3600)
+# ----------------------
+@app.command()
+def report_cache(
+        root  : Path = typer.Option(..., '--root' , '-r', help='Root directory used for caching'),
+        nmiss : int  = typer.Option(10 , '--nmiss', '-n', help='Number of latest misses to show')):
+    '''
+    Prints hit rates, time spent and bytes written by classes inheriting from dmu.workflow.Cache
+    as well as the inputs that changed for the latest misses
+    '''
+    if not root.is_dir():
+        log.error(f'Cannot find: {root}')
+        raise typer.Exit(code=2)
+
+    metrics = CacheMetrics(root=root)
+    df      = metrics.get_report()
+    if len(df) == 0:
+        log.warning(f'No metrics found in: {root}')
+        raise typer.Exit(code=2)
+
+    log.info('\n' + df.to_markdown(index=False, floatfmt='.2f'))
+
+    l_miss = [ record for record in metrics.get_records() if record['status'] == 'miss' ]
+    for record in l_miss[-nmiss:]:
+        log.info(f'{record["kind"]:<25}{record["out_path"]:<50}{record["hash"]:<15}{record.get("changed")}')
+# ----------------------
+@app.command()
 def _dummy():
     pass
 # ----------------------
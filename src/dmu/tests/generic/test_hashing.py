@@ -2,7 +2,12 @@
 Module with functions needed to test functions in generic/hashing.py module
 '''
 
+import sys
+import importlib
+from pathlib import Path
+
 import pandas as pnd
+import pytest
 
 from omegaconf             import OmegaConf
 from dmu.generic           import hashing
@@ -56,3 +61,79 @@ def test_hash_omegadict():
     data = OmegaConf.create({'a' : 1})
 
     hashing.hash_object(obj=data)
+# --------------------------------------
+_CODE = '''
+_FACTOR = 2
+# ----------------------
+def _scale(x):
+    """
+    Scales x
+    """
+    return _FACTOR * x
+# ----------------------
+class Base:
+    def run(self, x):
+        return _scale(x) + 1
+# ----------------------
+class Tool(Base):
+    """
+    Tool
+    """
+    def get(self, x):
+        # Calls run
+        return self.run(x)
+'''
+# --------------------------------------
+def _hash_code(path : Path, code : str) -> str:
+    name = 'dmu_test_hash_code'
+    path.mkdir()
+    (path / f'{name}.py').write_text(code, encoding='utf-8')
+
+    sys.path.insert(0, str(path))
+    try:
+        module = importlib.import_module(name)
+        value  = hashing.hash_code(obj=module.Tool, packages=[name])
+    finally:
+        sys.path.remove(str(path))
+        sys.modules.pop(name, None)
+
+    return value
+# --------------------------------------
+@pytest.mark.parametrize('old, new, same', [
+    ('# Calls run'      , '# Calls run method', True ),
+    ('    Scales x\n'   , '    Scales x by 2\n', True ),
+    ('return self.run(x)', 'return self.run( x )', True ),
+    ('_FACTOR = 2'      , '_FACTOR = 3'        , False),
+    ('_scale(x) + 1'    , '_scale(x) + 2'      , False)])
+def test_hash_code(tmp_path : Path, old : str, new : str, same : bool):
+    '''
+    Tests that hash of code changes only when the code used by the class changes
+    '''
+    assert old in _CODE
+
+    hash_old = _hash_code(path=tmp_path / 'old', code=_CODE)
+    hash_new = _hash_code(path=tmp_path / 'new', code=_CODE.replace(old, new))
+
+    assert (hash_old == hash_new) == same
+# --------------------------------------
+@pytest.mark.parametrize('old, new, same', [
+    ('x > 1'       , 'x > 1'        , True ),
+    ('x > 1'       , 'x > 2'        , False),
+    ('numpy.sqrt'  , 'numpy.log'    , False),
+    ('lambda y : 1', 'lambda y : 2' , False)])
+def test_hash_bytecode(old : str, new : str, same : bool):
+    '''
+    Tests that hash of code without source, which uses the bytecode,
+    changes when constants, names or nested functions change
+    '''
+    code = 'def fun(x):\n    fn = lambda y : 1\n    return numpy.sqrt(x) if x > 1 else fn(x)\n'
+    assert old in code
+
+    l_hash = []
+    for source in [code, code.replace(old, new)]:
+        namespace : dict = {}
+        exec(source, namespace) # pylint: disable = exec-used
+        l_hash.append(hashing.hash_code(obj=namespace['fun'], packages=[]))
+
+    assert (l_hash[0] == l_hash[1]) == same
+# --------------------------------------
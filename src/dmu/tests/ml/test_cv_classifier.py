@@ -3,6 +3,7 @@ Module containing unit tests for CVClassifier
 '''
 
 import os
+import copy
 
 import yaml
 import numpy
@@ -15,6 +16,7 @@ from dmu.logging.log_store import LogStore
 from dmu.ml.cv_classifier  import CVClassifier as cls
 from dmu.ml.cv_classifier  import CVSameData
 
+import dmu.ml.utilities      as mut
 import dmu.testing.utilities as ut
 
 log = LogStore.add_logger('dmu.test.ml.test_cv_classifier')
@@ -160,3 +162,63 @@ def test_save_config():
 
     assert cfg_inp == cfg_out
 # -------------------------------------------------
+def test_legacy_hashes():
+    '''
+    Tests that models pickled with string hashes can still check for overlaps
+    '''
+    cfg   = ut.get_config('ml/tests/train_mva.yaml')
+
+    df_ft, l_lab = _get_train_input()
+    df_ft = df_ft.reset_index(drop=True)
+    ntrn  = len(df_ft) // 2
+
+    model= cls(cfg=cfg)
+    model.fit(df_ft.iloc[:ntrn], l_lab[:ntrn])
+
+    del model.__dict__['_arr_hash']
+    model._s_hash = mut.get_hashes(df_ft.iloc[:ntrn])
+
+    model_path = f'{Data.out_dir}/legacy/model.pkl'
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    joblib.dump(model, model_path)
+    model = joblib.load(model_path)
+
+    assert isinstance(model.hashes, set)
+    assert model.in_training(df_ft.iloc[ntrn - 10:ntrn + 10]).sum() == 10
+
+    model.predict_proba(df_ft.iloc[ntrn:])
+    with pytest.raises(CVSameData):
+        model.predict_proba(df_ft)
+# -------------------------------------------------
+def test_hist_backend():
+    '''
+    Tests training and prediction with histogram based learner
+    '''
+    cfg = ut.get_config('ml/tests/train_mva.yaml')
+    cfg = copy.deepcopy(cfg)
+    cfg['training']['backend'] = 'hist'
+    cfg['training']['hyper'  ] = {'max_iter' : 50, 'max_depth' : 5, 'learning_rate' : 0.1}
+
+    df_ft, l_lab = _get_train_input()
+    df_ft = df_ft.reset_index(drop=True)
+    ntrn  = len(df_ft) // 2
+
+    model= cls(cfg=cfg)
+    model.fit(df_ft.iloc[:ntrn], l_lab[:ntrn])
+
+    model_path = f'{Data.out_dir}/hist/model.pkl'
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    joblib.dump(model, model_path)
+    model = joblib.load(model_path)
+
+    arr_prob = model.predict_proba(df_ft.iloc[ntrn:])
+    arr_imp  = model.feature_importances_
+
+    assert model.backend == 'hist'
+    assert arr_prob.shape == (len(df_ft) - ntrn, 2)
+    assert len(arr_imp) == len(model.features)
+    assert numpy.isclose(arr_imp.sum(), 1)
+
+    with pytest.raises(CVSameData):
+        model.predict_proba(df_ft)
+# -------------------------------------------------
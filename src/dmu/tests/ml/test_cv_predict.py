@@ -183,3 +183,50 @@ def test_skip_mva_prediction(tmp_path):
 
     assert len(arr_fail) == 0
 #--------------------------------------------------------------------
+@pytest.mark.parametrize('chunk_size', [333, 1000_000])
+def test_chunks(tmp_path : Path, chunk_size : int):
+    '''
+    Tests that predicting in chunks gives the same scores as predicting at once,
+    with NaNs, skipped entries and overlap with training sample
+    '''
+    rdf_sig    = ut.get_rdf(kind='sig', columns_with_nans=['x', 'y'])
+    rdf_bkg    = ut.get_rdf(kind='bkg')
+    l_model, _ = ut.get_models(rdf_sig, rdf_bkg, out_dir=tmp_path)
+
+    rdf     = ut.get_rdf(kind='sig', columns_with_nans=['x', 'y'])
+    rdf     = rdf.Define('skip_mva_prediction', 'rdfentry_ % 3 == 0')
+
+    cvp     = CVPredict(models=l_model, rdf=rdf)
+    arr_exp = cvp.predict()
+
+    cvp     = CVPredict(models=l_model, rdf=rdf, chunk_size=chunk_size)
+    arr_prb = cvp.predict()
+
+    assert numpy.allclose(arr_prb, arr_exp)
+#--------------------------------------------------------------------
+def test_book(tmp_path : Path):
+    '''
+    Tests that booking the features for several predictors gives the
+    same scores as predicting with each of them separately
+    '''
+    rdf_sig    = ut.get_rdf(kind='sig', columns_with_nans=['x', 'y'])
+    rdf_bkg    = ut.get_rdf(kind='bkg')
+    l_model, _ = ut.get_models(rdf_sig, rdf_bkg, out_dir=tmp_path)
+
+    rdf     = ut.get_rdf(kind='sig', columns_with_nans=['x', 'y'])
+    rdf_low = rdf.Filter('x <  0')
+    rdf_hig = rdf.Filter('x >= 0')
+
+    arr_low = CVPredict(models=l_model, rdf=rdf_low).predict()
+    arr_hig = CVPredict(models=l_model, rdf=rdf_hig).predict()
+
+    nrun    = rdf.GetNRuns()
+    cvp_low = CVPredict(models=l_model, rdf=rdf_low)
+    cvp_hig = CVPredict(models=l_model, rdf=rdf_hig)
+    cvp_low.book()
+    cvp_hig.book()
+
+    assert numpy.allclose(cvp_low.predict(), arr_low)
+    assert numpy.allclose(cvp_hig.predict(), arr_hig)
+    assert rdf.GetNRuns() == nrun + 1
+#--------------------------------------------------------------------
@@ -59,3 +59,27 @@ def test_tag_nans():
 
     assert arr_index.tolist() == [2]
     assert df_tg.equals(df_in)
+# ----------------------------------------
+def test_fingerprints():
+    '''
+    Tests that `get_fingerprints` gives the same hashes to the same rows
+    and different hashes to different rows
+    '''
+    rng   = numpy.random.default_rng(seed=10)
+    df    = pnd.DataFrame({'x' : rng.normal(size=10_000), 'y' : rng.integers(0, 10, size=10_000)})
+    df_2  = pnd.concat([df.iloc[::-1], df.iloc[:100]])
+
+    arr_1 = ut.get_fingerprints(df)
+    arr_2 = ut.get_fingerprints(df_2)
+
+    assert arr_1.dtype == numpy.uint64
+    assert len(numpy.unique(arr_1)) == len(df)
+    assert numpy.array_equal(arr_2[:len(df)], arr_1[::-1])
+
+    df_3  = df.copy()
+    df_3['y'] = df_3['y'] + 1
+    arr_3 = ut.get_fingerprints(df_3)
+
+    arr_ref = numpy.unique(arr_1)
+    assert ut.in_hashes(arr_hash=arr_2, arr_ref=arr_ref).all()
+    assert not ut.in_hashes(arr_hash=arr_3, arr_ref=arr_ref).any()
@@ -1,8 +1,12 @@
 '''
 Unit test for Mva class
 '''
+
+import joblib
+import numpy
 import pytest
 import mplhep
+import pandas            as pnd
 import matplotlib.pyplot as plt
 
 from   dmu.logging.log_store import LogStore
@@ -138,3 +142,46 @@ def test_hyperparameter_optimization(workers : int):
                 opt_ntrial  =10,
                 load_trained=False)
 # -------------------------------
+def test_parallel_folds():
+    '''
+    Tests training folds in separate processes, with a fixed random state
+    the models should be the same as the ones trained serially
+    '''
+    nfold   = 3
+
+    rdf_sig = ut.get_rdf(kind='sig')
+    rdf_bkg = ut.get_rdf(kind='bkg')
+
+    d_out = {}
+    d_auc = {}
+    for workers in [1, 3]:
+        cfg     = ut.get_config('ml/tests/train_mva.yaml')
+        cfg['training']['nfold'] = nfold
+        cfg['training']['hyper']['random_state'] = 1
+        path    = cfg['saving']['output']
+        cfg['saving']['output'] = path.replace('train_mva', f'train_mva_parallel_{workers:02}w')
+
+        obj= TrainMva(sig=rdf_sig, bkg=rdf_bkg, cfg=cfg)
+        with obj.use(nworkers=workers):
+            d_auc[workers] = obj.run()
+
+        d_out[workers] = cfg['saving']['output']
+
+    assert 0.5 < d_auc[3] <= 1.0
+    assert d_auc[1] == d_auc[3]
+
+    # Data not used in the training of any fold
+    rng   = numpy.random.default_rng(seed=42)
+    df_ft = pnd.DataFrame(rng.normal(0.5, 1.0, size=(1000, 3)), columns=['x', 'y', 'r'])
+    for ifold in range(nfold):
+        df_ser = pnd.read_json(f'{d_out[1]}/fold_{ifold:03}/roc_test.json')
+        df_par = pnd.read_json(f'{d_out[3]}/fold_{ifold:03}/roc_test.json')
+        pnd.testing.assert_frame_equal(df_ser, df_par)
+
+        mod_ser = joblib.load(f'{d_out[1]}/model_{ifold:03}.pkl')
+        mod_par = joblib.load(f'{d_out[3]}/model_{ifold:03}.pkl')
+        arr_ser = mod_ser.predict_proba(df_ft)
+        arr_par = mod_par.predict_proba(df_ft)
+
+        assert numpy.array_equal(arr_ser, arr_par)
+# -------------------------------
@@ -0,0 +1,153 @@
+'''
+Module with tests for ExpressionLibrary class
+'''
+# pylint: disable=no-name-in-module
+
+from pathlib import Path
+
+import numpy
+import pytest
+from ROOT import RDF, gInterpreter # type: ignore
+
+from dmu.logging.log_store             import LogStore
+from dmu.rdataframe.expression_library import ExpressionLibrary
+
+log=LogStore.add_logger('dmu:test:rdataframe:expression_library')
+# -------------------------------------------------
+@pytest.fixture(scope='session', autouse=True)
+def initialize():
+    '''
+    This is called before any test
+    '''
+    LogStore.set_level('dmu:rdataframe:expression_library', 10)
+# -------------------------------------------------
+def _get_rdf() -> RDF.RNode:
+    d_data = {
+        'a' : numpy.array([1.0, 2.0, 3.0, 4.0], dtype='float32'),
+        'b' : numpy.array([4.0, 3.0, 2.0, 1.0]),
+        'n' : numpy.array([1, 2, 3, 4], dtype='int32')}
+
+    return RDF.FromNumpy(d_data)
+# -------------------------------------------------
+def _apply(rdf : RDF.RNode) -> RDF.RNode:
+    rdf = rdf.Define('x', 'a + 2 * b')
+    rdf = rdf.Define('y', 'x > 8 ? n : -n')
+    rdf = rdf.Filter('y > 0 || rdfentry_ == 0', 'cut')
+    rdf = rdf.Redefine('x', 'x + std::abs(a)')
+
+    return rdf
+# -------------------------------------------------
+def _get_data(rdf : RDF.RNode) -> dict[str,numpy.ndarray]:
+    return rdf.AsNumpy(['x', 'y'])
+# -------------------------------------------------
+def test_simple(tmp_path : Path):
+    '''
+    Compares compiled expressions with JITted ones
+    '''
+    d_exp = _get_data(_apply(_get_rdf()))
+
+    with ExpressionLibrary.cache_dir(tmp_path):
+        for _ in range(2):
+            exl = ExpressionLibrary(rdf=_get_rdf())
+            rdf = _apply(exl).get_rdf()
+            d_dat = _get_data(rdf)
+
+            for name, arr_exp in d_exp.items():
+                assert numpy.allclose(d_dat[name], arr_exp)
+
+    l_lib = list(tmp_path.glob('*/libexpressions.so'))
+    assert len(l_lib) == 1
+# -------------------------------------------------
+def test_fallback(tmp_path : Path):
+    '''
+    Checks that expressions using functions declared in the interpreter still work
+    '''
+    gInterpreter.Declare('double dmu_test_expression_library(double x) { return 2 * x; }')
+
+    with ExpressionLibrary.cache_dir(tmp_path):
+        for _ in range(2):
+            exl = ExpressionLibrary(rdf=_get_rdf())
+            rdf = exl.Define('z', 'dmu_test_expression_library(b)').get_rdf()
+            arr_z = rdf.AsNumpy(['z'])['z']
+
+            assert numpy.allclose(arr_z, [8, 6, 4, 2])
+
+    l_failed = list(tmp_path.glob('*/failed'))
+    assert len(l_failed) == 1
+# -------------------------------------------------
+@pytest.mark.parametrize('enabled', [True, False])
+def test_invalid_expression(tmp_path : Path, enabled : bool):
+    '''
+    Checks that invalid expressions raise when applied, naming the operation
+    '''
+    with ExpressionLibrary.cache_dir(tmp_path),\
+         ExpressionLibrary.enabled(value=enabled):
+        exl = ExpressionLibrary(rdf=_get_rdf())
+        exl = exl.Define('x', 'a + b')
+        exl = exl.Filter('x > dmu_test_missing_function(a)', 'missing')
+
+        with pytest.raises(ValueError, match='Filter missing = x > dmu_test_missing_function'):
+            exl.get_rdf()
+# -------------------------------------------------
+def test_statements(tmp_path : Path):
+    '''
+    Checks that expressions with several statements and ROOT::Math vectors are compiled
+    '''
+    l_def = [
+        ('eta', 'ROOT::Math::XYZVector vec(a, b, n); return vec.eta();'),
+        ('mas', 'ROOT::Math::PxPyPzEVector vec(a, b, n, 10); return vec.M();')]
+
+    rdf = _get_rdf()
+    for name, expr in l_def:
+        rdf = rdf.Define(name, expr)
+    d_exp = rdf.AsNumpy(['eta', 'mas'])
+
+    with ExpressionLibrary.cache_dir(tmp_path):
+        exl = ExpressionLibrary(rdf=_get_rdf())
+        for name, expr in l_def:
+            exl = exl.Define(name, expr)
+        d_dat = exl.get_rdf().AsNumpy(['eta', 'mas'])
+
+    for name, arr_exp in d_exp.items():
+        assert numpy.allclose(d_dat[name], arr_exp)
+
+    assert len(list(tmp_path.glob('*/libexpressions.so'))) == 1
+    assert len(list(tmp_path.glob('*/failed')))            == 0
+# -------------------------------------------------
+def test_environment_failure(tmp_path : Path, monkeypatch : pytest.MonkeyPatch):
+    '''
+    Checks that failures not caused by the compiler, e.g. missing root-config, are not cached
+    '''
+    def _get_command() -> list[str]:
+        raise RuntimeError('Cannot find root-config')
+
+    with ExpressionLibrary.cache_dir(tmp_path):
+        with monkeypatch.context() as mpt:
+            mpt.setattr(ExpressionLibrary, '_get_command', staticmethod(_get_command))
+            exl   = ExpressionLibrary(rdf=_get_rdf())
+            arr_z = exl.Define('z', '3 * a - b').get_rdf().AsNumpy(['z'])['z']
+            assert numpy.allclose(arr_z, [-1, 3, 7, 11])
+
+        assert list(tmp_path.iterdir()) == []
+
+        exl   = ExpressionLibrary(rdf=_get_rdf())
+        arr_z = exl.Define('z', '3 * a - b').get_rdf().AsNumpy(['z'])['z']
+        assert numpy.allclose(arr_z, [-1, 3, 7, 11])
+
+    assert len(list(tmp_path.glob('*/libexpressions.so'))) == 1
+# -------------------------------------------------
+def test_writable_by_others(tmp_path : Path):
+    '''
+    Checks that libraries in directories writable by other users are not loaded
+    '''
+    lib_dir  = tmp_path / 'library'
+    lib_dir.mkdir(mode=0o700)
+    lib_path = lib_dir / 'libexpressions.so'
+    lib_path.write_bytes(b'')
+
+    ExpressionLibrary._check_owner(lib_path=lib_path)
+
+    lib_dir.chmod(0o777)
+    with pytest.raises(RuntimeError):
+        ExpressionLibrary._check_owner(lib_path=lib_path)
+# -------------------------------------------------
@@ -4,7 +4,7 @@ Module will hold unit tests for functions in rdataframe/utilities.py
 # pylint: disable=no-name-in-module, no-member
 import math
 
-from ROOT import RDF, RDataFrame
+from ROOT import RDF, RDataFrame, EnableImplicitMT, DisableImplicitMT
 
 import numpy
 import pytest
@@ -78,6 +78,20 @@ def test_add_column_with_numba(itry):
 
     rdf.Display().Print()
 # -------------------------------------------------
+def test_add_column_with_numba_multithreading():
+    '''
+    Values are picked by entry number, which cannot be done with multithreading
+    '''
+    rdf     = RDataFrame(3)
+    arr_val = numpy.array([10, 20, 30])
+
+    EnableImplicitMT(4)
+    try:
+        with pytest.raises(ValueError):
+            ut.add_column_with_numba(rdf, arr_val, 'values', identifier='multithreading')
+    finally:
+        DisableImplicitMT()
+# -------------------------------------------------
 def test_misalignment():
     '''
     Will test with inputs where columns have different sizes
@@ -6,7 +6,8 @@ import pytest
 
 from pathlib       import Path
 from dmu.generic   import utilities as gut
-from dmu.workflow  import Cache
+from dmu.generic   import hashing
+from dmu.workflow  import Cache, BlobStore, CacheMetrics
 from dmu           import LogStore
 
 log=LogStore.add_logger('dmu:workflow:test_cache')
@@ -164,3 +165,87 @@ def test_cache_context(tmp_path : Path):
         out = obj.run()
 
     assert res == out
+# -----------------------------------
+def test_deduplication(tmp_path : Path):
+    '''
+    Tests that identical outputs from different hashes are stored once
+    '''
+    with Cache.cache_root(path = tmp_path):
+        for name in ['dedup_1', 'dedup_2']:
+            obj = Tester(nval=4, name=name)
+            obj.run()
+
+    store = BlobStore(root=tmp_path)
+    d_sum = store.summary()
+
+    assert d_sum['directories'] == 2
+    assert d_sum['blobs'      ] == 2
+    assert d_sum['logical'    ] == 2 * d_sum['size']
+# -----------------------------------
+def test_prune(tmp_path : Path):
+    '''
+    Tests removing cached outputs, least recently used first
+    '''
+    with Cache.cache_root(path = tmp_path):
+        for nval in range(1, 4):
+            obj = Tester(nval=nval, name='prune')
+            obj.run()
+
+    store = BlobStore(root=tmp_path)
+    nrem  = store.prune(max_size=0)
+    d_sum = store.summary()
+
+    assert nrem == 3
+    assert d_sum['directories'] == 0
+    assert d_sum['blobs'      ] == 0
+
+    with Cache.cache_root(path = tmp_path):
+        obj = Tester(nval=3, name='prune')
+        out = obj.run()
+
+    assert out == [1] * 3
+# -----------------------------------
+def test_metrics(tmp_path : Path):
+    '''
+    Tests recording of hits, misses and changed inputs
+    '''
+    with Cache.cache_root(path = tmp_path):
+        for nval in [2, 2, 3]:
+            obj = Tester(nval=nval, name='metrics')
+            obj.run()
+
+    metrics  = CacheMetrics(root=tmp_path)
+    l_record = metrics.get_records()
+    l_status = [ record['status'] for record in l_record ]
+
+    assert l_status == ['miss', 'hit', 'miss']
+    assert l_record[0]['changed'] is None
+    assert l_record[2]['changed'] == ['nval']
+
+    df = metrics.get_report()
+    assert df['hits'  ].tolist() == [1]
+    assert df['misses'].tolist() == [2]
+# -----------------------------------
+@pytest.mark.parametrize('kind', ['version', 'ast'])
+def test_code_hashing(tmp_path : Path, kind : str):
+    '''
+    Tests hashing code through syntax trees or through explicit versions
+    '''
+    class VersionedTester(Tester):
+        '''
+        Tester whose hash does not depend on module file
+        '''
+        _cache_version = 1 if kind == 'version' else None
+        _code_hashing  = 'ast'
+
+    with Cache.cache_root(path = tmp_path):
+        obj = VersionedTester(nval=4, name='code_hashing')
+        hsh = obj._get_code_hash()
+        obj.run()
+
+        obj = VersionedTester(nval=4, name='code_hashing')
+        assert obj._get_code_hash() == hsh
+        assert obj._copy_from_cache()
+
+    assert hsh != hashing.hash_file(path=__file__)
+# -----------------------------------
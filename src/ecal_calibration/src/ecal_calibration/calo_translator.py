@@ -2,11 +2,18 @@
 Module with code needed to retrieve X, Y position from ECAL cell ID
 '''
 
+from functools           import cache
 from importlib.resources import files
+
+import numpy
 import pandas as pnd
 from dmu.logging.log_store import LogStore
 
 log=LogStore.add_logger('ecal_calibration:calo_translator')
+
+# Areas are 0, 1, 2 and rows and columns go from 0 to 63
+_NAREA = 3
+_NCELL = 64
 # --------------------------------
 def _cast_column(column, ctype) -> pnd.Series:
     column = pnd.to_numeric(column, errors='coerce')
@@ -15,9 +22,10 @@ def _cast_column(column, ctype) -> pnd.Series:
 
     return column
 # --------------------------------
-def get_data() -> pnd.DataFrame:
+@cache
+def _load_data() -> pnd.DataFrame:
     '''
-    Returns pandas dataframe with x,y and row and column values
+    Reads CSV file once per process
     '''
     data_path = files('ecal_calibration_data').joinpath('brem_correction/coordinates.csv')
     df      = pnd.read_csv(data_path)
@@ -29,6 +37,81 @@ def get_data() -> pnd.DataFrame:
     df['c'] = _cast_column(df.c, int)
 
     return df
+# --------------------------------
+def get_data() -> pnd.DataFrame:
+    '''
+    Returns pandas dataframe with x,y and row and column values
+    '''
+    df = _load_data()
+
+    return df.copy()
+# --------------------------------
+@cache
+def _get_lookup_table() -> numpy.ndarray:
+    '''
+    Returns
+    --------------
+    Array with shape (area, row, column, 2), where the last axis holds the x and y coordinates.
+    Cells that do not exist are assigned NaN
+    '''
+    df    = _load_data()
+    df    = df[(df.a >= 0) & (df.r >= 0) & (df.c >= 0)]
+    table = numpy.full((_NAREA, _NCELL, _NCELL, 2), numpy.nan)
+
+    arr_are = df.a.to_numpy()
+    arr_row = df.r.to_numpy()
+    arr_col = df.c.to_numpy()
+
+    table[arr_are, arr_row, arr_col, 0] = df.x.to_numpy()
+    table[arr_are, arr_row, arr_col, 1] = df.y.to_numpy()
+    table.flags.writeable      = False
+
+    log.debug(f'Built lookup table with {len(df)} cells')
+
+    return table
+# ------------------------------------------------------
+def from_ids_to_xy(
+    rows  : numpy.ndarray,
+    cols  : numpy.ndarray,
+    areas : numpy.ndarray) -> tuple[numpy.ndarray,numpy.ndarray]:
+    '''
+    Vectorized version of `from_id_to_xy`
+
+    Parameters
+    --------------
+    rows : Array of row indices
+    cols : Array of column indices
+    areas: Array of subdetector indices 0 (Inner), 1 (Middle), 2 (Outer)
+
+    Returns
+    --------------
+    Tuple with arrays of x and y coordinates
+    '''
+    arr_row = numpy.asarray(rows , dtype=int)
+    arr_col = numpy.asarray(cols , dtype=int)
+    arr_are = numpy.asarray(areas, dtype=int)
+
+    arr_inv = (arr_are < 0) | (arr_are >= _NAREA)
+    arr_inv|= (arr_row < 0) | (arr_row >= _NCELL)
+    arr_inv|= (arr_col < 0) | (arr_col >= _NCELL)
+
+    table   = _get_lookup_table()
+    arr_xy  = numpy.full(arr_row.shape + (2,), numpy.nan)
+    arr_val = ~arr_inv
+    arr_xy[arr_val] = table[arr_are[arr_val], arr_row[arr_val], arr_col[arr_val]]
+
+    arr_inv|= numpy.isnan(arr_xy[..., 0])
+    if numpy.any(arr_inv):
+        ninv = numpy.sum(arr_inv)
+        row  = arr_row[arr_inv][0]
+        col  = arr_col[arr_inv][0]
+        are  = arr_are[arr_inv][0]
+        log.info(f'{"Row":<10}{row}')
+        log.info(f'{"Col":<10}{col}')
+        log.info(f'{"Reg":<10}{are}')
+        raise ValueError(f'Found {ninv} cells that do not exist, e.g. the one above')
+
+    return arr_xy[..., 0], arr_xy[..., 1]
 # ------------------------------------------------------
 def from_id_to_xy(row : int = None, col : int = None, det : str = None, area : int = None) -> tuple[float,float]:
     '''
@@ -52,6 +135,11 @@ def from_id_to_xy(row : int = None, col : int = None, det : str = None, area : i
             'Outer']:
         raise ValueError(f'Invalid subdetector name: \"{det}\"')
 
+    if None not in [row, col, area] and det is None:
+        arr_x, arr_y = from_ids_to_xy(rows=numpy.array([row]), cols=numpy.array([col]), areas=numpy.array([area]))
+
+        return float(arr_x[0]), float(arr_y[0])
+
     df = get_data()
     if area is not None:
         df = df[df.a==area]
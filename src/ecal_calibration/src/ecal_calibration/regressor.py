@@ -102,15 +102,6 @@ class Regressor:
         net.eval()
         self._net = net
     # ---------------------------------------------
-    def _add_xy(self, row : pnd.Series, var : str) -> pnd.Series:
-        r = row['row']
-        c = row['col']
-        a = row['are']
-
-        x, y = ctran.from_id_to_xy(row=int(r), col=int(c), area=int(a))
-
-        return x if var == 'x' else y
-    # ---------------------------------------------
     def test(self) -> None:
         '''
         Runs comparison of predicted
@@ -132,8 +123,7 @@ class Regressor:
 
         df['mu_pred'] = self.predict(features=features) / 1000.
         df['mu']      = df['mu'] / 1000.
-        df['x']       = df.apply(self._add_xy, args=('x',), axis=1)
-        df['y']       = df.apply(self._add_xy, args=('y',), axis=1)
+        df['x'], df['y'] = ctran.from_ids_to_xy(rows=df['row'].to_numpy(), cols=df['col'].to_numpy(), areas=df['are'].to_numpy())
 
         self._plot_corrections(df=df)
         self._plot_by_energy(df=df)
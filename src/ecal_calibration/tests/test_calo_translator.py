@@ -3,6 +3,7 @@ Module with functions meant to test the row,col <-> x,y translation
 '''
 import os
 
+import numpy
 import pytest
 import pandas             as pnd
 import matplotlib.pyplot  as plt
@@ -168,3 +169,28 @@ def test_fully_defined():
     assert x1 == x2
     assert y1 == y2
 # --------------------------------
+def test_vectorized():
+    '''
+    Tests that vectorized translation agrees with coordinates in CSV file
+    '''
+    df = ctran.get_data()
+    df = df[(df.a >= 0) & (df.r >= 0) & (df.c >= 0)]
+
+    arr_x, arr_y = ctran.from_ids_to_xy(
+        rows = df.r.to_numpy(),
+        cols = df.c.to_numpy(),
+        areas= df.a.to_numpy())
+
+    assert numpy.array_equal(arr_x, df.x.to_numpy())
+    assert numpy.array_equal(arr_y, df.y.to_numpy())
+# --------------------------------
+def test_vectorized_invalid():
+    '''
+    Tests that vectorized translation fails for cells that do not exist
+    '''
+    with pytest.raises(ValueError):
+        ctran.from_ids_to_xy(
+            rows = numpy.array([14, 0]),
+            cols = numpy.array([35, 0]),
+            areas= numpy.array([ 2, 2]))
+# --------------------------------
@@ -8,6 +8,7 @@ from .data_fitter        import DataFitter
 from .data_model         import DataModel
 from .sim_fitter         import SimFitter
 from .data_preprocessor  import DataPreprocessor
+from .fit_input_store    import FitInputStore
 from .constraint_reader  import ConstraintReader
 from .cmb_constraints    import CmbConstraints
 from .category           import Category
@@ -65,6 +66,7 @@ __all__ = [
     'ConstraintReader',
     'CmbConstraints',
     'DataPreprocessor',
+    'FitInputStore',
     'ParameterReader', 
     'SimFitter',
     'DataFitter',
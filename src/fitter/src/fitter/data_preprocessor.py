@@ -2,9 +2,9 @@
 Module holding DataPreprocessor class
 '''
 import numpy
-import tempfile
 import pandas   as pnd
 
+from functools       import cached_property
 from pathlib         import Path
 from ROOT            import RDF # type: ignore
 from typing          import Final
@@ -13,6 +13,7 @@ from dmu             import LogLevels, LogStore
 from dmu.workflow    import Cache
 from dmu.stats       import utilities  as sut
 from dmu.generic     import utilities  as gut
+from dmu.generic     import hashing
 from dmu.rdataframe  import utilities  as rut
 from dmu.pdataframe  import utilities  as put
 
@@ -26,6 +27,8 @@ from rx_misid        import SampleSplitter
 from rx_misid        import SampleWeighter
 from rx_misid        import MisIDSampleWeights
 
+from .fit_input_store import FitInputStore
+
 log=LogStore.add_logger('fitter:data_preprocessor')
 
 _WEIGHT_BRANCH : Final[str] = 'weight'
@@ -39,7 +42,14 @@ class DataPreprocessor(Cache):
     - Loading ROOT files through RDFGetter
     - Applying selection
     - Transforming data into format that zfit can use
+
+    When no extra weights are needed, the loose part of the selection is applied once per sample
+    and the needed columns are stored through `FitInputStore`. The category and scanned cuts
+    are then applied as masks on those columns.
     '''
+    # Cuts that are usually scanned, e.g. MVA working points
+    # these are always applied as masks on the stored columns
+    _l_scan_cut = ['cmb', 'prc']
     # ------------------------
     def __init__(
         self,
@@ -75,16 +85,22 @@ class DataPreprocessor(Cache):
         self._q2bin  = q2bin
         self._wgt_cfg= wgt_cfg
 
+        self._d_cat  = dict() if selection is None else selection
+        self._is_sig = is_sig
+
+        log.debug(f'Retrieving dataframe for {self._sample}/{self._trigger}')
+        gtr = RDFGetter(
+            sample  =self._sample,
+            trigger =self._trigger)
+
+        self._rdf_raw = gtr.get_rdf(per_file=False)
+        self._uid     = gtr.get_uid()
+
         # Caching will remove all files
         # Need to keep around selection
         # To save it at the end
-        selection            = dict() if selection is None else selection
-        rdf , d_sel, df_ctf  = self._get_rdf(selection = selection)
-
-        self._rdf    = rdf 
-        self._d_sel  = d_sel
-        self._df_ctf = df_ctf
-        self._is_sig = is_sig
+        d_sel         = self._get_selection()
+        self._d_sel   = d_sel
 
         super().__init__(
             out_path = Path(self._sample) / 'dataset' / self._name,
@@ -93,62 +109,99 @@ class DataPreprocessor(Cache):
             d_sel    = d_sel,
             is_sig   = is_sig,
             wgt_cfg  = '' if self._wgt_cfg is None else {key : val.model_dump() for key, val in self._wgt_cfg.items()}, 
-            rdf_uid  = self._rdf.uid)
+            rdf_uid  = self.rdf_uid)
     # ------------------------
-    def _get_rdf(self, selection : dict[str,str]) -> tuple[RDF.RNode, dict[str,str], pnd.DataFrame]:
+    def _get_selection(self) -> dict[str,str]:
         '''
-        Parameters
-        -------------------
-        selection: Selection to be added on top, used for categories.
-
         Returns
         -------------------
-        Tuple with:
-           - ROOT dataframe after selection and with Unique identifier attached as uid
-           - Dictionary storing selection
-           - Pandas dataframe with cutflow
+        Dictionary with full selection, i.e. current selection updated with category one
         '''
-        log.debug(f'Retrieving dataframe for {self._sample}/{self._trigger}')
-        gtr = RDFGetter(
-            sample  =self._sample,
-            trigger =self._trigger)
-
-        rdf_raw = gtr.get_rdf(per_file=False)
-        uid     = gtr.get_uid()
-
-        log.debug(f'Applying selection to {self._sample}/{self._trigger}')
-
-        if Cache._cache_root is None:
-            raise ValueError('Cache root directory not defined')
-
         # NOTE: Update selection such that category selection
         # is applied on top of potentially non-default selection
         # Current selection might contain different cuts, e.g. 
         # special BDT cut or special brem choice
-        with tempfile.TemporaryDirectory() as tmp_dir,\
-            sel.update_selection(d_sel=selection):
-            rdf_sel = sel.apply_full_selection(
-                rdf     = rdf_raw,
-                uid     = uid,
-                q2bin   = self._q2bin,
-                trigger = self._trigger,
-                process = self._sample,
-                out_path= Path(tmp_dir))
-
+        with sel.update_selection(d_sel=self._d_cat):
             cfg_sel = sel.selection(
                 process = self._sample, 
                 trigger = self._trigger, 
                 q2bin   = self._q2bin)
 
-            rep = rdf_sel.Report()
-            df  = rut.rdf_report_to_df(rep=rep)
-
         if log.getEffectiveLevel() < LogLevels.info:
-            rep.Print()
             for name, val in cfg_sel.items():
                 log.info(f'{name:<15}{val}')
 
-        return rdf_sel, cfg_sel, df
+        return cfg_sel
+    # ------------------------
+    @cached_property
+    def _rdf(self) -> RDF.RNode:
+        '''
+        ROOT dataframe after selection and with unique identifier attached as uid
+        This is only built if needed, e.g. to attach extra weights
+        '''
+        log.debug(f'Applying selection to {self._sample}/{self._trigger}')
+        with sel.update_selection(d_sel=self._d_cat):
+            rdf = sel.apply_full_selection(
+                rdf     = self._rdf_raw,
+                uid     = self._uid,
+                q2bin   = self._q2bin,
+                trigger = self._trigger,
+                process = self._sample)
+
+        return rdf
+    # ------------------------
+    def _split_selection(self) -> tuple[dict[str,str],dict[str,str]]:
+        '''
+        Returns
+        -------------------
+        Tuple with:
+           - Cuts shared by all categories and working points, i.e. preselection
+           - Cuts defining the category, scanned or overriden, applied as masks
+        '''
+        with sel.custom_selection(d_sel={}, force_override=True):
+            d_def = sel.selection(
+                process = self._sample, 
+                trigger = self._trigger, 
+                q2bin   = self._q2bin)
+
+        d_pre = {}
+        d_cut = {}
+        for name, expr in self._d_sel.items():
+            if name in self._d_cat or name in self._l_scan_cut or d_def.get(name) != expr:
+                d_cut[name] = expr
+            else:
+                d_pre[name] = expr
+
+        return d_pre, d_cut
+    # ------------------------
+    def _get_store(self, cuts : dict[str,str], preselection : dict[str,str]) -> FitInputStore:
+        '''
+        Parameters
+        -------------------
+        cuts        : Cuts applied as masks, their columns need to be stored
+        preselection: Cuts applied before storing columns
+
+        Returns
+        -------------------
+        Store with columns needed to build dataset
+        '''
+        if Cache._cache_root is None:
+            raise ValueError('Cache root directory not defined')
+
+        s_col = set(rut.columns_from_rdf(rdf=self._rdf_raw))
+        l_col = [self._obs.label, _WEIGHT_BRANCH]
+        for expr in cuts.values():
+            _, l_used = rut.replace_columns(expr=expr, columns=s_col)
+            l_col    += l_used
+
+        store = FitInputStore(
+            rdf         = self._rdf_raw,
+            uid         = self._uid,
+            preselection= preselection,
+            columns     = l_col,
+            out_dir     = Cache._cache_root / self._sample / 'fit_inputs')
+
+        return store
     # ------------------------
     def _add_extra_weights(self, wgt : numpy.ndarray) -> numpy.ndarray:
         '''
@@ -224,31 +277,58 @@ class DataPreprocessor(Cache):
 
         return df['pid_weights'].to_numpy()
     # ------------------------
-    def _get_array(self) -> tuple[numpy.ndarray,numpy.ndarray]:
+    def _get_array(self) -> tuple[numpy.ndarray,numpy.ndarray,pnd.DataFrame]:
         '''
-        Return a tuple of numpy arrays with the observable and weight
-        for the sample requested, this array is fully selected
+        Return a tuple with numpy arrays with the observable and weight
+        for the sample requested, this array is fully selected, and the cutflow
         '''
+        if self._wgt_cfg is None:
+            return self._get_array_from_store()
+
         log.debug(f'Extracting data through RDFGetter for sample {self._sample}')
 
         rdf  = self._rdf
+        rep  = rdf.Report()
         log.debug('Retrieving data')
-        arr  = rdf.AsNumpy([self._obs.label])[self._obs.label]
-        wgt  = rdf.AsNumpy([_WEIGHT_BRANCH])[_WEIGHT_BRANCH]
+        data = rdf.AsNumpy([self._obs.label, _WEIGHT_BRANCH])
+        arr  = data[self._obs.label]
+        wgt  = data[_WEIGHT_BRANCH]
         wgt  = wgt.astype(float)
         wgt  = self._add_extra_weights(wgt=wgt)
+        df   = rut.rdf_report_to_df(rep=rep)
+
+        nevt = len(arr)
+        log.debug(f'Found {nevt} entries')
+
+        return arr, wgt, df
+    # ------------------------
+    def _get_array_from_store(self) -> tuple[numpy.ndarray,numpy.ndarray,pnd.DataFrame]:
+        '''
+        Return a tuple with numpy arrays with the observable and weight
+        for the sample requested, this array is fully selected, and the cutflow
+        The arrays are read from the store of preselected candidates
+        '''
+        d_pre, d_cut = self._split_selection()
+        log.debug(f'Using preselection with {len(d_pre)} cuts and {len(d_cut)} cuts as masks')
+
+        store        = self._get_store(cuts=d_cut, preselection=d_pre)
+        arr_mask, df = store.get_mask(cuts=d_cut)
+
+        arr  = numpy.asarray(store.get_column(name=self._obs.label)[arr_mask])
+        wgt  = numpy.asarray(store.get_column(name=_WEIGHT_BRANCH )[arr_mask], dtype=float)
 
         nevt = len(arr)
         log.debug(f'Found {nevt} entries')
 
-        return arr, wgt
+        return arr, wgt, df
     # ------------------------
     @property
     def rdf_uid(self) -> str|None:
         '''
         Unique identifier of ROOT dataframe after selection
+        Same as the one attached by `apply_full_selection`, without building the dataframe
         '''
-        return self._rdf.uid
+        return hashing.hash_object([self._uid, self._d_sel])
     # ------------------------
     def _data_from_numpy(
         self,
@@ -298,14 +378,14 @@ class DataPreprocessor(Cache):
             data    = self._data_from_numpy(arr_value=arr, arr_weight=wgt)
             return data
 
-        arr, wgt = self._get_array()
+        arr, wgt, df_ctf = self._get_array()
         data     = self._data_from_numpy(arr_value=arr, arr_weight=wgt)
 
         cuts_path = data_path.with_suffix('.yaml')
         gut.dump_json(data=self._d_sel , path=cuts_path)
 
         ctfl_path = cuts_path.with_suffix('.md')
-        put.to_markdown(df=self._df_ctf, path=ctfl_path)
+        put.to_markdown(df=df_ctf, path=ctfl_path)
 
         numpy.savez_compressed(data_path, values=arr, weights=wgt)
         self._cache()
@@ -0,0 +1,419 @@
+'''
+Module holding FitInputStore class
+'''
+import os
+import re
+import ast
+import json
+import shutil
+
+from pathlib        import Path
+from typing         import Final
+
+import numpy
+import pandas   as pnd
+from ROOT           import RDF # type: ignore
+
+from dmu            import LogStore
+from dmu.generic    import hashing
+from dmu.rdataframe import utilities  as rut
+
+log=LogStore.add_logger('fitter:fit_input_store')
+
+_META_NAME : Final[str] = 'columns.json'
+# Functions in cut expressions, that can be evaluated with numpy
+_FUNCTIONS : Final[dict[str,str]] = {
+    'TMath::Abs'  : 'abs',
+    'std::abs'    : 'abs',
+    'abs'         : 'abs',
+    'fabs'        : 'abs',
+    'TMath::Sqrt' : 'sqrt',
+    'std::sqrt'   : 'sqrt',
+    'sqrt'        : 'sqrt',
+    'TMath::Log'  : 'log',
+    'std::log'    : 'log',
+    'log'         : 'log',
+    'TMath::Exp'  : 'exp',
+    'std::exp'    : 'exp',
+    'exp'         : 'exp'}
+# ----------------------
+class _Unsupported(Exception):
+    '''
+    Raised when an expression cannot be evaluated with numpy, such that ROOT is used instead
+    '''
+# ----------------------
+class _NumpyTranslator(ast.NodeTransformer):
+    '''
+    Class meant to transform the syntax tree of a C++ expression, parsed as Python,
+    into one that can be evaluated elementwise on numpy arrays.
+    Raises _Unsupported for anything else.
+    '''
+    # ----------------------
+    def __init__(self, columns : set[str]):
+        self._s_column = columns
+    # ----------------------
+    @staticmethod
+    def _numpy(name : str) -> ast.Attribute:
+        return ast.Attribute(value=ast.Name(id='numpy', ctx=ast.Load()), attr=name, ctx=ast.Load())
+    # ----------------------
+    def _call(self, name : str, args : list[ast.expr]) -> ast.Call:
+        return ast.Call(func=self._numpy(name), args=args, keywords=[])
+    # ----------------------
+    def visit_Expression(self, node : ast.Expression) -> ast.Expression: # pylint: disable=invalid-name
+        '''
+        Entry point
+        '''
+        node.body = self.visit(node.body)
+
+        return node
+    # ----------------------
+    def visit_BoolOp(self, node : ast.BoolOp) -> ast.Call: # pylint: disable=invalid-name
+        '''
+        &&, || -> numpy.logical_and, numpy.logical_or
+        '''
+        name = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+        expr = self.visit(node.values[0])
+        for value in node.values[1:]:
+            expr = self._call(name, [expr, self.visit(value)])
+
+        return expr
+    # ----------------------
+    def visit_UnaryOp(self, node : ast.UnaryOp) -> ast.expr: # pylint: disable=invalid-name
+        '''
+        ! -> numpy.logical_not
+        '''
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return self._call('logical_not', [operand])
+
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            return ast.UnaryOp(op=node.op, operand=operand)
+
+        raise _Unsupported(f'Unsupported unary operator: {node.op}')
+    # ----------------------
+    def visit_BinOp(self, node : ast.BinOp) -> ast.BinOp: # pylint: disable=invalid-name
+        '''
+        Only +, - and *, division of integers differs between C++ and python
+        '''
+        if not isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)):
+            raise _Unsupported(f'Unsupported operator: {node.op}')
+
+        return ast.BinOp(left=self.visit(node.left), op=node.op, right=self.visit(node.right))
+    # ----------------------
+    def visit_Compare(self, node : ast.Compare) -> ast.expr: # pylint: disable=invalid-name
+        '''
+        Chained comparisons, e.g. `1 < x < 3`, are left to ROOT. In C++ they mean
+        `(1 < x) < 3`, which differs from the python meaning
+        '''
+        if len(node.ops) > 1:
+            raise _Unsupported(f'Unsupported chained comparison: {ast.dump(node)}')
+
+        return ast.Compare(left=self.visit(node.left), ops=node.ops, comparators=[self.visit(node.comparators[0])])
+    # ----------------------
+    def visit_Call(self, node : ast.Call) -> ast.Call: # pylint: disable=invalid-name
+        '''
+        Only functions in _FUNCTIONS, already renamed
+        '''
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS.values() or node.keywords:
+            raise _Unsupported(f'Unsupported function call: {ast.dump(node)}')
+
+        return self._call(node.func.id, [ self.visit(arg) for arg in node.args ])
+    # ----------------------
+    def visit_Name(self, node : ast.Name) -> ast.Name: # pylint: disable=invalid-name
+        '''
+        Only columns
+        '''
+        if node.id not in self._s_column:
+            raise _Unsupported(f'Unsupported name: {node.id}')
+
+        return node
+    # ----------------------
+    def visit_Constant(self, node : ast.Constant) -> ast.expr: # pylint: disable=invalid-name
+        '''
+        Floating point constants are made double precision numpy scalars, such that
+        comparisons with single precision columns are done in double precision, as in C++
+        '''
+        if isinstance(node.value, bool) or isinstance(node.value, int):
+            return node
+
+        if isinstance(node.value, float):
+            return self._call('float64', [node])
+
+        raise _Unsupported(f'Unsupported constant: {node.value}')
+    # ----------------------
+    def generic_visit(self, node : ast.AST) -> ast.AST:
+        raise _Unsupported(f'Unsupported expression: {ast.dump(node)}')
+# ----------------------
+class FitInputStore:
+    '''
+    Class meant to store the candidates of a sample that pass a loose preselection.
+    For these candidates, the columns needed to build the fit inputs, e.g. the observable, the weights
+    and the variables used in the cuts, are saved as uncompressed `.npy` files, such that:
+
+    - The ROOT files are read only once per sample and preselection
+    - Cuts that change between categories and working points are applied as masks
+      on memory mapped arrays, through `get_mask`
+
+    The directory with the arrays is named after a hash of the input data identifier,
+    the preselection and the columns.
+    '''
+    # ----------------------
+    def __init__(
+        self,
+        rdf          : RDF.RNode,
+        uid          : str,
+        preselection : dict[str,str],
+        columns      : list[str],
+        out_dir      : Path):
+        '''
+        Parameters
+        -------------
+        rdf         : ROOT dataframe before any selection
+        uid         : Unique identifier of dataframe
+        preselection: Dictionary with names and expressions of cuts applied before storing the columns
+        columns     : Names of columns to store
+        out_dir     : Directory where the store directories are made
+        '''
+        self._rdf      = rdf
+        self._d_presel = preselection
+        self._l_column = sorted(set(columns))
+        hsh            = hashing.hash_object([uid, preselection, self._l_column])
+        self._path     = out_dir / hsh
+
+        self._d_array  : dict[str,numpy.ndarray] | None = None
+        self._df_ctf   : pnd.DataFrame | None           = None
+    # ----------------------
+    def _write(self, tmp_dir : Path) -> None:
+        '''
+        Runs over dataframe, with preselection, and saves arrays and cutflow
+        '''
+        rdf = self._rdf
+        for name, expr in self._d_presel.items():
+            rdf = rdf.Filter(expr, name)
+
+        rep    = rdf.Report()
+        d_data = rdf.AsNumpy(self._l_column)
+        d_ctf  = {'cut' : [], 'All' : [], 'Passed' : []}
+        if self._d_presel:
+            df_ctf = rut.rdf_report_to_df(rep=rep)
+            d_ctf  = df_ctf[['cut', 'All', 'Passed']].to_dict(orient='list')
+
+        for index, column in enumerate(self._l_column):
+            arr_val = d_data[column]
+            if arr_val.dtype == object:
+                raise ValueError(f'Cannot store column {column}, only scalar columns are supported')
+
+            numpy.save(tmp_dir / f'{index:03}.npy', arr_val)
+
+        data = {
+            'columns' : self._l_column,
+            'cutflow' : d_ctf}
+
+        with open(tmp_dir / _META_NAME, 'w', encoding='utf-8') as ofile:
+            json.dump(data, ofile, indent=2, default=int)
+    # ----------------------
+    def _make(self) -> None:
+        '''
+        Writes store in temporary directory and moves it, to avoid other
+        processes reading partially written stores
+        '''
+        tmp_dir = self._path.parent / f'.{self._path.name}.{os.getpid()}'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        log.info(f'Making store in: {self._path}')
+        try:
+            self._write(tmp_dir=tmp_dir)
+            os.rename(tmp_dir, self._path)
+        except OSError:
+            if not (self._path / _META_NAME).exists():
+                raise
+
+            log.debug(f'Store already made by other process: {self._path}')
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    # ----------------------
+    def _load(self) -> dict[str,numpy.ndarray]:
+        if self._d_array is not None:
+            return self._d_array
+
+        if not (self._path / _META_NAME).exists():
+            self._make()
+        else:
+            log.info(f'Loading store from: {self._path}')
+
+        with open(self._path / _META_NAME, encoding='utf-8') as ifile:
+            data = json.load(ifile)
+
+        self._d_array = { column : numpy.load(self._path / f'{index:03}.npy', mmap_mode='r')
+                          for index, column in enumerate(data['columns']) }
+        self._df_ctf  = pnd.DataFrame(data['cutflow'])
+
+        return self._d_array
+    # ----------------------
+    def get_column(self, name : str) -> numpy.ndarray:
+        '''
+        Parameters
+        -------------
+        name: Name of column
+
+        Returns
+        -------------
+        Memory mapped array with values of column, for candidates passing preselection
+        '''
+        d_array = self._load()
+        if name not in d_array:
+            raise KeyError(f'Column {name} not found in store: {self._path}')
+
+        return d_array[name]
+    # ----------------------
+    def _evaluate(self, expr : str) -> numpy.ndarray:
+        '''
+        Parameters
+        -------------
+        expr: Cut expression, in C++
+
+        Returns
+        -------------
+        Array of booleans, true for candidates passing cut
+        '''
+        d_array     = self._load()
+        body, l_col = rut.replace_columns(expr=expr, columns=set(d_array), prefix='col')
+        d_local     = { f'col{index}' : d_array[column] for index, column in enumerate(l_col) }
+
+        try:
+            arr_pass = _evaluate_numpy(body=body, arrays=d_local)
+        except (_Unsupported, SyntaxError) as exc:
+            log.debug(f'Evaluating with ROOT, {exc}: {expr}')
+            arr_pass = _evaluate_root(body=body, arrays=d_local)
+
+        arr_pass = numpy.broadcast_to(numpy.asarray(arr_pass, dtype=bool), (self.size,))
+
+        return arr_pass
+    # ----------------------
+    @property
+    def size(self) -> int:
+        '''
+        Number of candidates passing preselection
+        '''
+        d_array = self._load()
+        if len(d_array) == 0:
+            raise ValueError('No columns found in store')
+
+        return len(next(iter(d_array.values())))
+    # ----------------------
+    def get_mask(self, cuts : dict[str,str]) -> tuple[numpy.ndarray, pnd.DataFrame]:
+        '''
+        Parameters
+        -------------
+        cuts: Dictionary with names and expressions of cuts applied on top of preselection
+
+        Returns
+        -------------
+        Tuple with:
+
+        - Array of booleans, true for candidates passing preselection and cuts
+        - Cutflow, with preselection followed by cuts, same format as `rdf_report_to_df`
+        '''
+        arr_mask = numpy.ones(self.size, dtype=bool)
+        if self._df_ctf is None:
+            raise ValueError('Cutflow not loaded')
+
+        d_ctf  = self._df_ctf.to_dict(orient='list')
+        for name, expr in cuts.items():
+            nall      = int(arr_mask.sum())
+            arr_mask &= self._evaluate(expr=expr)
+
+            d_ctf['cut'   ].append(name)
+            d_ctf['All'   ].append(nall)
+            d_ctf['Passed'].append(int(arr_mask.sum()))
+
+        df = pnd.DataFrame(d_ctf)
+        df['Efficiency' ] = df['Passed'] / df['All'].replace(0, pnd.NA)
+        df['Cummulative'] = df['Efficiency'].cumprod()
+
+        return arr_mask, df
+# ----------------------
+def _replace_negations(expr : str) -> str:
+    '''
+    Parameters
+    -------------
+    expr: C++ expression
+
+    Returns
+    -------------
+    Expression where `!(...)` is replaced by `(not (...))`, which keeps the C++ precedence,
+    e.g. `!(a) == 1` is `(!a) == 1`, and not `not (a == 1)` as in Python.
+    Raises _Unsupported if `!` is used in any other way, e.g. `!a`
+    '''
+    index = 0
+    while True:
+        index = expr.find('!', index)
+        if index == -1:
+            return expr
+
+        if expr.startswith('!=', index):
+            index += 2
+            continue
+
+        start = index + 1
+        while start < len(expr) and expr[start].isspace():
+            start += 1
+
+        if start == len(expr) or expr[start] != '(':
+            raise _Unsupported(f'Negation not followed by parenthesis: {expr}')
+
+        depth = 0
+        for end in range(start, len(expr)):
+            depth += {'(' : 1, ')' : -1}.get(expr[end], 0)
+            if depth == 0:
+                break
+        else:
+            raise _Unsupported(f'Unbalanced parenthesis: {expr}')
+
+        expr = f'{expr[:index]}(not {expr[start:end + 1]}){expr[end + 1:]}'
+# ----------------------
+def _evaluate_numpy(body : str, arrays : dict[str,numpy.ndarray]) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    body  : C++ expression with columns replaced by keys of `arrays`
+    arrays: Dictionary with arrays
+
+    Returns
+    -------------
+    Result of expression evaluated with numpy
+    '''
+    expr = body.replace('&&', ' and ').replace('||', ' or ')
+    expr = _replace_negations(expr=expr)
+    expr = re.sub(r'\btrue\b' , 'True' , expr)
+    expr = re.sub(r'\bfalse\b', 'False', expr)
+    for cpp_name, np_name in _FUNCTIONS.items():
+        expr = re.sub(rf'(?<![\w:]){re.escape(cpp_name)}(?=\s*\()', np_name, expr)
+
+    tree = ast.parse(expr.strip(), mode='eval')
+    tree = _NumpyTranslator(columns=set(arrays)).visit(tree)
+    tree = ast.fix_missing_locations(tree)
+    code = compile(tree, filename='<cut>', mode='eval')
+
+    return eval(code, {'numpy' : numpy, '__builtins__' : {}}, arrays) # pylint: disable=eval-used
+# ----------------------
+def _evaluate_root(body : str, arrays : dict[str,numpy.ndarray]) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    body  : C++ expression with columns replaced by keys of `arrays`
+    arrays: Dictionary with arrays
+
+    Returns
+    -------------
+    Result of expression evaluated by ROOT, running over arrays in memory
+    '''
+    if len(arrays) == 0:
+        raise ValueError(f'Expression does not depend on any column: {body}')
+
+    d_data = { name : numpy.ascontiguousarray(arr_val) for name, arr_val in arrays.items() }
+    rdf    = RDF.FromNumpy(d_data)
+    rdf    = rdf.Define('fit_input_store_pass', f'static_cast<bool>({body})')
+
+    return rdf.AsNumpy(['fit_input_store_pass'])['fit_input_store_pass']
+# ----------------------
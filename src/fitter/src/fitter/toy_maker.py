@@ -6,13 +6,18 @@ import tqdm
 import yaml
 import math
 import numpy
+import multiprocessing
 import pandas     as pnd
 
+from typing             import Callable
+from concurrent.futures import ProcessPoolExecutor
+
 from dmu         import LogLevels, LogStore
 from dmu.generic import rxran
 from dmu.stats   import minimizers, zfit
 from dmu.stats   import tensorflow as tf
 from dmu.stats   import Constraint
+from dmu.stats   import build_constraint
 from dmu.stats   import GofCalculator
 from dmu.stats   import MinimizerFailError
 from dmu.stats   import FitResult
@@ -36,6 +41,10 @@ class ToyConf(BaseModel):
     output_directory: Directory where files (e.g. parquet files) will be saved
     rseed           : Random seed will be a Cantor mapping of rseed and index of toy
     ntoys           : Number of toys
+    batch_size      : Number of toys whose datasets are sampled together, from one call to the model.
+                      Only used with model based samplers. If 1 (default), each dataset is sampled separately.
+    nworkers        : Number of processes fitting toys. If 1 (default), toys are fitted in this process.
+                      Otherwise, the `ToyMaker` needs a factory to rebuild the likelihood in each process.
     '''
     model_config = ConfigDict(frozen=True)
 
@@ -43,12 +52,105 @@ class ToyConf(BaseModel):
     output_directory : Path
     ntoys            : int
     rseed            : int
+    batch_size       : int = 1
+    nworkers         : int = 1
     # ----------------
     def __str__(self) -> str:
         data = self.model_dump()
 
         return yaml.safe_dump(data)
 # ----------------------
+class _ToyOutput(BaseModel):
+    '''
+    Class meant to hold the outcome of one toy, such that it can be sent
+    from the processes fitting toys
+
+    Attributes
+    --------------------
+    itoy : Index of toy
+    total: Yield of all samplers
+    hash : Sum of values of masses for all samplers
+    res  : Result of fit, None if the minimization failed
+    '''
+    model_config = ConfigDict(frozen=True)
+
+    itoy  : int
+    total : int
+    hash  : int
+    res   : FitResult | None
+# ----------------------
+class _ParameterBuffer:
+    '''
+    Class meant to hold the fitted parameters of all the toys in preallocated arrays,
+    one per column of the output dataframe, such that the latter is made only once
+    '''
+    # ----------------------
+    def __init__(self, ntoys : int, generated : dict[str,float]):
+        '''
+        Parameters
+        -------------
+        ntoys    : Number of toys, used to allocate arrays
+        generated: Dictionary between parameter names and values used to generate toys
+        '''
+        self._ntoys  = ntoys
+        self._d_gen  = generated
+        self._nrows  = 0
+        self._d_arr  : dict[str,numpy.ndarray] = {}
+    # ----------------------
+    def _allocate(self, npar : int) -> None:
+        size         = self._ntoys * npar
+        self._d_arr  = {
+            'Parameter' : numpy.empty(size, dtype=object),
+            'Value'     : numpy.full(size, math.nan),
+            'Error'     : numpy.full(size, math.nan),
+            'Gen'       : numpy.full(size, math.nan),
+            'Toy'       : numpy.zeros(size, dtype='int64'),
+            'GOF'       : numpy.full(size, math.nan),
+            'Valid'     : numpy.zeros(size, dtype=bool),
+            'Hash'      : numpy.zeros(size, dtype='int64')}
+    # ----------------------
+    def add(self, res : FitResult, hash : int, itoy : int) -> None:
+        '''
+        Parameters
+        -------------
+        res : FitResult object from last fit
+        hash: Sum of values of masses for all samplers
+        itoy: Index for current fit
+        '''
+        l_par = res.parameters
+        if not self._d_arr:
+            self._allocate(npar=len(l_par))
+
+        start = self._nrows
+        end   = start + len(l_par)
+        if end > len(self._d_arr['Toy']):
+            raise ValueError(f'Cannot add {len(l_par)} parameters for toy {itoy}, buffer is full')
+
+        self._d_arr['Parameter'][start:end] = [ par.name for par in l_par ]
+        self._d_arr['Value'    ][start:end] = [ math.nan if par.value is None else par.value for par in l_par ]
+        self._d_arr['Error'    ][start:end] = [ math.nan if par.error is None else par.error for par in l_par ]
+        self._d_arr['Gen'      ][start:end] = [ self._d_gen.get(par.name, math.nan) for par in l_par ]
+        self._d_arr['Toy'      ][start:end] = itoy
+        self._d_arr['GOF'      ][start:end] = -1 if res.gof is None else res.gof.pval
+        self._d_arr['Valid'    ][start:end] = res.valid
+        self._d_arr['Hash'     ][start:end] = hash
+
+        self._nrows = end
+    # ----------------------
+    def to_pandas(self) -> pnd.DataFrame:
+        '''
+        Returns
+        -------------
+        Dataframe with one row per parameter and toy
+        '''
+        columns = ['Parameter', 'Value', 'Error', 'Gen', 'Toy', 'GOF', 'Valid', 'Hash']
+        if not self._d_arr:
+            return pnd.DataFrame(columns=columns)
+
+        data = { name : arr[:self._nrows] for name, arr in self._d_arr.items() }
+
+        return pnd.DataFrame(data, columns=columns)
+# ----------------------
 class ToyMaker:
     '''
     This class is meant to:
@@ -57,30 +159,40 @@ class ToyMaker:
     - Recreate them with toy data
     - Minimize them
     - Collect the results of the fits in a pandas dataframe and return it
+
+    The toy datasets can be sampled in batches, see `ToyConf.batch_size`, and
+    fitted in several processes, see `ToyConf.nworkers`.
     '''
+    # Toy maker, likelihood, samplers and batch size of a process fitting toys, see `_initialize_worker`
+    _worker : tuple['ToyMaker', zlos, list[SamplerData], int] | None = None
     # ----------------------
     def __init__(
         self,
-        nll   : zlos,
-        cns   : list[Constraint],
-        res   : FitResult,
-        cfg   : ToyConf):
+        nll     : zlos,
+        cns     : list[Constraint],
+        res     : FitResult,
+        cfg     : ToyConf,
+        factory : Callable[[], zlos] | None = None):
         '''
         Parameters
         -------------
-        nll  : Zfit negativve log likelihood instance
-        res  : Result of actual fit to data. Used to make sure
-               toys are generaged with the correct initial parameters
-        cfg  : omegaconf dictionary controlling configuration
-        cns  : List of constraints, needed for resampling between toys
+        nll    : Zfit negativve log likelihood instance
+        res    : Result of actual fit to data. Used to make sure
+                 toys are generaged with the correct initial parameters
+        cfg    : omegaconf dictionary controlling configuration
+        cns    : List of constraints, needed for resampling between toys
+        factory: Picklable callable, e.g. module level function, returning a likelihood equivalent to `nll`.
+                 Needed to rebuild the likelihood in each process, when fitting with several processes
         '''
 
         self._ana_dir = Path(os.environ['ANADIR'])
 
-        self._nll   = nll
-        self._res   = res
-        self._cfg   = cfg
-        self._cns   = [ cons.calibrate(result = res) for cons in cns ]
+        self._nll     = nll
+        self._res     = res
+        self._cfg     = cfg
+        self._factory = factory
+        self._l_cons  = [ cons.model_dump() for cons in cns ] # Sent to processes fitting toys
+        self._cns     = [ cons.calibrate(result = res) for cons in cns ]
 
         for cons in self._cns:
             log.debug(cons)
@@ -96,43 +208,27 @@ class ToyMaker:
         else:
             log.debug('Running with CPU')
     # ----------------------
-    def _add_parameters(
-        self,
-        df  : pnd.DataFrame,
-        res : FitResult,
-        hash: int,
-        itoy: int) -> pnd.DataFrame:
+    def _get_generated(self) -> dict[str,float]:
         '''
-        Parameters
+        Returns
         -------------
-        df  : Pandas dataframe with potentially information already in it
-        res : FitResult object from last fit
-        hash: Sum of values of masses for all samplers
-        itoy: Index for current fit
+        Dictionary between names of parameters and values used to generate toys
+        '''
+        return { par.name : math.nan if par.value is None else par.value for par in self._res.parameters }
+    # ----------------------
+    def _set_parameters(self, nll : zlos) -> None:
+        '''
+        Sets the parameters of the likelihood to the values used to generate the toys, such that
+        every fit starts from the same point, regardless of the toys fitted before in the process
 
-        Returns
+        Parameters
         -------------
-        Input pandas dataframe with extra rows added
-        It will add one row per parameter
-        '''
-        pvalue = -1 if res.gof is None else res.gof.pval
-
-        for parameter in res.parameters:
-            nrows            = len(df)
-            name             = parameter.name
-            fit_val, fit_err = res[name]
-            gen_val, _       = self._res.get(name = name, fall_back = math.nan)
-            df.loc[nrows]    = [
-                name, 
-                fit_val,
-                fit_err,
-                gen_val, 
-                itoy, 
-                pvalue, 
-                res.valid,
-                hash]
+        nll: Likelihood whose parameters are set
+        '''
+        d_val = { name : value for name, value in self._get_generated().items() if not math.isnan(value) }
+        l_par = [ par for par in nll.get_params(floating=None) if par.name in d_val ]
 
-        return df
+        zfit.param.set_values(l_par, [ d_val[par.name] for par in l_par ])
     # ----------------------
     def _print_parameters(self) -> None:
         '''
@@ -162,13 +258,48 @@ class ToyMaker:
         log.debug(res)
         log.debug(30 * '-')
     # ----------------------
+    def _sample_batch(
+        self,
+        samplers : list[SamplerData],
+        size     : int) -> list[dict[str,numpy.ndarray]]:
+        '''
+        Parameters
+        -------------
+        samplers: List of samplers, made from the models in the likelihood, in the same order
+        size    : Number of toys in batch
+
+        Returns
+        -------------
+        List with one element per toy, each is a dictionary between sampler name and toy data
+        '''
+        l_data : list[dict[str,numpy.ndarray]] = [ {} for _ in range(size) ]
+        for model, sampler in zip(self._nll.model, samplers):
+            d_par = { par.name : par for par in model.get_params(floating=None, is_yield=None) }
+            d_val = sampler.params
+            l_par = [ d_par[name] for name in d_val ]
+
+            # Sample with values of parameters used to create sampler, as done in resample
+            with zfit.param.set_values(l_par, list(d_val.values())):
+                nexp    = float(model.get_yield().value()) if model.is_extended else sampler.n_events
+                arr_cnt = numpy.random.poisson(lam=nexp, size=size) if model.is_extended else numpy.full(size, nexp, dtype=int)
+                arr_val = model.sample(n=int(arr_cnt.sum())).numpy()
+
+            name = self._sampler_name(sampler = sampler)
+            for data, arr_toy in zip(l_data, numpy.split(arr_val, numpy.cumsum(arr_cnt)[:-1])):
+                data[name] = arr_toy
+
+        return l_data
+    # ----------------------
     def _resample(
         self, 
-        samplers : list[SamplerData]) -> int:
+        samplers : list[SamplerData],
+        data     : dict[str,numpy.ndarray] | None = None) -> int:
         '''
         Parameters
         -------------
         samplers: List of samplers, i.e. proxies to data
+        data    : Optional, dictionary between sampler names and toy data, already sampled
+                  If not passed, each sampler will be resampled
 
         Returns
         -------------
@@ -185,9 +316,12 @@ class ToyMaker:
         log.debug(30 * '-')
         log.debug('Resampling samplers')
         log.debug(30 * '-')
-        for sampler in sorted_samplers.values():
+        for name, sampler in sorted_samplers.items():
             old_value  = sampler.n_events
-            sampler.resample()
+            if data is None:
+                sampler.resample()
+            else:
+                sampler.update_data(sample=data[name])
             new_value  = sampler.n_events
 
             log.debug(f'Yield: {old_value} --> {new_value}')
@@ -323,37 +457,26 @@ class ToyMaker:
 
             log.debug(f'{name:<20}{size:<20}')
     # ----------------------
-    def get_parameter_information(
-        self, 
-        name     : str,
-        update   : bool = True,
-        samplers : list[SamplerData] | None = None) -> pnd.DataFrame:
+    def _prepare(self, samplers : list[SamplerData] | None) -> tuple[zlos, list[SamplerData], int]:
         '''
         Parameters
         ------------
-        name    : Prefix of parquet file with toy fits parameter, i.e. {NAME}_{SEED}.parquet
-        update  : By default True, it will create the file even if already found
-        samplers: By default None. If not None, will use these samplers to make toys.
+        samplers: If not None, will use these samplers to make toys, otherwise they are made from the models
 
         Returns
         ------------
-        Pandas dataframe where each row represents a parameter
+        Tuple with likelihood using the samplers, the samplers and the number of toys sampled together
         '''
-        fname = f'{name}_{self._cfg.rseed:03}.parquet'
-        fpath = self._ana_dir / self._cfg.output_directory / fname
-
-        if not update and fpath.exists():
-            log.info(f'Output already found, reusing: {fpath}')
-            return pnd.read_parquet(path = fpath)
-
-        self._print_parameters()
-
+        batch_size = self._cfg.batch_size
         if samplers is None:
             log.info('Using model based sampler for toys')
             samplers = [ model.create_sampler() for model in self._nll.model ]
         else:
             log.warning('Using custom sampler for toys')
             samplers = self._sort_samplers(samplers = samplers)
+            if batch_size > 1:
+                log.warning('Cannot sample custom samplers in batches, sampling one toy at a time')
+                batch_size = 1
 
         zfit_cns  = [ cons.zfit_cons(holder = self._nll) for cons in self._cns ]
 
@@ -366,28 +489,76 @@ class ToyMaker:
         if nll is None:
             raise ValueError('Failed to create NLL with sampler')
 
-        log.debug('Running toys with config:')
-        log.debug(self._cfg)
+        return nll, samplers, batch_size
+    # ----------------------
+    def _get_batches(self, batch_size : int) -> list[list[int]]:
+        '''
+        Parameters
+        ------------
+        batch_size: Number of toys sampled together
 
-        l_total = []
-        columns = ['Parameter', 'Value', 'Error', 'Gen', 'Toy', 'GOF', 'Valid', 'Hash']
-        df      = pnd.DataFrame(columns=columns)
+        Returns
+        ------------
+        List of batches, each is the list of indices of its toys, starting at 1
+        '''
+        l_itoy = list(range(1, self._cfg.ntoys + 1))
 
-        n_lost  = 0
-        for itoy in tqdm.tqdm(range(1, self._cfg.ntoys + 1), ascii=' -'):
-            seed = self._cfg.rseed
+        return [ l_itoy[start:start + batch_size] for start in range(0, self._cfg.ntoys, batch_size) ]
+    # ----------------------
+    def _run_batch(
+        self,
+        nll        : zlos,
+        samplers   : list[SamplerData],
+        batch_size : int,
+        ibatch     : int,
+        l_itoy     : list[int]) -> list[_ToyOutput]:
+        '''
+        Samples and fits the toys of one batch. The random seeds depend only on the indices
+        of the batch and the toys, i.e. the toys do not depend on the process fitting them
+
+        Parameters
+        ------------
+        nll       : Likelihood using the samplers
+        samplers  : Samplers, i.e. proxies to the toy data
+        batch_size: Number of toys sampled together, if 1, each sampler is resampled for each toy
+        ibatch    : Index of batch, starting at 0
+        l_itoy    : Indices of toys in batch
+
+        Returns
+        ------------
+        List with outcome of each toy
+        '''
+        seed    = self._cfg.rseed
+        l_batch : list[dict[str,numpy.ndarray]] = []
+        if batch_size > 1:
+            # Indices after the ones of the toys, to get seeds different from those of the toys
+            with rxran.seed(value = seed, index = self._cfg.ntoys + ibatch + 1):
+                log.debug(f'Sampling batch of {len(l_itoy)} toys with: {seed}/{ibatch}')
+                l_batch = self._sample_batch(samplers = samplers, size = len(l_itoy))
+
+        l_out = []
+        for itoy in l_itoy:
             with rxran.seed(value = seed, index = itoy):
                 log.debug(f'Resampling with: {seed}/{itoy}')
-                total = self._resample(samplers = samplers)
-                l_total.append(total)
+                data  = l_batch.pop(0) if l_batch else None
+                total = self._resample(samplers = samplers, data = data)
+
+            hashes = [ self._sampler_identifier(sampler = sam) for sam in samplers ]
+            hash   = sum(hashes)
+            log.debug(30 * '-')
+            log.debug(f'Hash: {hash}')
+            log.debug(f'Toy : {itoy}')
+            log.debug(f'Seed: {seed}')
+            log.debug(30 * '-')
 
+            self._set_parameters(nll = nll)
             with GofCalculator.disabled(value = not self._cfg.fit_conf.run_gof):
                 try:
                     obj = minimizers.minimize(
-                        nll = nll, 
+                        nll = nll,
                         cfg = self._cfg.fit_conf)
                 except MinimizerFailError:
-                    n_lost += 1
+                    l_out.append(_ToyOutput(itoy = itoy, total = total, hash = hash, res = None))
                     continue
 
                 if isinstance(obj, zres):
@@ -398,31 +569,165 @@ class ToyMaker:
                 if log.getEffectiveLevel() < LogLevels.info:
                     self._print_result(res = res, msg = 'Toy fit')
 
-            hashes = [ self._sampler_identifier(sampler = sam) for sam in samplers ]
-            hash   = sum(hashes)
-            log.debug(30 * '-')
-            log.debug(f'Hash: {hash}')
-            log.debug(f'Toy : {itoy}')
-            log.debug(f'Seed: {self._cfg.rseed}')
-            log.debug(30 * '-')
+            l_out.append(_ToyOutput(itoy = itoy, total = total, hash = hash, res = res))
+
+        return l_out
+    # ----------------------
+    def _run_serially(self, samplers : list[SamplerData] | None) -> list[_ToyOutput]:
+        '''
+        Parameters
+        ------------
+        samplers: If not None, will use these samplers to make toys
+
+        Returns
+        ------------
+        List with outcome of each toy
+        '''
+        nll, samplers, batch_size = self._prepare(samplers = samplers)
+
+        l_out = []
+        for ibatch, l_itoy in enumerate(tqdm.tqdm(self._get_batches(batch_size = batch_size), ascii=' -')):
+            l_out += self._run_batch(
+                nll        = nll,
+                samplers   = samplers,
+                batch_size = batch_size,
+                ibatch     = ibatch,
+                l_itoy     = l_itoy)
+
+        return l_out
+    # ----------------------
+    @classmethod
+    def _initialize_worker(
+        cls,
+        factory : Callable[[], zlos],
+        cns     : list[dict],
+        res     : FitResult,
+        cfg     : ToyConf) -> None:
+        '''
+        Runs once in each process fitting toys. Rebuilds the likelihood and keeps it,
+        with its samplers, for the batches sent to this process
+
+        Parameters
+        ------------
+        factory: Callable returning likelihood
+        cns    : Constraints, as dictionaries
+        res    : Result of fit to data
+        cfg    : Configuration for toys
+        '''
+        nll = factory()
+        mkr = ToyMaker(
+            nll = nll,
+            res = res,
+            cfg = cfg,
+            cns = [ build_constraint(data = data) for data in cns ])
+
+        # Samplers are made with the values of the parameters in the likelihood
+        mkr._set_parameters(nll = nll)
+        nll_toy, samplers, batch_size = mkr._prepare(samplers = None)
+
+        cls._worker = mkr, nll_toy, samplers, batch_size
+    # ----------------------
+    @classmethod
+    def _run_worker_batch(cls, ibatch : int, l_itoy : list[int]) -> list[_ToyOutput]:
+        '''
+        Runs in process fitting toys, see `_run_batch`
+        '''
+        if cls._worker is None:
+            raise RuntimeError('Process fitting toys was not initialized')
+
+        mkr, nll, samplers, batch_size = cls._worker
+
+        return mkr._run_batch(
+            nll        = nll,
+            samplers   = samplers,
+            batch_size = batch_size,
+            ibatch     = ibatch,
+            l_itoy     = l_itoy)
+    # ----------------------
+    def _run_in_parallel(self) -> list[_ToyOutput]:
+        '''
+        Fits toys in `nworkers` processes, each holding a likelihood built by the factory.
+        Processes are spawned, not forked, since forking after TensorFlow started its threads can deadlock
+
+        Returns
+        ------------
+        List with outcome of each toy
+        '''
+        if self._factory is None:
+            raise ValueError('A factory for the likelihood is needed to fit toys with several processes')
+
+        l_batch  = self._get_batches(batch_size = self._cfg.batch_size)
+        nworkers = min(self._cfg.nworkers, len(l_batch))
+        log.info(f'Fitting {self._cfg.ntoys} toys in {len(l_batch)} batches with {nworkers} processes')
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers = nworkers,
+            mp_context  = context,
+            initializer = ToyMaker._initialize_worker,
+            initargs    = (self._factory, self._l_cons, self._res, self._cfg)) as pool:
+            l_result = pool.map(ToyMaker._run_worker_batch, range(len(l_batch)), l_batch)
+            l_out    = [ out for l_batch_out in tqdm.tqdm(l_result, total=len(l_batch), ascii=' -') for out in l_batch_out ]
+
+        return l_out
+    # ----------------------
+    def get_parameter_information(
+        self,
+        name     : str,
+        update   : bool = True,
+        samplers : list[SamplerData] | None = None) -> pnd.DataFrame:
+        '''
+        Parameters
+        ------------
+        name    : Prefix of parquet file with toy fits parameter, i.e. {NAME}_{SEED}.parquet
+        update  : By default True, it will create the file even if already found
+        samplers: By default None. If not None, will use these samplers to make toys.
+                  These cannot be sent to other processes, i.e. the toys will be fitted in this one
+
+        Returns
+        ------------
+        Pandas dataframe where each row represents a parameter
+        '''
+        fname = f'{name}_{self._cfg.rseed:03}.parquet'
+        fpath = self._ana_dir / self._cfg.output_directory / fname
+
+        if not update and fpath.exists():
+            log.info(f'Output already found, reusing: {fpath}')
+            return pnd.read_parquet(path = fpath)
+
+        self._print_parameters()
+
+        log.debug('Running toys with config:')
+        log.debug(self._cfg)
+
+        if self._cfg.nworkers > 1 and samplers is None:
+            l_out = self._run_in_parallel()
+        else:
+            if self._cfg.nworkers > 1:
+                log.warning('Cannot send custom samplers to other processes, fitting toys in this one')
+            l_out = self._run_serially(samplers = samplers)
+
+        buf    = _ParameterBuffer(ntoys = self._cfg.ntoys, generated = self._get_generated())
+        n_lost = 0
+        for out in sorted(l_out, key = lambda out : out.itoy):
+            if out.res is None:
+                n_lost += 1
+                continue
 
-            df = self._add_parameters(
-                df  = df,
-                res = res,
-                hash= hash, 
-                itoy= itoy)
+            buf.add(res = out.res, hash = out.hash, itoy = out.itoy)
 
         if n_lost:
             log.warning(f'Found {n_lost}/{self._cfg.ntoys} failed fits')
         else:
             log.info('No failed fits')
 
-        self._print_yield_stats(yields = l_total)
+        self._print_yield_stats(yields = [ out.total for out in l_out ])
 
         fpath.parent.mkdir(parents = True, exist_ok = True)
 
         log.info(f'Saving to: {fpath}')
-        df = df.sort_values(by = 'Parameter')
+        df = buf.to_pandas()
+        df = df.sort_values(by = 'Parameter', kind = 'stable')
         df.to_parquet(fpath)
 
         return df
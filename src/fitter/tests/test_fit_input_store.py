@@ -0,0 +1,69 @@
+'''
+Module with tests for FitInputStore class
+'''
+from pathlib import Path
+
+import numpy
+import pytest
+from ROOT          import RDF # type: ignore
+
+from dmu           import LogStore
+from fitter        import FitInputStore
+
+log=LogStore.add_logger('fitter:test_fit_input_store')
+# ----------------------
+@pytest.fixture(scope='session', autouse=True)
+def initialize():
+    '''
+    This will run before any test
+    '''
+    LogStore.set_level('fitter:fit_input_store', 10)
+# ----------------------
+def _get_rdf() -> RDF.RNode:
+    rng    = numpy.random.default_rng(seed=10)
+    nentry = 10_000
+    d_data = {
+        'mass'  : rng.uniform(5000, 6000, size=nentry),
+        'weight': rng.uniform(0, 1, size=nentry),
+        'mva'   : rng.uniform(0, 1, size=nentry).astype('float32'),
+        'nbrem' : rng.integers(0, 3, size=nentry).astype('int32')}
+
+    return RDF.FromNumpy(d_data)
+# ----------------------
+@pytest.mark.parametrize('cuts', [
+    {'brem' : 'nbrem == 1', 'mva' : 'mva > 0.3'},
+    {'brem' : '!(nbrem != 1) && TMath::Abs(mva - 0.5) < 0.2'},
+    {'brem' : 'nbrem % 2 == 1', 'mva' : 'mva / 2 > 0.15'},
+    {'brem' : '!(nbrem) == 1'   , 'mva' : '!(mva < 0.3) && nbrem != 2'},
+    {'brem' : '!nbrem == 0'     , 'mva' : 'mva > 0.3'},
+    {'brem' : '0 < nbrem < 2'   , 'mva' : '0.2 < mva < 0.5'}])
+def test_mask(tmp_path : Path, cuts : dict[str,str]):
+    '''
+    Compares candidates selected with masks with the ones selected by ROOT
+    '''
+    d_pre = {'mass' : 'mass > 5200'}
+
+    rdf   = _get_rdf()
+    for name, expr in (d_pre | cuts).items():
+        rdf = rdf.Filter(expr, name)
+
+    arr_exp = rdf.AsNumpy(['mass'])['mass']
+
+    for _ in range(2):
+        store = FitInputStore(
+            rdf         = _get_rdf(),
+            uid         = 'test_mask',
+            preselection= d_pre,
+            columns     = ['mass', 'weight', 'mva', 'nbrem'],
+            out_dir     = tmp_path)
+
+        arr_mask, df = store.get_mask(cuts=cuts)
+        arr_mas      = store.get_column(name='mass')[arr_mask]
+
+        assert numpy.array_equal(arr_mas, arr_exp)
+        assert df['cut'].tolist() == ['mass'] + list(cuts)
+        assert df['Passed'].iloc[-1] == len(arr_exp)
+
+    l_dir = [ path for path in tmp_path.iterdir() ]
+    assert len(l_dir) == 1
+# ----------------------
@@ -3,6 +3,7 @@ This module tests the class ToyMaker
 '''
 import pytest
 import mplhep
+import pandas            as pnd
 import matplotlib.pyplot as plt
 
 from pathlib     import Path
@@ -21,6 +22,23 @@ from dmu         import LogStore
 
 log=LogStore.add_logger('fitter:test_toymaker')
 # ----------------------
+def _get_nll_with_constraints() -> ExtendedUnbinnedNLL:
+    '''
+    Factory of likelihood, called by processes fitting toys in `test_parallel`.
+    These do not run the fixture, thus the naming convention is disabled here
+    '''
+    cns_dt= gut.load_data(package='fitter_data', fpath='tests/fits/constraint_adder.yaml')
+    cns   = [ build_constraint(data=block) for block in cns_dt.values() ] 
+
+    with FitParameter.enforce_naming_convention(value = False):
+        nll = get_nll(kind='s+b', suffix = '')
+        adr = ConstraintAdder(nll = nll, constraints = cns)
+        nll = adr.get_nll()
+
+    assert isinstance(nll, ExtendedUnbinnedNLL)
+
+    return nll
+# ----------------------
 @pytest.fixture(scope='module', autouse=True)
 def initialize():
     '''
@@ -75,6 +93,83 @@ def test_simple(tmp_path: Path) -> None:
     pars  = nll.get_params()
     assert len(df) == cfg.ntoys * len(pars) 
 # ----------------------
+@pytest.mark.parametrize('batch_size', [3, 7])
+def test_batched(tmp_path: Path, batch_size : int) -> None:
+    '''
+    Tests ToyMaker when sampling toy datasets in batches
+    '''
+    log.info('')
+    nll   = get_nll(kind='s+b', suffix = '')
+
+    cfg_dt= gut.load_data(package='fitter_data', fpath='tests/toys/toy_maker.yaml')
+    cfg   = ToyConf(**cfg_dt)
+    cfg   = cfg.model_copy(update = {'batch_size' : batch_size})
+
+    cns_dt= gut.load_data(package='fitter_data', fpath='tests/fits/constraint_adder.yaml')
+    cns   = [ build_constraint(data=block) for block in cns_dt.values() ] 
+
+    assert isinstance(nll, ExtendedUnbinnedNLL)
+    adr = ConstraintAdder(nll = nll, constraints = cns)
+    nll = adr.get_nll()
+
+    min = zfit.minimize.Minuit()
+    res = min.minimize(loss = nll)
+    res.hesse(name = 'minuit_hesse')
+
+    with gut.environment(mapping = {'ANADIR' : str(tmp_path)}):
+        mkr   = ToyMaker(
+            nll=nll, 
+            res=FitResult.from_zfit(res), 
+            cfg=cfg, 
+            cns=cns)
+        df    = mkr.get_parameter_information(name = 'test')
+
+    pars  = nll.get_params()
+    assert len(df) == cfg.ntoys * len(pars) 
+
+    # Every toy should have its own dataset
+    assert df['Hash'].nunique() == cfg.ntoys
+# ----------------------
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_parallel(tmp_path: Path, batch_size : int) -> None:
+    '''
+    Tests that fitting toys with several processes gives the same toys
+    and fits as fitting them in this process
+    '''
+    log.info('')
+    nll   = _get_nll_with_constraints()
+
+    cfg_dt= gut.load_data(package='fitter_data', fpath='tests/toys/toy_maker.yaml')
+    cfg   = ToyConf(**cfg_dt)
+    cfg   = cfg.model_copy(update = {'batch_size' : batch_size, 'ntoys' : 8})
+
+    cns_dt= gut.load_data(package='fitter_data', fpath='tests/fits/constraint_adder.yaml')
+    cns   = [ build_constraint(data=block) for block in cns_dt.values() ] 
+
+    min = zfit.minimize.Minuit()
+    res = min.minimize(loss = nll)
+    res.hesse(name = 'minuit_hesse')
+
+    d_df = {}
+    for nworkers in [1, 2]:
+        with gut.environment(mapping = {'ANADIR' : str(tmp_path)}):
+            mkr = ToyMaker(
+                nll    =nll, 
+                res    =FitResult.from_zfit(res), 
+                cfg    =cfg.model_copy(update = {'nworkers' : nworkers}), 
+                cns    =cns,
+                factory=_get_nll_with_constraints)
+            d_df[nworkers] = mkr.get_parameter_information(name = f'test_{nworkers:03}')
+
+    df_ser = d_df[1]
+    df_par = d_df[2]
+
+    assert df_par['Hash'].nunique() == cfg.ntoys
+    # Same toy datasets, fits agree up to the precision of the minimizer
+    assert df_ser['Hash'].to_list() == df_par['Hash'].to_list()
+    assert df_ser['Toy' ].to_list() == df_par['Toy' ].to_list()
+    pnd.testing.assert_frame_equal(df_ser, df_par, rtol=1e-3)
+# ----------------------
 @pytest.mark.parametrize('ntoys', [100])
 def test_integration(
     tmp_path : Path,
@@ -12,11 +12,41 @@ from dmu.logging.log_store import LogStore
 
 log = LogStore.add_logger('post_ap:data_vars_adder')
 # -------------------------------------
+def _load_yaml(name : str):
+    path = files('post_ap_data').joinpath(f'selection/{name}')
+    path = str(path)
+    with open(path, encoding='utf-8') as ifile:
+        return yaml.safe_load(ifile)
+# -------------------------------------
+def _sort_intervals(
+    arr_low : numpy.ndarray,
+    arr_hig : numpy.ndarray,
+    kind    : str) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    arr_low/hig: Arrays with inclusive bounds of intervals
+    kind       : Type of interval, used for messages
+
+    Returns
+    -------------
+    Array of indices that sort the intervals. Raises if intervals are invalid or overlap,
+    such that a value can be found in at most one interval with a binary search
+    '''
+    if numpy.any(arr_hig < arr_low):
+        raise ValueError(f'Found {kind} interval with upper bound below lower bound')
+
+    arr_ind = numpy.argsort(arr_low, kind='stable')
+    arr_low = arr_low[arr_ind]
+    arr_hig = arr_hig[arr_ind]
+
+    if numpy.any(arr_low[1:] <= arr_hig[:-1]):
+        raise ValueError(f'Found overlapping {kind} intervals')
+
+    return arr_ind
+# -------------------------------------
 def _get_good_runs() -> tuple[numpy.ndarray, numpy.ndarray]:
-    runs_path = files('post_ap_data').joinpath('selection/good_runs.yaml')
-    runs_path = str(runs_path)
-    with open(runs_path, encoding='utf-8') as ifile:
-        l_runs = yaml.safe_load(ifile)
+    l_runs = _load_yaml(name='good_runs.yaml')
 
     l_low = []
     l_hig = []
@@ -32,54 +62,50 @@ def _get_good_runs() -> tuple[numpy.ndarray, numpy.ndarray]:
         l_low.append(low_run)
         l_hig.append(hig_run)
 
-    arr_low = numpy.array(l_low)
-    arr_hig = numpy.array(l_hig)
+    arr_low = numpy.array(l_low, dtype='int64')
+    arr_hig = numpy.array(l_hig, dtype='int64')
+    arr_ind = _sort_intervals(arr_low=arr_low, arr_hig=arr_hig, kind='good run')
 
-    return arr_low, arr_hig
+    return arr_low[arr_ind], arr_hig[arr_ind]
+# -------------------------------------
+def _get_blocks() -> dict[str,numpy.ndarray]:
+    '''
+    Returns
+    -------------
+    Dictionary with arrays of block numbers and run/fill bounds, sorted by run
+    '''
+    d_block = _load_yaml(name='blocks.yaml')
+
+    d_table = {
+        'block'    : numpy.array([ block               for block   in d_block          ], dtype='int64'),
+        'run_low'  : numpy.array([ d_range['runs' ][0] for d_range in d_block.values() ], dtype='int64'),
+        'run_hig'  : numpy.array([ d_range['runs' ][1] for d_range in d_block.values() ], dtype='int64'),
+        'fill_low' : numpy.array([ d_range['fills'][0] for d_range in d_block.values() ], dtype='int64'),
+        'fill_hig' : numpy.array([ d_range['fills'][1] for d_range in d_block.values() ], dtype='int64')}
+
+    arr_ind = _sort_intervals(arr_low=d_table['run_low'], arr_hig=d_table['run_hig'], kind='block run')
+
+    return { name : arr_val[arr_ind] for name, arr_val in d_table.items() }
 
 arr_low_run, arr_hig_run = _get_good_runs()
+_d_block                 = _get_blocks()
+arr_blk_num              = _d_block['block'   ]
+arr_blk_low_run          = _d_block['run_low' ]
+arr_blk_hig_run          = _d_block['run_hig' ]
+arr_blk_low_fil          = _d_block['fill_low']
+arr_blk_hig_fil          = _d_block['fill_hig']
 # -------------------------------------
 @Numba.Declare(['int', 'int'], 'int')
 def get_block(run_number : int, fill_number : int) -> int:
-    block_run = 298626 <=  run_number <= 301278
-    block_fil = 9808   <= fill_number <= 9910
-    if block_run and block_fil:
-        return 4
-
-    block_run = 301325 <=  run_number <= 302403
-    block_fil = 9911   <= fill_number <= 9943
-    if block_run and block_fil:
-        return 3
-
-    block_run = 302429 <=  run_number <= 303010
-    block_fil = 9945   <= fill_number <= 9978
-    if block_run and block_fil:
-        return 2
-
-    block_run = 303092 <=  run_number <= 304604
-    block_fil = 9982   <= fill_number <= 10056
-    if block_run and block_fil:
-        return 1
-
-    block_run = 304648 <=  run_number <= 305739
-    block_fil = 10059  <= fill_number <= 10102
-    if block_run and block_fil:
-        return 5
-
-    block_run = 305802 <= run_number  <= 307544
-    block_fil = 10104  <= fill_number <= 10190
-    if block_run and block_fil:
-        return 6
-
-    block_run = 307576 <= run_number  <= 308098
-    block_fil = 10197  <= fill_number <= 10213
-    if block_run and block_fil:
-        return 7
-
-    block_run = 308104 <= run_number  <= 308540
-    block_fil = 10214  <= fill_number <= 10232
-    if block_run and block_fil:
-        return 8
+    '''
+    Takes run and fill numbers, returns block number, -1 if not found
+    '''
+    index = numpy.searchsorted(arr_blk_low_run, run_number, side='right') - 1
+    if index < 0 or run_number > arr_blk_hig_run[index]:
+        return -1
+
+    if arr_blk_low_fil[index] <= fill_number <= arr_blk_hig_fil[index]:
+        return arr_blk_num[index]
 
     return -1
 # -------------------------------------
@@ -88,11 +114,72 @@ def get_dataq(run_number : int) -> int:
     '''
     Takes run number, returns 0 (bad run) or 1 (good run)
     '''
-    for low_run, hig_run in zip(arr_low_run, arr_hig_run):
-        if low_run <= run_number <= hig_run:
-            return 1
+    index = numpy.searchsorted(arr_low_run, run_number, side='right') - 1
+    if index < 0 or run_number > arr_hig_run[index]:
+        return 0
+
+    return 1
+# -------------------------------------
+def _find_interval(
+    arr_val : numpy.ndarray,
+    arr_low : numpy.ndarray,
+    arr_hig : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    arr_val    : Array of values
+    arr_low/hig: Arrays with sorted, non-overlapping, inclusive bounds
+
+    Returns
+    -------------
+    Array with index of interval containing each value, -1 if none
+    '''
+    arr_ind = numpy.searchsorted(arr_low, arr_val, side='right') - 1
+    arr_cnd = numpy.maximum(arr_ind, 0)
+    arr_fnd = (arr_ind >= 0) & (arr_val <= arr_hig[arr_cnd])
+
+    return numpy.where(arr_fnd, arr_ind, -1)
+# -------------------------------------
+def get_dataq_array(run_numbers : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Vectorized version of `get_dataq`
+
+    Parameters
+    -------------
+    run_numbers: Array of run numbers
+
+    Returns
+    -------------
+    Array with 0 (bad run) or 1 (good run)
+    '''
+    arr_run = numpy.asarray(run_numbers, dtype='int64')
+    arr_ind = _find_interval(arr_val=arr_run, arr_low=arr_low_run, arr_hig=arr_hig_run)
+
+    return (arr_ind >= 0).astype('int64')
+# -------------------------------------
+def get_block_array(run_numbers : numpy.ndarray, fill_numbers : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Vectorized version of `get_block`
+
+    Parameters
+    -------------
+    run_numbers : Array of run numbers
+    fill_numbers: Array of fill numbers
+
+    Returns
+    -------------
+    Array with block numbers, -1 if not found
+    '''
+    arr_run = numpy.asarray(run_numbers , dtype='int64')
+    arr_fil = numpy.asarray(fill_numbers, dtype='int64')
+    arr_ind = _find_interval(arr_val=arr_run, arr_low=arr_blk_low_run, arr_hig=arr_blk_hig_run)
+    arr_cnd = numpy.maximum(arr_ind, 0)
+
+    arr_fnd = arr_ind >= 0
+    arr_fnd&= arr_blk_low_fil[arr_cnd] <= arr_fil
+    arr_fnd&= arr_fil <= arr_blk_hig_fil[arr_cnd]
 
-    return 0
+    return numpy.where(arr_fnd, arr_blk_num[arr_cnd], -1)
 # -------------------------------------
 class DataVarsAdder:
     '''
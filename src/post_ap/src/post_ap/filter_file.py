@@ -17,6 +17,7 @@ from ROOT                  import RDataFrame, TFile, RDF, TObjString
 from dmu.logging.log_store import LogStore
 
 import dmu.rdataframe.utilities as ut
+from dmu.rdataframe.expression_library import ExpressionLibrary
 import dmu.generic.utilities    as gut
 from dmu.rfile.rfprinter   import RFPrinter
 
@@ -245,11 +246,13 @@ class FilterFile:
         log.debug(110 * '-')
         log.info('Defining variables')
         log.debug(110 * '-')
+        exl = ExpressionLibrary(rdf=rdf)
         for name, expr in self._d_trans['define_all'].items():
             log.debug(f'{name:<50}{expr:<200}')
 
-            rdf = rdf.Define(name, expr)
+            exl = exl.Define(name, expr)
 
+        rdf = exl.get_rdf()
         rdf = self._define_kinematics(rdf)
 
         if not self._is_mc:
@@ -281,10 +284,13 @@ class FilterFile:
         log.debug(110 * '-')
         log.info(f'Defining variables for: {line_name} ({category})')
         log.debug(110 * '-')
+        exl = ExpressionLibrary(rdf=rdf)
         for name, expr in d_def.items():
             log.debug(f'{name:<50}{expr:<200}')
 
-            rdf = rdf.Define(name, expr)
+            exl = exl.Define(name, expr)
+
+        rdf = exl.get_rdf()
 
         return rdf
     # --------------------------------------
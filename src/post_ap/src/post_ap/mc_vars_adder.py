@@ -51,12 +51,7 @@ class MCVarsAdder:
         log.debug(f'Random ID: {self._randomid}')
 
         # Random seed needs to be fixed to make the analysis reproducible
-        self._rng          = numpy.random.default_rng(seed=10)
-        self._random_state = random.getstate()
-        random.seed(10)
-    # ---------------------------
-    def __del__(self):
-        random.setstate(self._random_state)
+        self._rng = numpy.random.default_rng(seed=10)
     # ---------------------------
     def _set_branch_id(self) -> None:
         '''
@@ -151,71 +146,112 @@ class MCVarsAdder:
 
         return rdf
     # ---------------------------
-    @cached_property
-    def _get_rec_identifiers(self) -> list[str]:
-        log.debug('Getting identifiers for rec tree')
-        l_id = self._get_identifiers(self._rdf_rec)
+    def _get_identifiers(self, arr_id_value : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        arr_id_value: Array with values of branch used to match gen and rec candidates
+
+        Returns
+        -----------------
+        Array of int64 identifiers
+        '''
+        arr_id_scale = arr_id_value * 1000_000
 
-        return l_id
+        return arr_id_scale.astype('int64')
     # ---------------------------
     @cached_property
-    def _get_gen_identifiers(self) -> list[str]:
-        log.debug('Getting identifiers for gen tree')
-        l_id = self._get_identifiers(self._rdf_gen)
+    def _rec_data(self) -> dict[str,numpy.ndarray]:
+        log.debug('Getting identifiers and targets for rec tree')
+        l_name = [self._branch_id, 'EVENTNUMBER', self._block_name]
 
-        return l_id
+        return self._rdf_rec.AsNumpy(l_name)
     # ---------------------------
-    def _get_identifiers(self, rdf) -> list[str]:
-        arr_id_value = rdf.AsNumpy([self._branch_id])[self._branch_id]
-        arr_id_scale = arr_id_value * 1000_000
-        arr_id_str   = arr_id_scale.astype(int).astype(str)
+    def _get_rec_index(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        '''
+        Returns
+        -----------------
+        Tuple with:
 
-        return arr_id_str.tolist()
-    # ---------------------------
-    def _get_mapping(self, name : str) -> dict[str, int]:
-        log.debug(f'Get mapping for {name}')
+        - Sorted array of distinct rec identifiers
+        - Array with index of rec candidate associated to each identifier.
+          For repeated identifiers, the last candidate is used
+        '''
+        arr_id    = self._get_identifiers(self._rec_data[self._branch_id])
+        arr_order = numpy.argsort(arr_id, kind='stable')
+        arr_id    = arr_id[arr_order]
 
-        l_identifier= self._get_rec_identifiers
-        arr_target  = self._rdf_rec.AsNumpy([name])[name]
-        l_target    = arr_target.tolist()
+        # Keep last element of each group of equal identifiers
+        arr_last  = numpy.append(arr_id[1:] != arr_id[:-1], True)
 
-        nid = len(l_identifier)
-        ntg = len(l_target)
+        return arr_id[arr_last], arr_order[arr_last]
+    # ---------------------------
+    @cached_property
+    def _gen_to_rec(self) -> numpy.ndarray:
+        '''
+        Returns
+        -----------------
+        Array with index of rec candidate matched to each gen candidate, -1 if no match
+        '''
+        log.debug('Matching gen to rec candidates')
+        arr_gen_id           = self._get_identifiers(self._rdf_gen.AsNumpy([self._branch_id])[self._branch_id])
+        arr_rec_id, arr_irec = self._get_rec_index()
 
-        if nid != ntg:
-            raise ValueError(f'For target/identifier {name}/{self._branch_id} values differ: {nid}/{ntg}')
+        if len(arr_rec_id) == 0:
+            return numpy.full(len(arr_gen_id), -1)
 
-        d_map = dict(zip(l_identifier, l_target))
+        arr_pos = numpy.searchsorted(arr_rec_id, arr_gen_id)
+        arr_pos = numpy.minimum(arr_pos, len(arr_rec_id) - 1)
+        arr_mtc = arr_rec_id[arr_pos] == arr_gen_id
 
-        return d_map
+        return numpy.where(arr_mtc, arr_irec[arr_pos], -1)
     # ---------------------------
-    def _pick_target(self, gen_id : str, mapping : dict[str,int], name : str) -> int:
-        if gen_id in mapping:
-            return mapping[gen_id]
-
+    def _pick_random(self, name : str, size : int) -> numpy.ndarray:
         if name == self._block_name:
-            return random.choice(self._l_block)
+            return self._rng.choice(self._l_block, size=size)
 
         # Making this negative ensures we won't accidentally collide with in-mapping value
         if name == 'EVENTNUMBER':
-            return random.randint(-1000_000, 0)
+            return self._rng.integers(-1000_000, 0, size=size, endpoint=True)
 
         raise ValueError(f'Cannot pick out of mapping random number for: {name}')
     # ---------------------------
+    def _get_targets(self, name : str) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        name: Name of branch in rec tree
+
+        Returns
+        -----------------
+        Array with values of branch for matched rec candidate, one per gen candidate.
+        Gen candidates without match get random values
+        '''
+        log.debug(f'Get targets for {name}')
+
+        arr_target = self._rec_data[name]
+        arr_index  = self._gen_to_rec
+        arr_match  = arr_index >= 0
+
+        # Signed, random values for unmatched candidates are negative
+        dtype      = 'int64' if arr_target.dtype.kind in 'iu' else arr_target.dtype
+        arr_value  = numpy.zeros(len(arr_index), dtype=dtype)
+        arr_value[arr_match]  = arr_target[arr_index[arr_match]]
+        arr_value[~arr_match] = self._pick_random(name=name, size=numpy.sum(~arr_match))
+
+        return arr_value
+    # ---------------------------
     def _add_to_gen(self) -> RDataFrame:
         rdf     = self._rdf_gen
 
-        d_id_bk = self._get_mapping(name= self._block_name)
-        d_id_ev = self._get_mapping(name=    'EVENTNUMBER')
-        l_gen_id= self._get_gen_identifiers
+        arr_ev  = self._get_targets(name=    'EVENTNUMBER')
+        arr_bk  = self._get_targets(name= self._block_name)
 
-        l_ev    = [ self._pick_target(gen_id=gen_id, mapping = d_id_ev, name =    'EVENTNUMBER') for gen_id in l_gen_id ]
-        l_bk    = [ self._pick_target(gen_id=gen_id, mapping = d_id_bk, name = self._block_name) for gen_id in l_gen_id ]
-
-        ngen    = len(l_gen_id)
-        log.debug(f'Adding columns for {ngen} entries')
-        rdf     = ut.add_column_with_numba(rdf, numpy.array(l_bk), self._block_name, identifier=f'gen_block_{self._randomid}')
-        rdf     = ut.add_column_with_numba(rdf, numpy.array(l_ev),    'EVENTNUMBER', identifier=f'gen_evtnm_{self._randomid}')
+        ngen    = len(arr_ev)
+        nmiss   = numpy.sum(self._gen_to_rec < 0)
+        log.debug(f'Adding columns for {ngen} entries, {nmiss} without match')
+        rdf     = ut.add_column_with_numba(rdf, arr_bk, self._block_name, identifier=f'gen_block_{self._randomid}')
+        rdf     = ut.add_column_with_numba(rdf, arr_ev,    'EVENTNUMBER', identifier=f'gen_evtnm_{self._randomid}')
 
         return rdf
     # ---------------------------
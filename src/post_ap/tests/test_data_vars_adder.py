@@ -3,11 +3,13 @@ Module containing tests for DataVarsAdder class
 '''
 import os
 
+import numpy
 import pytest
 from ROOT import RDataFrame
 
 from dmu.logging.log_store   import LogStore
 from post_ap.data_vars_adder import DataVarsAdder
+from post_ap                 import data_vars_adder as dva
 
 log = LogStore.add_logger('post_ap:test_data_vars_adder')
 # ---------------------------------------------
@@ -38,3 +40,16 @@ def test_simple(itry : int) -> None:
     log.info(f'Saving to: {file_path}')
 
     rdf.Snapshot('tree', file_path, l_name)
+# ---------------------------------------------
+def test_lookup_arrays() -> None:
+    '''
+    Tests vectorized lookup of data quality and block
+    '''
+    arr_run = numpy.array([292302, 292304, 292311, 292312, 100, 303092, 308540, 308541])
+    arr_fil = numpy.array([  9000,   9000,   9000,   9000, 100,   9982,  10232,  10232])
+
+    arr_dataq = dva.get_dataq_array(run_numbers=arr_run)
+    arr_block = dva.get_block_array(run_numbers=arr_run, fill_numbers=arr_fil)
+
+    assert arr_dataq.tolist() == [ 1,  0,  0,  1,  0, 0, 1,  0]
+    assert arr_block.tolist() == [-1, -1, -1, -1, -1, 1, 8, -1]
@@ -145,3 +145,27 @@ def test_add_to_rec(sample : str):
 
     assert any( block in arr_block for block in range(1,9) )
 # -------------------------------------------------
+def test_add_to_gen_unmatched():
+    '''
+    Tests that MCDT candidates without match get random, reproducible, values
+    '''
+    sample  = 'mc_24_w41_42_magup_sim10f_11154001_bd_jpsikst_ee_eq_dpc_tuple'
+    rdf_rec = _get_rdf(kind='rec', with_block=True)
+    rdf_gen = RDF.FromNumpy({'B_PT' : Data.rng.uniform(20_000, 30_000, Data.ngen)})
+
+    l_evt = []
+    for _ in range(2):
+        obj = MCVarsAdder(
+            sample_name = sample,
+            rdf_rec     = rdf_rec,
+            rdf_gen     = rdf_gen)
+        rdf = obj.get_rdf()
+        arr_evt = rdf.AsNumpy(['EVENTNUMBER'])['EVENTNUMBER']
+        arr_blk = rdf.AsNumpy([      'block'])[      'block']
+
+        assert numpy.all(arr_evt <= 0)
+        assert numpy.isin(arr_blk, [7, 8]).all()
+
+        l_evt.append(arr_evt)
+
+    assert numpy.array_equal(l_evt[0], l_evt[1])
@@ -352,8 +352,9 @@ def main(cfg : DictConfig|None = None):
 
     _check_existing_model()
 
-    with RDFGetter.max_entries(value = Data.max_entries),\
-         RDFGetter.multithreading(nthreads=Data.workers):
+    # The workers are used to train the folds in parallel, the simulation is patched
+    # with entry based conditions, i.e. the dataframes cannot use multithreading
+    with RDFGetter.max_entries(value = Data.max_entries):
 
         rdf_sig = _get_rdf(kind='sig')
         rdf_bkg = _get_rdf(kind='bkg')
@@ -20,6 +20,7 @@ from .sample_patcher          import SamplePatcher
 from .specification           import Sample
 from .samples                 import SamplesPrinter
 from .rdf_loader              import RDFLoader
+from .uuid_index              import UUIDIndex
 
 __all__ = [
     'Sample',
@@ -41,6 +42,7 @@ __all__ = [
     'GangaInfo',
     'RDFGetter', 
     'RDFLoader',
+    'UUIDIndex',
     'Stats', 
     'df_from_rdf',
     'Specification',
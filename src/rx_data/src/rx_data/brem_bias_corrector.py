@@ -2,37 +2,103 @@
 Module holding brem bias corrector class
 '''
 from typing                 import Union
+from functools              import cache
 from importlib.resources    import files
 
 import yaml
 import numpy
+import vector
 from vector                 import MomentumObject4D as v4d
+from vector                 import MomentumNumpy4D  as v4d_arr
 
 from dmu.logging.log_store  import LogStore
 from ecal_calibration       import calo_translator as ctran
 
 log=LogStore.add_logger('rx_data:brem_bias_corrector')
+
+_REGIONS = [0, 1, 2]
+# --------------------------
+@cache
+def _load_yaml(pattern : str) -> dict:
+    '''
+    Loads maps once per process, the YAML files are large and slow to parse
+    '''
+    path_pattern = files('ecal_calibration_data').joinpath(f'brem_correction/{pattern}')
+    path_pattern = str(path_pattern)
+
+    d_data = {}
+    for region in _REGIONS:
+        path = path_pattern.replace('REGION', str(region))
+        with open(path, encoding='utf-8') as ifile:
+            d_data[region] = yaml.safe_load(ifile)
+
+    return d_data
 # --------------------------
 class BremBiasCorrector:
     '''
     Class meant to correct bias of brem energy
+
+    The bounds and the corrections are also compiled into arrays, such that
+    `correct_batch` can correct arrays of photons without looping over them.
     '''
     # --------------------------
     def __init__(self):
-        self._d_corr  = self._load_yaml(pattern='mu_data_24c4MU_bybin_P_ELECTRONENERGY_regionREGION.yaml')
-        self._d_bound = self._load_yaml(pattern='regionREGION_bins.yaml')
+        self._d_corr  = _load_yaml(pattern='mu_data_24c4MU_bybin_P_ELECTRONENERGY_regionREGION.yaml')
+        self._d_bound = _load_yaml(pattern='regionREGION_bins.yaml')
+
+        self._arr_bound : numpy.ndarray
+        self._arr_key   : numpy.ndarray
+        self._arr_edge  : numpy.ndarray
+        self._arr_mu    : numpy.ndarray
+        self._arr_nedge : numpy.ndarray
+        self._arr_nmu   : numpy.ndarray
+        self._compile_maps()
     # --------------------------
-    def _load_yaml(self, pattern : str) -> dict:
-        path_pattern = files('ecal_calibration_data').joinpath(f'brem_correction/{pattern}')
-        path_pattern = str(path_pattern)
+    def _compile_maps(self) -> None:
+        '''
+        Will build:
+
+        - Array of bounds with shape (nbox, 4), boxes of region 0, then region 1, etc.
+        - Array of correction indices, one per box, -1 for boxes without a correction entry
+        - Arrays with energy edges and corrections of shape (ncorr, nmax), padded with inf and NaN
+        - Arrays with number of energy edges and corrections per entry
+        '''
+        l_bound = []
+        l_key   = []
+        l_corr  = []
+        for region, l_l_bound in self._d_bound.items():
+            d_corr_reg = self._d_corr[region]
+            for ibin, bound in enumerate(l_l_bound):
+                l_bound.append(bound)
+
+                key = str(region * 10_000 + ibin)
+                if key not in d_corr_reg:
+                    l_key.append(-1)
+                    continue
 
-        d_bound = {}
-        for region in [0,1,2]:
-            path = path_pattern.replace('REGION', str(region))
-            with open(path, encoding='utf-8') as ifile:
-                d_bound[region] = yaml.safe_load(ifile)
+                l_key.append(len(l_corr))
+                l_corr.append(d_corr_reg[key])
 
-        return d_bound
+        nmax = max(len(d_corr['p']) for d_corr in l_corr)
+        ncor = len(l_corr)
+
+        self._arr_bound = numpy.array(l_bound, dtype=float)
+        self._arr_key   = numpy.array(l_key  , dtype=int)
+        self._arr_edge  = numpy.full((ncor, nmax), numpy.inf)
+        self._arr_mu    = numpy.full((ncor, nmax), numpy.nan)
+        self._arr_nedge = numpy.zeros(ncor, dtype=int)
+        self._arr_nmu   = numpy.zeros(ncor, dtype=int)
+
+        for index, d_corr in enumerate(l_corr):
+            l_edge = d_corr['p']
+            l_mu   = d_corr['mu']
+
+            self._arr_edge[index, :len(l_edge)] = l_edge
+            self._arr_mu  [index, :len(l_mu)  ] = l_mu
+            self._arr_nedge[index]              = len(l_edge)
+            self._arr_nmu  [index]              = len(l_mu)
+
+        log.debug(f'Compiled {len(l_bound)} bins and {ncor} corrections')
     # --------------------------
     def _find_among_bounds(self, x : float, y : float, l_l_bound : list) -> Union[None, int]:
         for ibound, [xmin, xmax, ymin, ymax] in enumerate(l_l_bound):
@@ -53,6 +119,32 @@ class BremBiasCorrector:
 
         return None
     # --------------------------
+    def _find_bins(self, x : numpy.ndarray, y : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized version of `_find_bin`
+
+        Parameters
+        -------------
+        x, y: Arrays with coordinates of the photons
+
+        Returns
+        -------------
+        Array with index of first box (in the order of `_arr_bound`) containing each point, -1 if none
+        '''
+        xmin, xmax, ymin, ymax = self._arr_bound.T
+
+        arr_in  = (xmin < x[:, None]) & (x[:, None] < xmax)
+        arr_in &= (ymin < y[:, None]) & (y[:, None] < ymax)
+
+        arr_box = numpy.argmax(arr_in, axis=1)
+        arr_box = numpy.where(arr_in.any(axis=1), arr_box, -1)
+
+        nmiss = numpy.sum(arr_box == -1)
+        if nmiss > 0:
+            log.warning(f'Cannot find {nmiss} points among bounds')
+
+        return arr_box
+    # --------------------------
     def _find_corrections(self, ibin : int, region : int) -> dict:
         d_corr_reg = self._d_corr[region]
         key        = region * 10_000 + ibin
@@ -89,11 +181,47 @@ class BremBiasCorrector:
 
         return brem_corr
     # --------------------------
+    def _get_mu(self, energy : numpy.ndarray, arr_cor : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized version of the lookup done in `_apply_correction`
+
+        Parameters
+        -------------
+        energy : Array with energies of photons
+        arr_cor: Array with index of correction entry for each photon
+
+        Returns
+        -------------
+        Array with scale factors, one where no correction can be found
+        '''
+        arr_edge = self._arr_edge [arr_cor]
+        arr_nedge= self._arr_nedge[arr_cor]
+        arr_nmu  = self._arr_nmu  [arr_cor]
+
+        # Same as numpy.digitize, NaNs go to the last bin
+        ibin     = numpy.sum(arr_edge <= energy[:, None], axis=1)
+        ibin     = numpy.where(numpy.isnan(energy), arr_nedge, numpy.minimum(ibin, arr_nedge))
+        index    = numpy.maximum(ibin - 1, 0)
+
+        arr_val  = index < arr_nmu
+        arr_mu   = numpy.ones(len(energy))
+        arr_mu[arr_val] = self._arr_mu[arr_cor[arr_val], index[arr_val]]
+
+        nmiss = numpy.sum(~arr_val)
+        if nmiss > 0:
+            log.warning(f'Cannot find bin with correction for {nmiss} photons')
+
+        nout  = numpy.sum(arr_val & ((arr_mu < 0.5) | (arr_mu > 3.0)))
+        if nout > 0:
+            log.warning(f'Found {nout} photons with mu outside [0.5, 3.0]')
+
+        return arr_mu
+    # --------------------------
     def correct(
         self,
-        brem : v4d, 
-        row  : int, 
-        col  : int, 
+        brem : v4d,
+        row  : int,
+        col  : int,
         area : int) -> v4d:
         '''
         Takes 4 vector with brem, the row and column locations in ECAL
@@ -108,5 +236,52 @@ class BremBiasCorrector:
         d_corr       = self._find_corrections(ibin, region)
         brem_corr    = self._apply_correction(brem, d_corr)
 
+        return brem_corr
+    # --------------------------
+    def correct_batch(
+        self,
+        px    : numpy.ndarray,
+        py    : numpy.ndarray,
+        pz    : numpy.ndarray,
+        e     : numpy.ndarray,
+        rows  : numpy.ndarray,
+        cols  : numpy.ndarray,
+        areas : numpy.ndarray) -> v4d_arr:
+        '''
+        Vectorized version of `correct`
+
+        Parameters
+        -------------
+        px, py, pz, e    : Arrays with components of the photons' momenta
+        rows, cols, areas: Arrays with locations of photons in ECAL
+
+        Returns
+        -------------
+        Array of 4D vectors with corrected photons. Photons that cannot be corrected are left unchanged
+        '''
+        arr_e = numpy.asarray(e, dtype=float)
+
+        # Bins depend only on the cell, find them for each distinct cell
+        arr_cell = numpy.stack([areas, rows, cols], axis=1).astype(int)
+        arr_cell, arr_inv = numpy.unique(arr_cell, axis=0, return_inverse=True)
+        arr_inv  = arr_inv.ravel()
+
+        x, y     = ctran.from_ids_to_xy(rows=arr_cell[:, 1], cols=arr_cell[:, 2], areas=arr_cell[:, 0])
+        arr_box  = self._find_bins(x, y)[arr_inv]
+        arr_fnd  = arr_box != -1
+
+        arr_cor  = self._arr_key[numpy.where(arr_fnd, arr_box, 0)]
+        if numpy.any(arr_fnd & (arr_cor == -1)):
+            raise KeyError('Cannot find correction for some of the bins')
+
+        arr_mu   = numpy.ones(len(arr_e))
+        arr_mu[arr_fnd] = self._get_mu(energy=arr_e[arr_fnd], arr_cor=arr_cor[arr_fnd])
+
+        brem_corr = vector.array({
+            'px' : px    / arr_mu,
+            'py' : py    / arr_mu,
+            'pz' : pz    / arr_mu,
+            'e'  : arr_e / arr_mu})
+
         return brem_corr
 # --------------------------
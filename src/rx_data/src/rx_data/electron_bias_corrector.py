@@ -4,9 +4,11 @@ Module with ElectronBiasCorrector class
 import math
 from typing                 import Final, cast
 
+import numpy
 import pandas as pnd
 import vector
 from vector                 import MomentumObject4D as v4d
+from vector                 import MomentumNumpy4D  as v4d_arr
 from dmu.logging.log_store  import LogStore
 
 from rx_data.brem_bias_corrector   import BremBiasCorrector
@@ -25,6 +27,9 @@ class ElectronBiasCorrector:
         - For electrons with brem: Do nothing
         - For electrons without brem: If `BREMTRACKBASEDENERGY > 50 MeV` add brem, otherwise do nothing.
         - Optionally, rescale energy of electron based on measurement of "mu" through the momentum closure.
+
+    The correction can be done row by row, with `correct`, or on whole columns of a dataframe, with `correct_batch`.
+    Both give the same results.
     '''
     # ---------------------------------
     def __init__(
@@ -305,4 +310,280 @@ class ElectronBiasCorrector:
         row = self._update_row(row, e_corr)
 
         return row
+    # ---------------------------------
+    # Batch (columnar) implementation
+    # ---------------------------------
+    def _get_electrons(self, df : pnd.DataFrame, kind : str) -> v4d_arr:
+        '''
+        Parameters
+        ---------------
+        df  : Pandas dataframe with candidates
+        kind: TRACK or empty string for track electron or full electron, respectively
+
+        Returns
+        ---------------
+        Array of 4D vectors with electrons
+        '''
+        px = self._attr_from_df(df, f'{self._name}_{kind}PX')
+        py = self._attr_from_df(df, f'{self._name}_{kind}PY')
+        pz = self._attr_from_df(df, f'{self._name}_{kind}PZ')
+
+        e_3d = vector.array({'px' : px, 'py' : py, 'pz' : pz})
+        mass = numpy.full(len(df), _ELECTRON_MASS)
+
+        e_4d = vector.array({'pt' : e_3d.pt, 'eta' : e_3d.eta, 'phi' : e_3d.phi, 'mass' : mass})
+        e_4d = e_4d.to_pxpypzenergy()
+        e_4d = cast(v4d_arr, e_4d)
+
+        return e_4d
+    # ---------------------------------
+    def _attr_from_df(self, df : pnd.DataFrame, name : str) -> numpy.ndarray:
+        if name in df.columns:
+            return df[name].to_numpy(dtype='float64')
+
+        for col_name in df.columns:
+            log.info(col_name)
+
+        raise ValueError(f'Cannot find column {name} among:')
+    # ---------------------------------
+    def _check_massless_brems(self, e_brem : v4d_arr) -> None:
+        '''
+        Same as `_check_massless_brem`, but for arrays of 4D vectors
+        '''
+        energy  = numpy.asarray(e_brem.e)
+        momentum= numpy.asarray(e_brem.p)
+
+        arr_close = numpy.isclose(energy, momentum, rtol=0, atol=1)
+        if numpy.all(arr_close):
+            return
+
+        nbad = numpy.sum(~arr_close)
+        for val_e, val_p in zip(energy[~arr_close][:10], momentum[~arr_close][:10]):
+            log.error(f'{val_e:.1f}!={val_p:.1f}')
+
+        raise ValueError(f'Brem energy and momentum are not equal for {nbad} candidates')
+    # ---------------------------------
+    @staticmethod
+    def _where(mask : numpy.ndarray, vec_1 : v4d_arr, vec_2 : v4d_arr) -> v4d_arr:
+        '''
+        Parameters
+        ---------------
+        mask : Array of booleans
+        vec_1: Array of 4D vectors picked where mask is true
+        vec_2: Array of 4D vectors picked where mask is false
+
+        Returns
+        ---------------
+        Array of 4D vectors, merged
+        '''
+        d_data = {}
+        for comp in ['px', 'py', 'pz', 'e']:
+            d_data[comp] = numpy.where(mask, getattr(vec_1, comp), getattr(vec_2, comp))
+
+        vec = vector.array(d_data)
+        vec = cast(v4d_arr, vec)
+
+        return vec
+    # ---------------------------------
+    def _correct_with_bias_maps_batch(
+        self,
+        e_track : v4d_arr,
+        e_brem  : v4d_arr,
+        df      : pnd.DataFrame) -> tuple[v4d_arr, numpy.ndarray, numpy.ndarray]:
+        '''
+        Batch version of `_correct_with_bias_maps`
+
+        Returns
+        ---------------
+        Tuple with corrected electrons, mask of candidates to update and brem status
+        '''
+        nentries = len(df)
+        arr_upd  = numpy.ones(nentries, dtype=bool)
+        arr_sta  = numpy.full(nentries, -1)
+        e_sum    = e_track + e_brem
+        e_sum    = cast(v4d_arr, e_sum)
+
+        if self._skip_correction:
+            log.warning('Skipping electron correction')
+            return e_sum, arr_upd, arr_sta
+
+        arr_has  = self._attr_from_df(df, f'{self._name}_HASBREMADDED') != 0
+        if not numpy.any(arr_has):
+            return e_sum, arr_upd, arr_sta
+
+        log.info('Applying ecalo_bias correction')
+
+        e_brem_has  = e_brem[arr_has]
+        e_brem_corr = self._bcor.correct_batch(
+            px   = e_brem_has.px,
+            py   = e_brem_has.py,
+            pz   = e_brem_has.pz,
+            e    = e_brem_has.e,
+            rows = self._attr_from_df(df, f'{self._name}_BREMHYPOROW' )[arr_has],
+            cols = self._attr_from_df(df, f'{self._name}_BREMHYPOCOL' )[arr_has],
+            areas= self._attr_from_df(df, f'{self._name}_BREMHYPOAREA')[arr_has])
+
+        self._check_massless_brems(e_brem_corr)
+
+        nsame = numpy.sum(numpy.isclose(e_brem_corr.e, e_brem_has.e, rtol=1e-5))
+        if nsame > 0:
+            log.warning(f'Correction did not change {nsame} photons')
+
+        arr_brem = numpy.column_stack([e_brem.px, e_brem.py, e_brem.pz, e_brem.e])
+        arr_brem[arr_has] = numpy.column_stack([e_brem_corr.px, e_brem_corr.py, e_brem_corr.pz, e_brem_corr.e])
+
+        e_brem_corr = vector.array({'px' : arr_brem[:, 0], 'py' : arr_brem[:, 1], 'pz' : arr_brem[:, 2], 'e' : arr_brem[:, 3]})
+
+        e_cor = e_track + e_brem_corr
+        e_cor = cast(v4d_arr, e_cor)
+        e_cor = self._where(arr_has, e_cor, e_sum)
+        arr_sta[arr_has] = 1
+
+        return e_cor, arr_upd, arr_sta
+    # ---------------------------------
+    def _correct_with_track_brem_1_batch(
+        self,
+        e_track : v4d_arr,
+        df      : pnd.DataFrame,
+        arr_sel : numpy.ndarray|None = None) -> tuple[v4d_arr, numpy.ndarray, numpy.ndarray]:
+        '''
+        Batch version of `_correct_with_track_brem_1`
+
+        Parameters
+        ---------------
+        arr_sel: Optional array of booleans, if passed, only these candidates are meant to be corrected
+
+        Returns
+        ---------------
+        Tuple with corrected electrons, mask of candidates to update and brem status
+        '''
+        nentries = len(df)
+        if self._skip_correction:
+            return e_track, numpy.zeros(nentries, dtype=bool), numpy.full(nentries, -1)
+
+        brem_energy = self._attr_from_df(df, f'{self._name}_BREMTRACKBASEDENERGY')
+        arr_low     = brem_energy < self._min_brem_energy
+
+        gamma  = vector.array({
+            'pt'  : numpy.ones(nentries),
+            'eta' : e_track.eta,
+            'phi' : e_track.phi,
+            'mass': numpy.zeros(nentries)})
+        factor = brem_energy / gamma.e
+
+        gamma  = vector.array({
+            'px' : factor * gamma.px,
+            'py' : factor * gamma.py,
+            'pz' : factor * gamma.pz,
+            'e'  : factor * gamma.e})
+
+        arr_chk = ~arr_low if arr_sel is None else ~arr_low & arr_sel
+        self._check_massless_brems(gamma[arr_chk])
+
+        e_corr = e_track + gamma
+        e_corr = cast(v4d_arr, e_corr)
+        e_corr = self._where(arr_low, e_track, e_corr)
+
+        arr_sta = numpy.where(arr_low, 0, 1)
+
+        return e_corr, numpy.ones(nentries, dtype=bool), arr_sta
+    # ---------------------------------
+    def _correct_with_track_brem_2_batch(
+        self,
+        e_track : v4d_arr,
+        df      : pnd.DataFrame) -> tuple[v4d_arr, numpy.ndarray, numpy.ndarray]:
+        '''
+        Batch version of `_correct_with_track_brem_2`
+
+        Returns
+        ---------------
+        Tuple with corrected electrons, mask of candidates to update and brem status
+        '''
+        arr_has     = self._attr_from_df(df, f'{self._name}_HASBREMADDED') != 0
+        brem_energy = self._attr_from_df(df, f'{self._name}_BREMTRACKBASEDENERGY')
+        arr_low     = ~arr_has & (brem_energy < self._min_brem_energy)
+
+        log.debug(f'Electrons with brem/below threshold: {arr_has.sum()}/{arr_low.sum()}')
+
+        e_full                  = self._get_electrons(df, kind='')
+        e_corr, arr_upd, arr_sta= self._correct_with_track_brem_1_batch(e_track, df, arr_sel=~arr_has)
+        e_corr                  = self._where(arr_has, e_full, e_corr)
+
+        arr_upd = numpy.where(arr_has, True, arr_upd & ~arr_low)
+        arr_sta = numpy.where(arr_has | arr_low, -1, arr_sta)
+
+        return e_corr, arr_upd, arr_sta
+    # ---------------------------------
+    def _update_df(
+        self,
+        df      : pnd.DataFrame,
+        e_corr  : v4d_arr,
+        arr_upd : numpy.ndarray,
+        arr_sta : numpy.ndarray) -> pnd.DataFrame:
+        '''
+        Batch version of `_update_row`
+
+        Parameters
+        ---------------
+        df     : Pandas dataframe with candidates
+        e_corr : Array of 4D vectors with corrected electrons
+        arr_upd: Array of booleans, true for the candidates that need an update
+        arr_sta: Array with brem status for each candidate
+
+        Returns
+        ---------------
+        Pandas dataframe with updated candidates
+        '''
+        d_val = {
+            f'{self._name}_PX' : e_corr.px,
+            f'{self._name}_PY' : e_corr.py,
+            f'{self._name}_PZ' : e_corr.pz,
+            f'{self._name}_PT' : e_corr.pt,
+            f'{self._name}_ETA': e_corr.eta,
+            f'{self._name}_PHI': e_corr.phi}
+
+        for name, arr_val in d_val.items():
+            arr_org  = self._attr_from_df(df, name)
+            df[name] = numpy.where(arr_upd, arr_val, arr_org)
+
+        name     = f'{self._name}_HASBREMADDED'
+        arr_brem = arr_upd & (arr_sta != -1)
+        arr_org  = self._attr_from_df(df, name)
+        df[name] = numpy.where(arr_brem, arr_sta, arr_org)
+
+        return df
+    # ---------------------------------
+    def correct_batch(self, df : pnd.DataFrame, name : str, kind : str = 'brem_track_2') -> pnd.DataFrame:
+        '''
+        Corrects kinematics of all candidates in dataframe at once.
+        Columns of the particle are returned as float64, like in `correct`
+
+        df   : Pandas dataframe, with one candidate per row
+        name : Particle name, e.g. L1
+        kind : Type of correction, [ecalo_bias, brem_track_1, brem_track_2]
+        '''
+        log.debug(f'Correcting {name} with {kind} for {len(df)} candidates')
+
+        self._name = name
+        df         = df.copy()
+        e_track    = self._get_electrons(df, kind='TRACK_')
+
+        if   kind == 'ecalo_bias':
+            e_full = self._get_electrons(df, kind='')
+            e_brem = e_full - e_track
+            e_brem = e_brem.to_pxpypzenergy()
+            e_brem = cast(v4d_arr, e_brem)
+            self._check_massless_brems(e_brem)
+
+            e_corr, arr_upd, arr_sta = self._correct_with_bias_maps_batch(e_track, e_brem, df)
+        elif kind == 'brem_track_1':
+            e_corr, arr_upd, arr_sta = self._correct_with_track_brem_1_batch(e_track, df)
+        elif kind == 'brem_track_2':
+            e_corr, arr_upd, arr_sta = self._correct_with_track_brem_2_batch(e_track, df)
+        else:
+            raise NotImplementedError(f'Invalid correction of type: {kind}')
+
+        df = self._update_df(df, e_corr, arr_upd, arr_sta)
+
+        return df
 # ---------------------------------
@@ -1,28 +1,26 @@
 '''
 Module containing HOPVarCalculator class
 '''
-import math
-from typing import Union
-
 import numpy
 from ROOT                   import RDF  # type: ignore
-from ROOT.Math              import LorentzVector, XYZVector # type: ignore
 from dmu.logging.log_store  import LogStore
 from rx_common              import Project, info
 
 log = LogStore.add_logger('rx_data:hop_calculator')
 
-Vector=Union[LorentzVector, XYZVector]
 # -------------------------------
 class HOPCalculator:
     '''
     Class meant to calculate HOP variables from a ROOT dataframe. For info on HOP see:
 
     https://cds.cern.ch/record/2102345/files/LHCb-INT-2015-037.pdf
+
+    The variables are calculated on arrays, with one row per candidate,
+    the inputs are read from the dataframe in a single event loop
     '''
     # -------------------------------
     def __init__(
-        self, 
+        self,
         rdf    : RDF.RNode,
         trigger: str):
         '''
@@ -36,121 +34,186 @@ class HOPCalculator:
         self._trigger       = trigger
         self._extra_branches= ['EVENTNUMBER', 'RUNNUMBER']
     # -------------------------------
-    def _val_to_vector(self, arr_val : numpy.ndarray, ndim : int) -> Vector:
-        if   ndim == 4:
-            [px, py, pz, pe] = arr_val.tolist()
-            vector = LorentzVector('ROOT::Math::PxPyPzE4D<double>')(px, py, pz, pe)
-        elif ndim == 3:
-            [px, py, pz    ] = arr_val.tolist()
-            vector = XYZVector(px, py, pz)
-        else:
-            raise NotImplementedError(f'Invalid dimentionality: {ndim}')
-
-        return vector
-    # -------------------------------
-    def _get_xvector(self, name : str, ndim : int) -> list[Vector]:
+    def _get_names(self, name : str) -> list[str]:
         '''
         Parameters
         -----------------
         name: Identifier of the object, i.e L1_P, Hadrons, etc.
-        ndim: Number of dimensions for associated vector
 
         Returns
         -----------------
-        List of vectors in dataframe, associated to object
+        List of prefixes of branches, whose vectors are added to build the object
         '''
         project  = info.project_from_trigger(trigger=self._trigger, lower_case=True)
         if   name == 'Hadrons' and project in [Project.rkst, Project.rkst_no_pid]:
-            l_h1 = self._get_xvector(name='H1_P', ndim=ndim)
-            l_h2 = self._get_xvector(name='H2_P', ndim=ndim)
-            l_hh = [ h1 + h2 for h1, h2 in zip(l_h1, l_h2) ]
-
-            return l_hh
-        elif name == 'Hadrons' and project in [Project.rk, Project.rk_no_pid]:
-            name = 'H_P'
-        elif name in ['L1_P', 'L2_P', 'H1_P', 'H2_P', 'B_BPV', 'B_END_V']:
-            pass
-        else:
-            raise ValueError(f'Invalid project/name: {project}/{name}')
+            return ['H1_P', 'H2_P']
 
+        if   name == 'Hadrons' and project in [Project.rk, Project.rk_no_pid]:
+            return ['H_P']
+
+        if   name in ['L1_P', 'L2_P', 'H1_P', 'H2_P', 'B_BPV', 'B_END_V']:
+            return [name]
+
+        raise ValueError(f'Invalid project/name: {project}/{name}')
+    # -------------------------------
+    @staticmethod
+    def _get_branches(name : str, ndim : int) -> list[str]:
         if   ndim == 4:
-            l_branch = [f'{name}X', f'{name}Y', f'{name}Z', f'{name}E']
-        elif ndim == 3:
-            l_branch = [f'{name}X', f'{name}Y', f'{name}Z']
-        else:
-            raise NotImplementedError(f'Invalid ndim={ndim}')
-
-        d_data   = self._rdf.AsNumpy(l_branch)
-        l_array  = [ d_data[branch] for branch in l_branch ]
-        arr_dat  = numpy.array(l_array).T
-        l_vec    = [ self._val_to_vector(arr_val, ndim) for arr_val in arr_dat ]
-
-        return l_vec
+            return [f'{name}X', f'{name}Y', f'{name}Z', f'{name}E']
+
+        if   ndim == 3:
+            return [f'{name}X', f'{name}Y', f'{name}Z']
+
+        raise NotImplementedError(f'Invalid ndim={ndim}')
+    # -------------------------------
+    def _get_xvector(
+        self,
+        name   : str,
+        ndim   : int,
+        d_data : dict[str,numpy.ndarray]) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        name  : Identifier of the object, i.e L1_P, Hadrons, etc.
+        ndim  : Number of dimensions for associated vector
+        d_data: Dictionary with arrays read from dataframe
+
+        Returns
+        -----------------
+        Array of shape (ncandidates, ndim) with vectors associated to object
+        '''
+        arr_vec = None
+        for prefix in self._get_names(name=name):
+            l_branch = self._get_branches(name=prefix, ndim=ndim)
+            arr_val  = numpy.stack([ d_data[branch] for branch in l_branch ], axis=1).astype('float64')
+            arr_vec  = arr_val if arr_vec is None else arr_vec + arr_val
+
+        if arr_vec is None:
+            raise ValueError(f'No vectors found for: {name}')
+
+        return arr_vec
+    # -------------------------------
+    def _get_data(self) -> dict[str,numpy.ndarray]:
+        '''
+        Returns
+        -----------------
+        Dictionary with all the arrays needed, read in a single event loop
+        '''
+        l_branch = list(self._extra_branches)
+        for name, ndim in [('L1_P', 4), ('L2_P', 4), ('Hadrons', 4), ('B_BPV', 3), ('B_END_V', 3)]:
+            for prefix in self._get_names(name=name):
+                l_branch += self._get_branches(name=prefix, ndim=ndim)
+
+        log.debug(f'Reading {len(l_branch)} branches')
+
+        return self._rdf.AsNumpy(l_branch)
+    # -------------------------------
+    @staticmethod
+    def _get_pt(
+        vec   : numpy.ndarray,
+        dirc  : numpy.ndarray,
+        r_dir : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        vec  : Array of 3D vectors, shape (ncandidates, 3)
+        dirc : Array of 3D vectors along direction of flight of B meson
+        r_dir: Array with magnitudes of `dirc`
+
+        Returns
+        -----------------
+        Array with magnitudes of components of `vec` transverse to direction of flight
+        '''
+        r_vec = numpy.linalg.norm(vec, axis=1)
+        cos_t = numpy.einsum('ij,ij->i', dirc, vec) / (r_vec * r_dir)
+        sin_t = numpy.sqrt(1.0 - cos_t ** 2)
+
+        return r_vec * sin_t
     # -------------------------------
     def _get_alpha(
-        self, 
-        pv : XYZVector, 
-        sv : XYZVector, 
-        l1 : LorentzVector, 
-        l2 : LorentzVector, 
-        hd : LorentzVector) -> float:
+        self,
+        pv : numpy.ndarray,
+        sv : numpy.ndarray,
+        l1 : numpy.ndarray,
+        l2 : numpy.ndarray,
+        hd : numpy.ndarray) -> numpy.ndarray:
         '''
         Parameters
         -----------------
-        pv(sv): 3D vector corresponding to position of primary (secondary) vertex
-        l1(2) : Lorentz vector for lepton
-        hd    : Lorentz vector for hadronic system, for Rk, kaon, for RKstar, sum of Kaon and Pion
+        pv(sv): 3D vectors corresponding to position of primary (secondary) vertex
+        l1(2) : Lorentz vectors for lepton
+        hd    : Lorentz vectors for hadronic system, for Rk, kaon, for RKstar, sum of Kaon and Pion
 
         Returns
         -----------------
-        Ratio of transverse momentum, (in reference frame perpendicular to direction of flight of B meson)
+        Array with ratios of transverse momentum, (in reference frame perpendicular to direction of flight of B meson)
         of dilepton and hadronic system
         '''
-        l1_3v     = l1.Vect()
-        l2_3v     = l2.Vect()
-        ll_3v     = l1_3v + l2_3v
-        hd_3v     = hd.Vect()
-        bp_dr     = sv - pv
+        bp_dr = sv - pv
+        r_dr  = numpy.linalg.norm(bp_dr, axis=1)
 
-        cos_thhad = bp_dr.Dot(hd_3v) / (hd_3v.R() * bp_dr.R())
-        sin_thhad = math.sqrt(1.0 - cos_thhad ** 2)
-        had_pt    = hd_3v.R() * sin_thhad
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            had_pt = self._get_pt(vec=hd[:, :3]            , dirc=bp_dr, r_dir=r_dr)
+            ll_pt  = self._get_pt(vec=l1[:, :3] + l2[:, :3], dirc=bp_dr, r_dir=r_dr)
+            alpha  = numpy.where(ll_pt > 0., had_pt / ll_pt, 1.0)
 
-        cos_thll  = bp_dr.Dot(ll_3v) / (ll_3v.R() * bp_dr.R())
-        sin_thll  = math.sqrt(1.0 - cos_thll ** 2 )
-        ll_pt     = ll_3v.R() * sin_thll
+        return alpha
+    # -------------------------------
+    @staticmethod
+    def _get_mass(particle : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        particle: Array of Lorentz vectors, (px, py, pz, E)
 
-        alpha     = had_pt / ll_pt if ll_pt > 0. else 1.0
+        Returns
+        -----------------
+        Array of masses, negative for space-like vectors, as done by ROOT
+        '''
+        mass2 = particle[:, 3] ** 2 - numpy.sum(particle[:, :3] ** 2, axis=1)
 
-        return alpha
+        return numpy.sign(mass2) * numpy.sqrt(numpy.abs(mass2))
     # -------------------------------
-    def _correct_kinematics(self, alpha : float, particle : LorentzVector) -> LorentzVector:
-        px = alpha * particle.px()
-        py = alpha * particle.py()
-        pz = alpha * particle.pz()
-        ms =         particle.M()
+    def _correct_kinematics(self, alpha : numpy.ndarray, particle : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------------
+        alpha   : Array of factors used to scale momenta
+        particle: Array of Lorentz vectors, (px, py, pz, E)
+
+        Returns
+        -----------------
+        Array of Lorentz vectors with scaled momenta and same masses
+        '''
+        mass     = self._get_mass(particle=particle)
+        momentum = alpha[:, None] * particle[:, :3]
+        energy2  = numpy.sum(momentum ** 2, axis=1) + numpy.sign(mass) * mass ** 2
+        energy   = numpy.sqrt(numpy.clip(energy2, 0, None))
 
-        return LorentzVector('ROOT::Math::PxPyPzM4D<double>')(px, py, pz, ms)
+        return numpy.column_stack([momentum, energy])
     # -------------------------------
-    def _get_values(self) -> tuple[list[float], list[float]]:
-        l_l1 = self._get_xvector(ndim=4, name='L1_P'   )
-        l_l2 = self._get_xvector(ndim=4, name='L2_P'   )
-        l_hd = self._get_xvector(ndim=4, name='Hadrons')
-        l_pv = self._get_xvector(ndim=3, name='B_BPV'  )
-        l_sv = self._get_xvector(ndim=3, name='B_END_V')
-
-        l_alpha = []
-        l_mass  = []
-        for pv, sv, l1, l2, hd in zip(l_pv, l_sv, l_l1, l_l2, l_hd):
-            alpha   = self._get_alpha(pv, sv, l1, l2, hd)
-            l1_corr = self._correct_kinematics(alpha, l1)
-            l2_corr = self._correct_kinematics(alpha, l2)
-            mass    = (l1_corr + l2_corr + hd).M()
-
-            l_alpha.append(alpha)
-            l_mass.append(mass)
-
-        return l_alpha, l_mass
+    def _get_values(self) -> tuple[numpy.ndarray, numpy.ndarray, dict[str,numpy.ndarray]]:
+        '''
+        Returns
+        -----------------
+        Tuple with arrays of alpha, HOP masses and dictionary with extra branches
+        '''
+        d_data = self._get_data()
+
+        l1 = self._get_xvector(ndim=4, name='L1_P'   , d_data=d_data)
+        l2 = self._get_xvector(ndim=4, name='L2_P'   , d_data=d_data)
+        hd = self._get_xvector(ndim=4, name='Hadrons', d_data=d_data)
+        pv = self._get_xvector(ndim=3, name='B_BPV'  , d_data=d_data)
+        sv = self._get_xvector(ndim=3, name='B_END_V', d_data=d_data)
+
+        arr_alpha = self._get_alpha(pv, sv, l1, l2, hd)
+        l1_corr   = self._correct_kinematics(arr_alpha, l1)
+        l2_corr   = self._correct_kinematics(arr_alpha, l2)
+        arr_mass  = self._get_mass(particle=l1_corr + l2_corr + hd)
+
+        d_ext     = { name : d_data[name] for name in self._extra_branches }
+
+        return arr_alpha, arr_mass, d_ext
     # -------------------------------
     def get_rdf(self, preffix : str) -> RDF.RNode:
         '''
@@ -158,18 +221,15 @@ class HOPCalculator:
         ----------------
         prefix: Prefix used for HOP variables, i.e. {prefix}_alpha, {prefix}_mass, ...
 
-        Returns 
+        Returns
         ----------------
         ROOT dataframe with HOP variables
         '''
 
-        l_alpha, l_mass = self._get_values()
-        arr_alpha       = numpy.array(l_alpha)
-        arr_mass        = numpy.array(l_mass )
-        d_data          = {f'{preffix}_alpha' : arr_alpha, f'{preffix}_mass' : arr_mass}
+        arr_alpha, arr_mass, d_ext = self._get_values()
+        d_data = {f'{preffix}_alpha' : arr_alpha, f'{preffix}_mass' : arr_mass}
 
         # Add EVENTNUMBER, RUNNUMBER, etc
-        d_ext           = self._rdf.AsNumpy(self._extra_branches)
         d_data.update(d_ext)
 
         rdf = RDF.FromNumpy(d_data)
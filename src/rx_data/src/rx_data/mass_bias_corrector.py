@@ -12,6 +12,8 @@ import vector
 from vector._methods                 import VectorProtocolSpatial
 from vector                          import MomentumObject3D as v3d
 from vector                          import MomentumObject4D as v4d
+from vector                          import MomentumNumpy3D  as v3d_arr
+from vector                          import MomentumNumpy4D  as v4d_arr
 from dmu.logging.log_store           import LogStore
 from rx_common                       import Project, info
 from dmu.generic                     import typing_utilities as tut
@@ -46,7 +48,8 @@ class MassBiasCorrector:
         skip_correction       : bool  = False,
         nthreads              : int   = 1,
         brem_energy_threshold : float = 400,
-        ecorr_kind            : str   = 'brem_track_2'):
+        ecorr_kind            : str   = 'brem_track_2',
+        vectorized            : bool  = True):
         '''
         Parameters
         --------------
@@ -56,12 +59,15 @@ class MassBiasCorrector:
         nthreads             : Number of processes to use 
         brem_energy_threshold: Lowest energy that an ECAL cluster needs to have to be considered a photon, used as argument of ElectronBiasCorrector, default 0 (MeV)
         ecorr_kind           : Kind of correction to be added to electrons, [ecalo_bias, brem_track]
+        vectorized           : If True (default) will correct all the candidates at once, with columnar operations.
+                               Otherwise, will correct candidates one by one. Both give the same outputs.
         '''
         self._df : Final[pnd.DataFrame] = df
         self._is_mc                     = is_mc 
         self._trigger                   = trigger
         self._skip_correction           = skip_correction
         self._nproc                     = nthreads
+        self._vectorized                = vectorized
 
         if self._skip_correction:
             log.warning('Skipping correction')
@@ -242,12 +248,163 @@ class MassBiasCorrector:
 
         return row_cor
     # ------------------------------------------
+    # Vectorized implementation
+    # ------------------------------------------
+    def _correct_electrons_batch(self, df : pnd.DataFrame, name : str) -> pnd.DataFrame:
+        '''
+        Parameters
+        -------------------
+        df  : Pandas dataframe with candidates
+        name: Name of particle, e.g. L1
+
+        Returns
+        -------------------
+        Dataframe where electrons have been corrected, muons are left untouched
+        '''
+        arr_id  = numpy.abs(df[f'{name}_ID'].to_numpy())
+        arr_ele = arr_id == 11
+        arr_bad = (arr_id != 11) & (arr_id != 13)
+        if numpy.any(arr_bad):
+            lep_id = arr_id[arr_bad][0]
+            raise InvalidID(f'Unexpected lepton ID: {lep_id}')
+
+        if self._skip_correction or not numpy.any(arr_ele):
+            return df
+
+        df_ele = self._ebc.correct_batch(df[arr_ele], name=name, kind=self._ecorr_kind)
+        df.loc[arr_ele, df_ele.columns] = df_ele.to_numpy()
+
+        return df
+    # ----------------------
+    def _build_4dvec_batch(self, particle : str, df : pnd.DataFrame, mass : float) -> v4d_arr:
+        '''
+        Parameters
+        -------------
+        particle: Particle name, e.g. L1
+        df      : Pandas dataframe with candidates
+        mass    : Mass of particle
+
+        Returns
+        -------------
+        Array of Lorentz vectors for particle
+        '''
+        vec = vector.array({
+            'pt'  : df[f'{particle}_PT' ].to_numpy(),
+            'eta' : df[f'{particle}_ETA'].to_numpy(),
+            'phi' : df[f'{particle}_PHI'].to_numpy(),
+            'mass': numpy.full(len(df), mass)})
+
+        return cast(v4d_arr, vec)
+    # ------------------------------------------
+    def _calculate_dira_batch(
+        self,
+        df       : pnd.DataFrame,
+        momentum : v3d_arr,
+        particle : str) -> numpy.ndarray:
+        '''
+        Batch version of `_calculate_dira`
+        '''
+        pv = vector.array({
+            'x' : df[f'{particle}_BPVX'].to_numpy(),
+            'y' : df[f'{particle}_BPVY'].to_numpy(),
+            'z' : df[f'{particle}_BPVZ'].to_numpy()})
+
+        sv = vector.array({
+            'x' : df[f'{particle}_END_VX'].to_numpy(),
+            'y' : df[f'{particle}_END_VY'].to_numpy(),
+            'z' : df[f'{particle}_END_VZ'].to_numpy()})
+
+        dr = sv - pv
+
+        cos_theta = dr.dot(momentum) / (dr.mag * momentum.mag)
+
+        return numpy.asarray(cos_theta)
+    # ------------------------------------------
+    def _calculate_variables_batch(self, df : pnd.DataFrame) -> pnd.DataFrame:
+        '''
+        Batch version of `_calculate_variables`
+
+        Parameters
+        ----------------
+        df: Dataframe with candidates, after the correction
+
+        Returns
+        ----------------
+        Dataframe with recalculated kinematics
+        '''
+        l1 = self._build_4dvec_batch(particle='L1', df=df, mass=EMASS)
+        l2 = self._build_4dvec_batch(particle='L2', df=df, mass=EMASS)
+
+        if   self._project in [Project.rk, Project.rk_no_pid]:
+            hd = self._build_4dvec_batch(particle= 'H', df=df, mass=KMASS)
+        elif self._project in [Project.rkst, Project.rkst_no_pid]:
+            h1 = self._build_4dvec_batch(particle='H1', df=df, mass=KMASS)
+            h2 = self._build_4dvec_batch(particle='H2', df=df, mass=PIMASS)
+
+            hd = h1 + h2
+            hd = cast(v4d_arr, hd)
+        else:
+            raise ValueError(f'Invalid project: {self._project}')
+
+        jp = l1 + l2
+        bp = jp + hd
+
+        jp = cast(v4d_arr, jp)
+        bp = cast(v4d_arr, bp)
+
+        bmass = numpy.asarray(bp.mass)
+        jmass = numpy.asarray(jp.mass)
+
+        d_data = {
+            'B_M'    : numpy.where(numpy.isnan(bmass), -1, bmass),
+            'Jpsi_M' : numpy.where(numpy.isnan(jmass), -1, jmass),
+            # --------------
+            'B_PT'   : bp.pt,
+            'Jpsi_PT': jp.pt}
+
+        for lepton in ['L1', 'L2']:
+            for variable in ['PX', 'PY', 'PZ', 'PT']:
+                name         = f'{lepton}_{variable}'
+                d_data[name] = df[name].to_numpy()
+
+        for lepton in ['L1', 'L2']:
+            name         = f'{lepton}_HASBREMADDED'
+            d_data[name] = df[name].to_numpy()
+
+        d_data[   'B_DIRA_OWNPV'] = self._calculate_dira_batch(momentum=bp.to_Vector3D(), df=df, particle=   'B')
+        d_data['Jpsi_DIRA_OWNPV'] = self._calculate_dira_batch(momentum=jp.to_Vector3D(), df=df, particle='Jpsi')
+
+        df_var = pnd.DataFrame(d_data, index=df.index, dtype='float64')
+
+        return df_var
+    # ------------------------------------------
+    def _get_corrected_df_batch(self) -> pnd.DataFrame:
+        '''
+        Returns
+        -------------
+        Dataframe after correction, done on whole columns
+        '''
+        # Row-wise correction upcasts every row to float64, do the same here
+        # such that both implementations give the same outputs
+        df = self._df.astype('float64')
+        df = self._correct_electrons_batch(df, 'L1')
+        df = self._correct_electrons_batch(df, 'L2')
+
+        # NOTE: The variable calculation has to be done AFTER the correction
+        df = self._calculate_variables_batch(df)
+
+        return df
+    # ------------------------------------------
     def _get_corrected_df(self) -> pnd.DataFrame:
         '''
         Returns
         -------------
         Dataframe after correction
         '''
+        if self._vectorized:
+            log.info('Using columnar operations to correct data')
+            return self._get_corrected_df_batch()
+
         if self._nproc == 1:
             log.info('Using single process to correct data')
             return self._df.apply(self._calculate_correction, axis=1)
@@ -1,14 +1,14 @@
 '''
 Module containing MassCalculator class
 '''
+import numpy
 import pandas as pnd
 
-from typing      import cast
 from ROOT        import RDF # type: ignore
-from particle    import Particle         as part
-from vector      import MomentumObject4D as v4d
+from vector      import MomentumNumpy4D as v4d_arr
 from dmu         import LogStore
-from dmu.generic import typing_utilities as tut
+
+from .           import mass_hypotheses as mhy
 
 log=LogStore.add_logger('rx_data:mass_calculator')
 # ---------------------------
@@ -18,6 +18,8 @@ class MassCalculator:
     These are meant to be different from the Swap branches because
     the full candidate is meant to be rebuilt with different mass
     hypotheses for the tracks
+
+    All the candidates are processed at once, as arrays
     '''
     # ----------------------
     def __init__(
@@ -33,45 +35,50 @@ class MassCalculator:
         self._rdf             = rdf
         self._with_validation = with_validation
     # ----------------------
-    def _get_columns(self, row) -> pnd.Series:
+    def _get_columns(self, df : pnd.DataFrame) -> pnd.DataFrame:
         '''
+        Parameters
+        -------------
+        df: Dataframe with kinematics of candidates
+
         Returns
         -------------
-        Row of pandas dataframe with masses
+        Dataframe with masses
         '''
-        evt  = tut.numeric_from_series(row, 'EVENTNUMBER',   int)
-        run  = tut.numeric_from_series(row, 'RUNNUMBER'  ,   int)
-        data : dict[str,float|int]= {'EVENTNUMBER' : evt, 'RUNNUMBER' : run}
+        data : dict[str,numpy.ndarray] = {
+            'EVENTNUMBER' : df['EVENTNUMBER'].to_numpy(),
+            'RUNNUMBER'   : df['RUNNUMBER'  ].to_numpy()}
 
-        data['B_Mass_hdpipi'] = self._get_hxy_mass(row=row, x=211, y=211)
-        data['B_Mass_hdkk'  ] = self._get_hxy_mass(row=row, x=321, y=321)
+        had_4d = self._get_hadronic_system_4d(df=df)
 
-        if not self._with_validation:
-            return pnd.Series(data) 
+        data['B_Mass_hdpipi'] = self._get_hxy_mass(df=df, had_4d=had_4d, x=211, y=211)
+        data['B_Mass_hdkk'  ] = self._get_hxy_mass(df=df, had_4d=had_4d, x=321, y=321)
 
-        data['B_M'         ] = tut.numeric_from_series(row, 'B_M', float)
-        data['B_Mass_check'] = self._get_hxy_mass(row=row, x= 11, y= 11)
+        if not self._with_validation:
+            return pnd.DataFrame(data)
 
-        sr = pnd.Series(data) 
+        data['B_M'         ] = df['B_M'].to_numpy(dtype='float64')
+        data['B_Mass_check'] = self._get_hxy_mass(df=df, had_4d=had_4d, x= 11, y= 11)
 
-        return sr
+        return pnd.DataFrame(data)
     # ----------------------
     def _get_hxy_mass(
         self,
-        row : pnd.Series,
-        x   : int,
-        y   : int) -> float:
+        df     : pnd.DataFrame,
+        had_4d : v4d_arr,
+        x      : int,
+        y      : int) -> numpy.ndarray:
         '''
         Parameters
         -------------
-        row: Series with event information
-        x/y: PDG ID to replace L1/L2 lepton with
+        df    : Dataframe with kinematics of candidates
+        had_4d: Four momenta of hadronic system
+        x/y   : PDG ID to replace L1/L2 lepton with
 
         Returns
         -------------
-        Value of mass when leptons get pion, hadron, etc mass hypothesis
+        Values of mass when leptons get pion, hadron, etc mass hypothesis
         '''
-        log.verbose('')
         log.verbose(f'Finding B mass for tracks: {x}/{y}')
 
         name_1 = self._column_name_from_pdgid(pid=x, preffix='L1')
@@ -79,14 +86,12 @@ class MassCalculator:
 
         log.verbose(f'Will use particles: {name_1}/{name_2}')
 
-        had_4d = self._get_hadronic_system_4d(row=row)
-        par_1  = self._get_particle(row=row, name=name_1, pid=x)
-        par_2  = self._get_particle(row=row, name=name_2, pid=y)
+        par_1  = self._get_particle(df=df, name=name_1, pid=x)
+        par_2  = self._get_particle(df=df, name=name_2, pid=y)
 
         candidate = had_4d + par_1 + par_2
-        candidate = cast(v4d, candidate)
 
-        return candidate.mass
+        return numpy.asarray(candidate.mass, dtype='float64')
     # ----------------------
     def _column_name_from_pdgid(
         self,
@@ -114,35 +119,32 @@ class MassCalculator:
 
         raise ValueError(f'Invalid PID: {pid}')
     # ----------------------
-    def _get_hadronic_system_4d(self, row : pnd.Series) -> v4d:
+    def _get_hadronic_system_4d(self, df : pnd.DataFrame) -> v4d_arr:
         '''
         Parameters
         -------------
-        row: Pandas series with event information
+        df: Dataframe with kinematics of candidates
 
         Returns
         -------------
-        Four momentum vector of hadronic system
+        Four momentum vectors of hadronic system
         '''
-        b_4d  = self._get_particle(row=row, name= 'B', pid=   0) # mass from B_M
-        l1_4d = self._get_particle(row=row, name='L1', pid=None) # mass from PDG ID, taken from L*_ID
-        l2_4d = self._get_particle(row=row, name='L2', pid=None) # mass from PDG ID, taken from L*_ID
-
-        res   = b_4d - l1_4d - l2_4d
-        res   = cast(v4d, res)
+        b_4d  = self._get_particle(df=df, name= 'B', pid=   0) # mass from B_M
+        l1_4d = self._get_particle(df=df, name='L1', pid=None) # mass from PDG ID, taken from L*_ID
+        l2_4d = self._get_particle(df=df, name='L2', pid=None) # mass from PDG ID, taken from L*_ID
 
-        return res
+        return b_4d - l1_4d - l2_4d
     # ----------------------
     def _get_particle(
         self,
-        row  : pnd.Series,
+        df   : pnd.DataFrame,
         name : str,
-        pid  : int|None) -> v4d:
+        pid  : int|None) -> v4d_arr:
         '''
         Parameters
         -------------
-        row  : Pandas series with event information
-        name : Name of particle whose 4D vector to extract
+        df   : Dataframe with kinematics of candidates
+        name : Name of particle whose 4D vectors to extract
         pid  : PDG ID used to extract particle mass:
                0   : Use value from {name}_M branch
                None: Use PDG mass from particle with ID {name}_ID
@@ -150,20 +152,21 @@ class MassCalculator:
 
         Returns
         -------------
-        4D vector for particle
+        4D vectors for particle
         '''
-        pt   = tut.numeric_from_series(row, f'{name}_PT' , float)
-        et   = tut.numeric_from_series(row, f'{name}_ETA', float)
-        ph   = tut.numeric_from_series(row, f'{name}_PHI', float)
-        mass = self._mass_from_pid(pid=pid, name=name, row=row)
+        mass = self._mass_from_pid(pid=pid, name=name, df=df)
 
-        return v4d(pt=pt, eta=et, phi=ph, mass=mass)
+        return mhy.momentum_from_pt_eta_phi(
+            pt   = df[f'{name}_PT' ].to_numpy(),
+            eta  = df[f'{name}_ETA'].to_numpy(),
+            phi  = df[f'{name}_PHI'].to_numpy(),
+            mass = mass)
     # ----------------------
-    def _mass_from_pid(self, pid : int|None, name : str, row : pnd.Series) -> float:
+    def _mass_from_pid(self, pid : int|None, name : str, df : pnd.DataFrame) -> numpy.ndarray|float:
         '''
         Parameters
         -------------
-        row  : Pandas series with event information
+        df   : Dataframe with kinematics of candidates
         name : Name of particle whose 4D vector to extract
         pid  : PDG ID used to extract particle mass:
                0   : Use value from {name}_M branch
@@ -172,23 +175,18 @@ class MassCalculator:
 
         Returns
         -------------
-        Mass of particle
+        Mass of particle, either an array or a single value
         '''
         # At this point we might have L1_TRACK
         name = name.replace('TRACK_', '')
 
         if pid == 0:
-            return tut.numeric_from_series(row, f'{name}_M', float)
+            return df[f'{name}_M'].to_numpy(dtype='float64')
 
         if pid is None:
-            pid = tut.numeric_from_series(row, f'{name}_ID', int)
-
-        particle = part.from_pdgid(pid)
-        mass     = particle.mass
-        if mass is None:
-            raise ValueError(f'Cannot find mass of particle with ID: {pid}')
+            return mhy.masses_from_ids(arr_id=df[f'{name}_ID'].to_numpy())
 
-        return mass 
+        return mhy.get_mass(pid=pid)
     # ----------------------
     def _is_valid_column(self, name : str) -> bool:
         '''
@@ -248,7 +246,7 @@ class MassCalculator:
         df  = self._get_dataframe()
 
         log.debug('Calculating masses')
-        df  = df.apply(self._get_columns, axis=1)
+        df  = self._get_columns(df=df)
 
         log.debug('Building ROOT dataframe with required information')
         data= { name : df[name].to_numpy() for name in df.columns }
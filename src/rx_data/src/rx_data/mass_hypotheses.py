@@ -0,0 +1,159 @@
+'''
+Module with functions used to calculate masses of candidates, or combinations of tracks,
+under different mass hypotheses. They act on arrays, one entry per candidate
+'''
+from functools   import cache
+
+import numpy
+import vector
+from particle    import Particle        as part
+from vector      import MomentumNumpy4D as v4d_arr
+from dmu         import LogStore
+
+log=LogStore.add_logger('rx_data:mass_hypotheses')
+# ---------------------------------
+@cache
+def _get_particle(pid : int) -> part:
+    try:
+        return part.from_pdgid(pid)
+    except Exception as exc:
+        raise ValueError(f'Cannot create particle for PDGID: {pid}') from exc
+# ---------------------------------
+@cache
+def get_mass(pid : int) -> float:
+    '''
+    Parameters
+    -------------
+    pid: PDG ID of particle
+
+    Returns
+    -------------
+    PDG mass in MeV
+    '''
+    mass = _get_particle(pid=pid).mass
+    if mass is None:
+        raise ValueError(f'Cannot find mass of particle with ID: {pid}')
+
+    return float(mass)
+# ---------------------------------
+@cache
+def get_charge(pid : int) -> float:
+    '''
+    Parameters
+    -------------
+    pid: PDG ID of particle
+
+    Returns
+    -------------
+    Charge of particle
+    '''
+    charge = _get_particle(pid=pid).charge
+    if charge is None:
+        raise ValueError(f'Cannot find charge of particle with ID: {pid}')
+
+    return float(charge)
+# ---------------------------------
+def _from_ids(arr_id : numpy.ndarray, fun) -> numpy.ndarray:
+    '''
+    Evaluates `fun` once for each distinct ID and maps back the results
+    '''
+    arr_id           = numpy.asarray(arr_id).astype(int)
+    arr_uid, arr_inv = numpy.unique(arr_id, return_inverse=True)
+    arr_val          = numpy.array([ fun(int(pid)) for pid in arr_uid ], dtype='float64')
+
+    return arr_val[arr_inv.ravel()]
+# ---------------------------------
+def masses_from_ids(arr_id : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    arr_id: Array of PDG IDs
+
+    Returns
+    -------------
+    Array of PDG masses
+    '''
+    return _from_ids(arr_id=arr_id, fun=get_mass)
+# ---------------------------------
+def charges_from_ids(arr_id : numpy.ndarray) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    arr_id: Array of PDG IDs
+
+    Returns
+    -------------
+    Array of charges
+    '''
+    return _from_ids(arr_id=arr_id, fun=get_charge)
+# ---------------------------------
+def momentum_from_pt_eta_phi(
+    pt   : numpy.ndarray,
+    eta  : numpy.ndarray,
+    phi  : numpy.ndarray,
+    mass : numpy.ndarray|float) -> v4d_arr:
+    '''
+    Parameters
+    -------------
+    pt, eta, phi: Arrays with kinematics of particles
+    mass        : Array with masses or single mass for all particles
+
+    Returns
+    -------------
+    Array of 4D vectors
+    '''
+    pt   = numpy.asarray(pt , dtype='float64')
+    mass = numpy.broadcast_to(numpy.asarray(mass, dtype='float64'), pt.shape)
+
+    return vector.array({
+        'pt'   : pt,
+        'eta'  : numpy.asarray(eta, dtype='float64'),
+        'phi'  : numpy.asarray(phi, dtype='float64'),
+        'mass' : mass})
+# ---------------------------------
+def momentum_from_px_py_pz(
+    px   : numpy.ndarray,
+    py   : numpy.ndarray,
+    pz   : numpy.ndarray,
+    mass : numpy.ndarray|float) -> v4d_arr:
+    '''
+    Parameters
+    -------------
+    px, py, pz: Arrays with components of momenta
+    mass      : Array with masses or single mass for all particles
+
+    Returns
+    -------------
+    Array of 4D vectors
+    '''
+    p3d = vector.array({
+        'px' : numpy.asarray(px, dtype='float64'),
+        'py' : numpy.asarray(py, dtype='float64'),
+        'pz' : numpy.asarray(pz, dtype='float64')})
+
+    return momentum_from_pt_eta_phi(pt=p3d.pt, eta=p3d.eta, phi=p3d.phi, mass=mass)
+# ---------------------------------
+def pick_combination(
+    arr_ok  : numpy.ndarray,
+    rng     : numpy.random.Generator) -> numpy.ndarray:
+    '''
+    Parameters
+    -------------
+    arr_ok : Array of booleans with shape (ncandidates, ncombinations), true for combinations that can be picked
+    rng    : Random number generator, used to pick among valid combinations
+
+    Returns
+    -------------
+    Array with index of combination picked for each candidate, picked randomly among valid combinations
+    '''
+    arr_nok = arr_ok.sum(axis=1)
+    if numpy.any(arr_nok == 0):
+        raise ValueError('No track combinations found')
+
+    # Index, among the valid combinations, of the one picked
+    arr_pick = numpy.floor(rng.random(len(arr_nok)) * arr_nok).astype(int)
+    arr_rank = numpy.cumsum(arr_ok, axis=1) - 1
+    arr_sel  = arr_ok & (arr_rank == arr_pick[:, None])
+
+    return numpy.argmax(arr_sel, axis=1)
+# ---------------------------------
@@ -11,7 +11,7 @@ import joblib
 import numpy
 import pandas as pnd
 
-from ROOT                  import RDF # type: ignore
+from ROOT                  import RDF, GetThreadPoolSize # type: ignore
 from dmu.ml.cv_predict     import CVClassifier, CVPredict
 from dmu.logging.log_store import LogStore
 from dmu.generic           import version_management as vman
@@ -44,6 +44,12 @@ class MVACalculator:
         nfold  : Number of expected folds, 10 by default. Used to validate inputs
         dry_run: If true, will not evaluate models, but stop early and assign 1s
         '''
+        # The index is used to put the scores back in the order of the entries
+        # with multithreading rdfentry_ is not the entry number
+        nthreads = GetThreadPoolSize()
+        if nthreads > 1:
+            raise ValueError(f'Cannot calculate MVA scores with multithreading, using {nthreads} threads')
+
         rdf = rdf.Define('index', 'rdfentry_')
 
         self._rdf         = rdf
@@ -58,7 +64,8 @@ class MVACalculator:
         self._default_q2  = Qsq.central # Any entry not in [low, central, high] bins will go to this bin for prediction
         self._version     = version
         self._project     = info.project_from_trigger(trigger=trigger, lower_case=True)
-        self._l_model     : list[CVClassifier]
+        self._d_model     : dict[str,list[CVClassifier]] = {} # Models, per directory
+        self._l_q2bin     = [Qsq.low, Qsq.central, Qsq.high, Qsq.none]
         self._dry_run     = dry_run
     #---------------------------------
     def _get_q2_selection(self, q2bin : Qsq) -> str:
@@ -106,44 +113,22 @@ class MVACalculator:
         log.debug(f'{q2bin:<10}{q2_cut}')
         rdf = rdf.Filter(q2_cut, 'q2')
 
-        nentries = rdf.Count().GetValue()
-
-        if nentries == 0:
-            log.warning(f'Found {nentries} entries for {q2bin} bin')
-        else:
-            log.debug(f'Found {nentries} entries for {q2bin} bin')
-
         return rdf
     # ----------------------------------------
-    def _q2_scores(
-        self,
-        d_path : dict[str,str],
-        q2bin  : Qsq) -> numpy.ndarray:
+    def _get_models(self, path : str) -> list[CVClassifier]:
         '''
         Parameters
         -----------
-        d_path: Dictionary mapping q2bin to path to models
-        q2bin : q2 bin
+        path: Path to directory with models
 
         Returns
         -----------
-        2D Array with indexes and MVA scores
+        List of models, one per fold, loaded once per directory
         '''
-        rdf     = self._apply_q2_cut(rdf=self._rdf, q2bin=q2bin)
-        nentries= rdf.Count().GetValue()
-        if nentries == 0:
-            log.warning(f'No entries found for q2 bin: {q2bin}')
-            return numpy.column_stack(([], []))
+        if path in self._d_model:
+            return self._d_model[path]
 
-        # The dataframe has the correct cut applied
-        # From here onwards, if the q2bin is non-rare (rest)
-        # Will use default_q2 model
-        if q2bin == Qsq.none:
-            q2bin = self._default_q2
-
-        path   = d_path[q2bin]
         l_pkl  = glob.glob(f'{path}/*.pkl')
-
         npkl   = len(l_pkl)
         if npkl == 0:
             raise ValueError(f'No pickle files found in {path}')
@@ -151,7 +136,63 @@ class MVACalculator:
         log.info(f'Using {npkl} pickle files from: {path}')
         l_model = [ joblib.load(pkl_path) for pkl_path in l_pkl ]
 
-        cvp     = CVPredict(models=l_model, rdf=rdf)
+        self._d_model[path] = l_model
+
+        return l_model
+    # ----------------------------------------
+    def _book_predictions(
+        self,
+        d_path   : dict[str,str],
+        d_q2_rdf : dict[Qsq,RDF.RNode]) -> dict[Qsq,CVPredict]:
+        '''
+        Parameters
+        -----------
+        d_path  : Dictionary mapping q2bin to path to models
+        d_q2_rdf: Dictionary mapping q2bin to dataframe with q2 selection applied
+
+        Returns
+        -----------
+        Dictionary mapping q2bin to object used to predict scores, with
+        the reading of the features booked, but not done
+        '''
+        d_cvp = {}
+        for q2bin, rdf in d_q2_rdf.items():
+            # If the q2bin is non-rare (rest)
+            # will use default_q2 model
+            model_q2bin = self._default_q2 if q2bin == Qsq.none else q2bin
+
+            l_model = self._get_models(path=d_path[model_q2bin])
+            cvp     = CVPredict(models=l_model, rdf=rdf)
+            if not self._dry_run:
+                cvp.book()
+
+            d_cvp[q2bin] = cvp
+
+        return d_cvp
+    # ----------------------------------------
+    def _q2_scores(
+        self,
+        cvp     : CVPredict,
+        arr_ind : numpy.ndarray,
+        q2bin   : Qsq) -> numpy.ndarray:
+        '''
+        Parameters
+        -----------
+        cvp    : Object used to predict scores, for candidates in q2 bin
+        arr_ind: Array with indexes of candidates in q2 bin
+        q2bin  : q2 bin
+
+        Returns
+        -----------
+        2D Array with indexes and MVA scores
+        '''
+        nentries = len(arr_ind)
+        if nentries == 0:
+            log.warning(f'No entries found for q2 bin: {q2bin}')
+            return numpy.column_stack(([], []))
+
+        log.debug(f'Found {nentries} entries for {q2bin} bin')
+
         if self._dry_run:
             log.warning(f'Using {nentries} ones for dry run MVA scores')
             arr_prb = numpy.ones(nentries)
@@ -159,10 +200,8 @@ class MVACalculator:
             try:
                 arr_prb = cvp.predict()
             except ValueError as exc:
-                rdf.Display().Print()
                 raise ValueError(f'Prediction failed for {q2bin} bin with {nentries} entries') from exc
 
-        arr_ind = rdf.AsNumpy(['index'])['index']
         arr_res = numpy.column_stack((arr_ind, arr_prb))
 
         log.debug(f'Shape: {arr_res.shape}')
@@ -171,26 +210,26 @@ class MVACalculator:
     # ----------------------------------------
     def _get_scores(
         self,
-        d_path : dict[str,str]) -> numpy.ndarray:
+        d_cvp    : dict[Qsq,CVPredict],
+        d_index  : dict[Qsq,numpy.ndarray],
+        nentries : int) -> numpy.ndarray:
         '''
         Parameters
         ------------------
-        d_path: Dictionary mapping q2bin to path to models
+        d_cvp   : Dictionary mapping q2bin to object used to predict scores
+        d_index : Dictionary mapping q2bin to indexes of candidates in that bin
+        nentries: Number of candidates in dataframe
 
         Returns
         ------------------
         Array of signal probabilities
         '''
-        arr_low     = self._q2_scores(d_path=d_path, q2bin=Qsq.low    )
-        arr_central = self._q2_scores(d_path=d_path, q2bin=Qsq.central)
-        arr_high    = self._q2_scores(d_path=d_path, q2bin=Qsq.high   )
-        arr_rest    = self._q2_scores(d_path=d_path, q2bin=Qsq.none   )
-        arr_all     = numpy.concatenate((arr_low, arr_central, arr_high, arr_rest))
+        l_arr_q2 = [ self._q2_scores(cvp=cvp, arr_ind=d_index[q2bin], q2bin=q2bin) for q2bin, cvp in d_cvp.items() ]
+        arr_all  = numpy.concatenate(l_arr_q2)
 
         arr_ind = arr_all.T[0]
         arr_val = arr_all.T[1]
 
-        nentries     = self._rdf.Count().GetValue()
         arr_obtained = numpy.sort(arr_ind)
         arr_expected = numpy.arange(nentries + 1)
         if  numpy.array_equal(arr_obtained, arr_expected):
@@ -283,16 +322,24 @@ class MVACalculator:
         if kind not in ['root', 'pandas']:
             raise NotImplementedError(f'Invalid format {kind}')
 
-        d_mva_kind  = self._get_mva_dirs()
+        # All the lazy actions below run in the same event loop, triggered by the first GetValue
+        d_mva_kind = self._get_mva_dirs()
+        d_q2_rdf   = { q2bin : self._apply_q2_cut(rdf=self._rdf, q2bin=q2bin) for q2bin in self._l_q2bin }
+        d_q2_index = { q2bin : rdf.AsNumpy(['index'], lazy=True)           for q2bin, rdf in d_q2_rdf.items() }
+        d_kind_cvp = { name  : self._book_predictions(d_path=d_path, d_q2_rdf=d_q2_rdf) for name, d_path in d_mva_kind.items() }
+        res_data   = self._rdf.AsNumpy(['RUNNUMBER', 'EVENTNUMBER'], lazy=True)
+
+        log.info('Reading features, indexes, run and event numbers')
+        d_data   = res_data.GetValue()
+        d_index  = { q2bin : res.GetValue()['index'] for q2bin, res in d_q2_index.items() }
+        nentries = len(d_data['RUNNUMBER'])
+
         d_mva_score = {}
-        for name, d_path in d_mva_kind.items():
+        for name, d_cvp in d_kind_cvp.items():
             log.info(f'Calculating {name} scores')
-            arr_score = self._get_scores(d_path=d_path)
+            arr_score = self._get_scores(d_cvp=d_cvp, d_index=d_index, nentries=nentries)
             d_mva_score[f'mva_{name}'] = arr_score
 
-        log.info('Retrieving run number and event number columns')
-        d_data = self._rdf.AsNumpy(['RUNNUMBER', 'EVENTNUMBER'])
-
         log.info('Adding classifier columns')
         d_data.update(d_mva_score)
 
@@ -7,14 +7,16 @@ import numpy
 from contextlib   import contextmanager
 from pathlib      import Path
 from typing       import Any, overload, Literal
-from ROOT         import RDF, GetThreadPoolSize, TFile # type: ignore
+from ROOT         import RDF, GetThreadPoolSize, EnableImplicitMT, DisableImplicitMT # type: ignore
 from dmu          import LogStore
 from dmu.generic  import hashing
 from dmu.generic  import utilities as gut
+from dmu.rdataframe.expression_library import ExpressionLibrary
 from omegaconf    import DictConfig, OmegaConf
 from rx_common    import Component, Trigger
 from .spec_maker  import SpecMaker
 from .rdf_loader  import RDFLoader
+from .uuid_index  import UUIDIndex
 
 log=LogStore.add_logger('rx_data:rdf_getter')
 # ---------------------------------------------------
@@ -38,9 +40,14 @@ class RDFGetter(SpecMaker):
     max_entries : Limits the number of entries that will be provided
     friends     : List of names of samples, to be treated as friend trees. By default this is None and everything will be processed
     skip_adding_columns : By default false. If true, it will skip defining new columns.
+    lazy        : By default false. If true, no event loop will be run when building the dataframes
+    nthreads    : By default 1. Number of threads used by ROOT, when implicit multithreading is enabled through `multithreading`
     '''
     _max_entries                      = -1
+    _nthreads                         = 1
     _skip_adding_columns              = False
+    _lazy                             = False
+    _l_booked_checks  : list[Any]     = [] # Lazy alignment checks, need to be kept alive until they run
     _d_custom_columns : dict[str,str] = {}
     # ---------------------------------------------------
     def __init__(
@@ -152,13 +159,27 @@ class RDFGetter(SpecMaker):
     def _check_multithreading(self) -> None:
         '''
         This method will raise if running with mulithreading and if it was not explicitly allowed
+        through the `multithreading` context manager
         '''
         nthreads = GetThreadPoolSize()
+        if nthreads > 1 and self._nthreads == 1:
+            raise ValueError(f'Cannot run with mulithreading, using {nthreads} threads, use RDFGetter.multithreading')
+
         if nthreads > 1:
-            raise ValueError(f'Cannot run with mulithreading, using {nthreads} threads')
+            log.debug(f'Using multithreading with {nthreads} threads')
+            return
 
         log.debug('Not using multithreading')
     # ---------------------------------------------------
+    @staticmethod
+    def _is_multithreaded() -> bool:
+        '''
+        Returns
+        -------------
+        True if ROOT is running with implicit multithreading
+        '''
+        return GetThreadPoolSize() > 1
+    # ---------------------------------------------------
     # TODO: This class is pretty large, all the lines below
     # have one job, adding columns to dataframe, put them in a class
     # ---------------------------------------------------
@@ -332,10 +353,7 @@ class RDFGetter(SpecMaker):
         for var, expr in d_def.items():
             rdf = self._add_column(redefine=False, rdf=rdf, name=var, definition=expr)
 
-        try:
-            rdf = RDFGetter.add_truem(rdf=rdf, cfg=self._cfg)
-        except TypeError as exc:
-            raise TypeError(f'Cannot add TRUEM branches to {self._sample}/{self._trigger}') from exc
+        rdf = RDFGetter.add_truem(rdf=rdf, cfg=self._cfg)
 
         return rdf
     # ---------------------------------------------------
@@ -423,29 +441,38 @@ class RDFGetter(SpecMaker):
             log.debug(f'Not adding columns to {self._tree_name}')
             return rdf
 
-        rdf = self._define_mc_columns(rdf=rdf)
-        rdf = self._define_data_columns(rdf=rdf)
+        # The definitions below are collected and compiled together
+        # the ExpressionLibrary has the same Define/Redefine interface as the dataframe
+        exl = ExpressionLibrary(rdf=rdf)
+        exl = self._define_mc_columns(rdf=exl)
+        exl = self._define_data_columns(rdf=exl)
 
         # Common definitions need to happen after sample specific ones
         # e.g. TRACK_PT needs to be put in place before q2_track
-        rdf = self._define_common_columns(rdf=rdf)
+        exl = self._define_common_columns(rdf=exl)
 
         # Redefinitions need to come after definitions
         # Because they might be in function of defined columns
         # E.g. q2 -> Jpsi_Mass
-        rdf = self._redefine_columns(rdf=rdf)
+        exl = self._redefine_columns(rdf=exl)
 
         # This should add placeholder branches for columns
         # not yet added to dataframe.
         # It needs to go at the end of function
-        rdf = self._define_temporary_columns(rdf=rdf)
+        exl = self._define_temporary_columns(rdf=exl)
+
+        # The expressions are only applied here, i.e. invalid definitions fail here
+        try:
+            rdf = exl.get_rdf()
+        except ValueError as exc:
+            raise ValueError(f'Cannot add columns to {self._sample}/{self._trigger}') from exc
 
         return rdf
     # ---------------------------------------------------
     def _rdf_from_conf(
         self, 
         fpath     : Path | str,
-        conf_path : Path) -> RDF.RNode:
+        conf_path : Path) -> tuple[RDF.RNode, int]:
         '''
         Parameters
         ------------------
@@ -454,60 +481,70 @@ class RDFGetter(SpecMaker):
 
         Returns
         ------------------
-        Dataframe after some basic preprocessing
+        Tuple with:
+
+        - Dataframe after some basic preprocessing
+        - Number of entries in dataframe
         '''
         log.debug(f'Building dataframe from {conf_path} for {fpath}')
 
         rdf = RDFLoader.from_conf(
             ntries = 10,
             wait   = 30,
-            path   = conf_path)
+            path   = conf_path,
+            lazy   = self._lazy)
         
-        nentries = rdf.Count().GetValue()
+        nentries = RDFLoader.get_entries(path=conf_path)
         if nentries == 0:
             log.warning(f'Found empty dataframe for {fpath}')
-            return rdf 
+            return rdf, nentries
 
         self._l_columns = [ name.c_str() for name in rdf.GetColumnNames() ]
         log.debug(f'Dataframe at: {id(rdf)}')
 
-        rdf = self._filter_dataframe(rdf=rdf)
+        rdf, nentries = self._filter_dataframe(rdf=rdf, ntot=nentries)
         if self._skip_adding_columns:
             log.warning('Not adding new columns')
-            return rdf
+            return rdf, nentries
         try:
             rdf = self._add_columns(rdf=rdf)
         except Exception as exc:
             raise ValueError(f'Cannot define columns for: {fpath}') from exc
 
-        return rdf
+        return rdf, nentries
     # ---------------------------------------------------
-    def _filter_dataframe(self, rdf : RDF.RNode) -> RDF.RNode:
+    def _filter_dataframe(self, rdf : RDF.RNode, ntot : int) -> tuple[RDF.RNode, int]:
         '''
         Parameters
         ------------
-        rdf :  DataFame built from JSON spec file
+        rdf : DataFame built from JSON spec file
+        ntot: Number of entries in dataframe
 
         Returns
         ------------
-        Dataframe after optional filter
+        Tuple with dataframe after optional filter and number of entries after filter
         '''
         nent = self._max_entries
         if nent < 0:
-            return rdf
+            return rdf, ntot
 
-        ntot = rdf.Count().GetValue()
         if nent > ntot:
             log.warning(f'Required number of entries {nent} larger than dataset size {ntot}')
-            return rdf
+            return rdf, ntot
+
+        # Range is not supported with implicit multithreading and rdfentry_ is not
+        # the entry number there, i.e. a filter on it would pick arbitrary entries
+        if self._is_multithreaded():
+            raise ValueError(f'Cannot pick {nent} entries with multithreading, use RDFGetter.multithreading(nthreads=1)')
 
         log.debug(f'Filtering for a range of {nent} entries')
         self._d_info['range'] = 0, nent 
-        rdf  = rdf.Range(0, nent)
+
+        rdf = rdf.Range(0, nent)
 
         log.warning(f'Picking up range: [{0}, {nent}] ')
 
-        return rdf
+        return rdf, nent
     # ----------------------
     @overload
     def get_rdf(self, per_file : Literal[False]) -> RDF.RNode:...
@@ -540,37 +577,108 @@ class RDFGetter(SpecMaker):
         if per_file:
             d_sample = self.get_spec_path(per_file=per_file)
             log.info('Building one dataframe per file')
-            d_rdf       = { fpath : self._rdf_from_conf(fpath=fpath, conf_path=conf_path) for fpath, conf_path in d_sample.items() }
-            d_rdf       = { fpath : self._emulator.post_process(rdf=rdf)                  for fpath, rdf       in d_rdf.items() }
-            self._d_rdf = { fpath : self._check_rdf(rdf = rdf)                            for fpath, rdf       in d_rdf.items() }
+            d_rdf    = {}
+            for fpath, conf_path in d_sample.items():
+                rdf, nentries = self._rdf_from_conf(fpath=fpath, conf_path=conf_path)
+                rdf           = self._emulator.post_process(rdf=rdf, nentries=nentries)
+                d_rdf[fpath]  = self._check_rdf(rdf = rdf, nentries=nentries)
+
+            self._d_rdf = d_rdf
 
             return self._d_rdf
 
         conf_path = self.get_spec_path(per_file=per_file)
-        self._rdf = self._rdf_from_conf(fpath='joint_files', conf_path=conf_path)
+        self._rdf, nentries = self._rdf_from_conf(fpath='joint_files', conf_path=conf_path)
 
-        rdf = self._emulator.post_process(rdf=self._rdf)
-        rdf = self._check_rdf(rdf = rdf)
+        rdf = self._emulator.post_process(rdf=self._rdf, nentries=nentries)
+        rdf = self._check_rdf(rdf = rdf, nentries=nentries)
 
         return rdf
     # ----------------------
-    def _check_rdf(self, rdf : RDF.RNode) -> RDF.RNode:
+    def _check_rdf(self, rdf : RDF.RNode, nentries : int) -> RDF.RNode:
         '''
         Parameters
         -------------
-        rdf: ROOT dataframe
+        rdf     : ROOT dataframe
+        nentries: Number of entries in dataframe
 
         Returns
         -------------
         ROOT dataframe after checks
         '''
-        self.check_alignment(rdf = rdf, index = 'EVENTNUMBER')
-
+        l_index = ['EVENTNUMBER']
         if self._tree_name != 'MCDecayTree':
-            self.check_alignment(rdf = rdf, index = 'RUNNUMBER')
+            l_index.append('RUNNUMBER')
+
+        # With multithreading the check on the first entries, with Range, is not possible
+        # it is done on the full dataframe, when the user runs the event loop
+        eager = not self._lazy and not self._is_multithreaded()
+        for index in l_index:
+            if eager:
+                self.check_alignment(rdf = rdf, index = index)
+                continue
+
+            if nentries == 0:
+                log.debug(f'Not booking check of {index} for empty dataframe')
+                continue
+
+            self._book_alignment_check(rdf = rdf, index = index)
 
         return rdf
     # ----------------------
+    @classmethod
+    def _book_alignment_check(
+        cls,
+        rdf   : RDF.RNode,
+        index : str) -> None:
+        '''
+        Lazy version of `check_alignment`. Books action that will run
+        with the first event loop and raise if the columns are not aligned.
+        It does not modify the dataframe passed and it does not depend on the order
+        of the entries, thus it can be used with multithreading
+
+        Parameters
+        -------------
+        rdf   : ROOT dataframe
+        index : Name of column whose values need to be aligned
+        '''
+        condition = cls._get_alignment_condition(rdf=rdf, index=index)
+        if condition is None:
+            return
+
+        expression = f'({condition}) ? true : throw std::runtime_error("{index} columns are not aligned")'
+
+        log.debug(f'Booking alignment check: {expression}')
+
+        # Results that already ran do not need to be kept
+        cls._l_booked_checks = [ result for result in cls._l_booked_checks if not result.IsReady() ]
+        cls._l_booked_checks.append(rdf.Filter(expression).Count())
+    # ----------------------
+    @staticmethod
+    def _get_alignment_condition(
+        rdf   : RDF.RNode,
+        index : str) -> str | None:
+        '''
+        Parameters
+        -------------
+        rdf   : ROOT dataframe
+        index : Name of column whose values need to be aligned
+
+        Returns
+        -------------
+        Expression that is true for entries where all the columns are aligned
+        None if there are fewer than two columns to compare
+        '''
+        columns = [ name.c_str() for name in rdf.GetColumnNames() ]
+        indexes = [ name         for name in columns if index in name ]
+        if len(indexes) < 2:
+            log.debug(f'Not checking alignment for {indexes}')
+            return None
+
+        [first, *rest] = indexes
+
+        return ' && '.join(f'{first} == {name}' for name in rest)
+    # ----------------------
     @staticmethod
     def check_alignment(
         rdf    : RDF.RNode,
@@ -589,9 +697,18 @@ class RDFGetter(SpecMaker):
 
         log.info(f'Checking {ncol} columns for {index}')
 
-        rdf_small = rdf.Range(100)
+        # With multithreading Range is not supported and rdfentry_ is not the entry number
+        # thus all the entries are checked, entry by entry
+        if GetThreadPoolSize() > 1:
+            condition = RDFGetter._get_alignment_condition(rdf=rdf, index=index)
+            nfailed   = 0 if condition is None else rdf.Filter(f'!({condition})').Count().GetValue()
+            if nfailed != 0:
+                raise ValueError(f'{index} columns are not aligned in {nfailed} entries')
+
+            log.info(f'Checked {index}')
+            return
 
-        data    = rdf_small.AsNumpy(indexes)
+        data    = rdf.Range(100).AsNumpy(indexes)
         arrays  = [ array for array in data.values() ]
         aligned = all( numpy.array_equal(array, arrays[0]) for array in arrays)
 
@@ -608,7 +725,8 @@ class RDFGetter(SpecMaker):
     def get_uid(self) -> str:
         '''
         Retrieves unique identifier for this sample
-        Build on top of the UUID from each file
+        Build on top of the UUID from each file, these are read from
+        an index stored next to the files, see `UUIDIndex`
         '''
         if not hasattr(self, '_rdf') and not hasattr(self, '_d_rdf'):
             raise ValueError('get_uid can only be called after get_rdf')
@@ -617,11 +735,8 @@ class RDFGetter(SpecMaker):
             raise ValueError('No path to ROOT files was found')
 
         log.debug('Calculating GUUIDs')
-        all_guuid = ''
-        for path in self._l_path:
-            ifile = TFile(path)
-            all_guuid += ifile.GetUUID().AsString()
-            ifile.Close()
+        idx       = UUIDIndex(paths=self._l_path)
+        all_guuid = ''.join(idx.get_uuids())
 
         val = hashing.hash_object([ all_guuid, self._d_info ])
         val = val[:10]
@@ -683,6 +798,72 @@ class RDFGetter(SpecMaker):
         return _context()
     # ---------------------------------------------------
     @classmethod
+    def multithreading(cls, nthreads : int):
+        '''
+        Contextmanager used to enable ROOT's implicit multithreading.
+        With multithreading `rdfentry_` is not the entry number, thus the following
+        raise ValueError:
+
+        - Simulated samples that need patching, e.g. missing blocks, see `SamplePatcher`
+        - Picking a number of entries with `max_entries`
+        - Calculating MVA scores with `MVACalculator`
+        - Adding columns with `dmu.rdataframe.utilities.add_column_with_numba`
+
+        Data and simulated samples that are not patched, including emulated samples,
+        are supported.
+
+        nthreads: Number of threads, if 1, multithreading will be off
+        '''
+        if nthreads <= 0:
+            raise ValueError(f'Invalid number of threads: {nthreads}')
+
+        @contextmanager
+        def _context():
+            old_val = cls._nthreads
+            old_mt  = GetThreadPoolSize()
+            if nthreads > 1:
+                log.warning(f'Using {nthreads} threads')
+                EnableImplicitMT(nthreads)
+            else:
+                log.debug('Not using multithreading')
+                DisableImplicitMT()
+
+            cls._nthreads = nthreads
+
+            try:
+                yield
+            finally:
+                cls._nthreads = old_val
+                if old_mt > 1:
+                    EnableImplicitMT(old_mt)
+                else:
+                    DisableImplicitMT()
+
+        return _context()
+    # ---------------------------------------------------
+    @classmethod
+    def lazy(cls, value : bool = True):
+        '''
+        Contextmanager used to build dataframes without running any event loop.
+        The number of entries is read from the trees' metadata and the alignment
+        of the friend trees is checked when the user runs the first event loop.
+
+        value: If true (default) the dataframes are built lazily
+        '''
+        @contextmanager
+        def _context():
+            old_val  = cls._lazy
+            cls._lazy= value
+            log.debug(f'Building dataframes lazily: {value}')
+
+            try:
+                yield
+            finally:
+                cls._lazy = old_val
+
+        return _context()
+    # ---------------------------------------------------
+    @classmethod
     def skip_adding_columns(cls, value : bool):
         '''
         Contextmanager to control if column (re)definitions from config are used or not
@@ -10,6 +10,8 @@ from pathlib          import Path
 from ROOT             import RDF  # type: ignore
 from dmu              import LogStore
 
+from .specification   import Specification
+
 log=LogStore.add_logger('rx_data:rdf_loader')
 # ----------------------------------
 class RDFLoader:
@@ -19,8 +21,12 @@ class RDFLoader:
 
     - Network delays
     - Timeouts
+
+    The number of entries found when loading each dataframe is kept,
+    such that it can be reused through `get_entries`
     '''
-    _CLIENT : Client | None = None
+    _CLIENT    : Client | None   = None
+    _d_entries : dict[Path, int] = {}
     # ----------------------
     @classmethod
     def client(cls, client : Client):
@@ -52,13 +58,16 @@ class RDFLoader:
         cls,
         ntries : int,
         wait   : int,
-        path   : Path) -> RDF.RNode:
+        path   : Path,
+        lazy   : bool = False) -> RDF.RNode:
         '''
         Parameters
         -------------
         ntries: Number of times to retry loading of data before raising exception
         wait  : Number of seconds to wait between failed tries
-        path: Path to JSON file holding configuration needed to build dataframe
+        path  : Path to JSON file holding configuration needed to build dataframe
+        lazy  : If False (default) the loading is validated by counting the entries of the dataframe, i.e. with an event loop.
+                If True, the validation uses the number of entries stored in the trees' headers and no event loop runs
 
         Returns
         -------------
@@ -75,8 +84,13 @@ class RDFLoader:
                     log.debug(f'Using user provided client to load: {path}')
                     rdf = RDF.Experimental.FromSpec(str(path), executor = cls._CLIENT)
 
-                nentries = rdf.Count().GetValue()
+                if lazy:
+                    nentries = cls._entries_from_spec(path=path)
+                else:
+                    nentries = rdf.Count().GetValue()
+
                 log.debug(f'Succeeding loading {nentries} entries from: {path}')
+                cls._d_entries[path] = nentries
 
                 return rdf
             except (cppyy.gbl.std.runtime_error, RuntimeError):
@@ -85,4 +99,42 @@ class RDFLoader:
                 itry += 1
 
         raise RuntimeError(f'Failed to load {path}')
+    # ----------------------
+    @staticmethod
+    def _entries_from_spec(path : Path) -> int:
+        '''
+        Parameters
+        -------------
+        path: Path to JSON file holding configuration needed to build dataframe
+
+        Returns
+        -------------
+        Number of entries in main sample, taken from the trees' metadata.
+        Friend trees are required to have the same number of entries
+        '''
+        spec     = Specification.model_validate_json(Path(path).read_text(encoding='utf-8'))
+        nentries = sum(sample.size for sample in spec.samples.values())
+
+        for name, sample in spec.friends.items():
+            nfriend = sample.size
+            if nfriend != nentries:
+                raise ValueError(f'Friend tree {name} has {nfriend} entries, expected {nentries}, in: {path}')
+
+        return nentries
+    # ----------------------
+    @classmethod
+    def get_entries(cls, path : Path) -> int:
+        '''
+        Parameters
+        -------------
+        path: Path to JSON file used to load dataframe with `from_conf`
+
+        Returns
+        -------------
+        Number of entries found when dataframe was loaded
+        '''
+        if path not in cls._d_entries:
+            raise ValueError(f'Dataframe was not loaded from: {path}')
+
+        return cls._d_entries[path]
 # ----------------------------------
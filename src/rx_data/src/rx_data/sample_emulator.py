@@ -104,17 +104,18 @@ class SampleEmulator:
         if fail:
             raise ValueError('Cannot redefine, some columns are already found in config')
     # ----------------------
-    def post_process(self, rdf : RDF.RNode) -> RDF.RNode:
+    def post_process(self, rdf : RDF.RNode, nentries : int | None = None) -> RDF.RNode:
         '''
         Parameters
         -------------
-        rdf: ROOT dataFrame
+        rdf     : ROOT dataFrame
+        nentries: Number of entries in dataframe, if not passed, it will be calculated with an event loop
 
         Returns
         -------------
         Dataframe after redefinitions, etc
         '''
-        size = rdf.Count().GetValue()
+        size = rdf.Count().GetValue() if nentries is None else nentries
         if size == 0:
             log.warning('Not running emulation for empty dataframe')
             return rdf
@@ -1,7 +1,7 @@
 '''
 Module containing SamplePatcher
 '''
-from ROOT           import RDataFrame # type: ignore
+from ROOT           import RDataFrame, GetThreadPoolSize # type: ignore
 from pathlib        import Path
 from dmu            import LogStore
 from dmu.generic    import utilities as gut
@@ -81,6 +81,12 @@ class SamplePatcher:
         if not self._conditions:
             return dict()
 
+        # The conditions pick the patching entries through rdfentry_, which with
+        # multithreading is not the entry number, i.e. arbitrary entries would be patched
+        nthreads = GetThreadPoolSize()
+        if nthreads > 1:
+            raise ValueError(f'Cannot patch {self._sample} with multithreading, using {nthreads} threads')
+
         nconditions = len(self._conditions)
         log.info(f'Using {nconditions} conditions')
         for block, condition in self._conditions.items():
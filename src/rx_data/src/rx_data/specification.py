@@ -3,7 +3,7 @@ Module holding Specification and Sample classes
 '''
 
 from pathlib   import Path
-from ROOT      import RDataFrame # type: ignore
+from ROOT      import TFile # type: ignore
 from pydantic  import BaseModel, ConfigDict
 
 # --------------------------
@@ -18,17 +18,29 @@ class Sample(BaseModel):
     @property
     def size(self) -> int:
         '''
-        Number of entries in this sample
+        Number of entries in this sample.
+        Read from the trees' headers, i.e. without looping over the entries
         '''
         if len(self.trees) != 1:
             raise ValueError(f'Not one and only one tree name found: {self.trees}')
 
         tree_name = self.trees[0]
 
-        paths = [ str(path) for path in self.files ]
-        rdf   = RDataFrame(tree_name, paths)
+        nentries = 0
+        for path in self.files:
+            ifile = TFile.Open(str(path))
+            if not ifile or ifile.IsZombie():
+                raise RuntimeError(f'Cannot open file: {path}')
 
-        return rdf.Count().GetValue()
+            tree = ifile.Get(tree_name)
+            if not tree:
+                ifile.Close()
+                raise ValueError(f'Cannot find tree {tree_name} in: {path}')
+
+            nentries += tree.GetEntries()
+            ifile.Close()
+
+        return nentries
 # --------------------------
 class Specification(BaseModel):
     '''
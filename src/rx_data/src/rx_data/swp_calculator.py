@@ -1,41 +1,42 @@
 '''
 Module with class used to swap mass hypotheses
 '''
+import numpy
 import pandas as pnd
-import random
-import vector
 
 from ROOT        import RDF # type: ignore
-from tqdm        import tqdm
-from particle    import Particle         as part
-from vector      import MomentumObject3D as v3d
-from vector      import MomentumObject4D as v4d
-
 from dmu         import LogStore
-from dmu.generic import typing_utilities as tut 
+
+from .           import mass_hypotheses as mhy
 
 log = LogStore.add_logger('rx_data:swp_calculator')
 #---------------------------------
 class SWPCalculator:
     '''
     Class used to calculate di-track masses, after mass hypothesis swaps
+
+    All the candidates are processed at once, as arrays. When several track
+    combinations are possible, one is picked randomly, with a seeded generator
     '''
     #---------------------------------
     def __init__(
         self,
         rdf   : RDF.RNode,
         d_lep : dict[str,int],
-        d_had : dict[str,int]):
+        d_had : dict[str,int],
+        seed  : int = 42):
         '''
         Parameters
         --------------
         rdf   : ROOT dataframe
         d_lep : Dictionary mapping lepton names with mass hypotheses to swap, e.g. {L1 : 13, L2 : 13}
         d_had : Dictionary mapping hadron names with mass hypetheses to swap, e.g. {H : 312}
+        seed  : Used to pick randomly among track combinations, when more than one is possible
         '''
         self._rdf    = rdf
         self._d_lep  = d_lep
         self._d_had  = d_had
+        self._seed   = seed
 
         self._extra_branches= ['EVENTNUMBER', 'RUNNUMBER']
         self._df            = self._pnd_from_root(rdf)
@@ -75,8 +76,6 @@ class SWPCalculator:
         self._check_particle(self._d_lep)
         self._check_particle(self._d_had)
 
-        tqdm.pandas(ascii=' -')
-
         self._initialized=True
     #---------------------------------
     def _check_particle(self, d_part):
@@ -84,123 +83,89 @@ class SWPCalculator:
             raise ValueError(f'Dictionary expected, found: {d_part}')
 
         for pdg_id in d_part.values():
-            try:
-                part.from_pdgid(pdg_id)
-            except Exception as exc:
-                raise ValueError(f'Cannot create particle for PDGID: {pdg_id}') from exc
-    #---------------------------------
-    def _get_4vec(self, row : pnd.Series, name : str) -> v4d:
-        '''
-        This function is needed because the PE (energy) of the particle was not stored
-        in the ntuples
-        '''
-        px     = tut.numeric_from_series(row, f'{name}_PX', float)
-        py     = tut.numeric_from_series(row, f'{name}_PY', float)
-        pz     = tut.numeric_from_series(row, f'{name}_PZ', float)
-        par_3d = v3d(px=px, py=py, pz=pz)
-
-        par_id = tut.numeric_from_series(row, f'{name}_ID', int)
-        par    = part.from_pdgid(par_id)
-        ms     = par.mass
-        if ms is None:
-            raise ValueError(f'Cannot get mass from particle with PDG ID: {par_id}')
-        vec    = vector.obj(pt=par_3d.pt, phi=par_3d.phi, eta=par_3d.eta, mass=ms)
-
-        return vec
+            mhy.get_mass(pid=pdg_id)
     #---------------------------------
-    def _build_mass(
-        self,
-        row    : pnd.Series,
-        d_part : dict[str,int]) -> float:
+    def _build_mass(self, d_part : dict[str,numpy.ndarray|float]) -> numpy.ndarray:
         '''
         Parameters
         -----------------
-        row: Pandas dataframe row representing candidate
         d_part: Dictionary with:
             key  : Name of particle
-            value: PDGID needed for mass swap
-        '''
-        l_vec = []
-        for name, new_id in d_part.items():
-            vec_1 = self._get_4vec(row, name)
-            old_id= row[f'{name}_ID']
-            par   = part.from_pdgid(new_id)
-            ms    = par.mass
-            if not isinstance(ms, float):
-                raise TypeError(f'Failed to determine the mass for particle with PDGID: {new_id}')
+            value: Mass hypothesis, either one value per candidate or a single value
 
-            log.debug(f'{name}: {vec_1.mass:0f}({old_id}) -> {ms:.0f}({new_id})')
+        Returns
+        -----------------
+        Array with mass of the combination of the two particles
+        '''
+        if len(d_part) != 2:
+            raise ValueError('Not found two and only two particles')
 
-            vec_2 = v4d(pt=vec_1.pt, eta=vec_1.eta, phi=vec_1.phi, mass=ms)
-            l_vec.append(vec_2)
+        l_vec = []
+        for name, mass in d_part.items():
+            vec = mhy.momentum_from_px_py_pz(
+                px   = self._df[f'{name}_PX'].to_numpy(),
+                py   = self._df[f'{name}_PY'].to_numpy(),
+                pz   = self._df[f'{name}_PZ'].to_numpy(),
+                mass = mass)
 
-        if len(l_vec) != 2:
-            raise ValueError('Not found two and only two particles')
+            l_vec.append(vec)
 
-        vec_1 = l_vec[0]
-        vec_2 = l_vec[1]
-        vec   = vec_1 + vec_2
-        mass  = float(vec.mass)
+        [vec_1, vec_2] = l_vec
+        vec = vec_1 + vec_2
 
-        return mass
+        return numpy.asarray(vec.mass, dtype='float64')
     #---------------------------------
-    def _combine(
+    def _calculate_masses(
         self,
-        row        : pnd.Series,
         had_name   : str,
-        kind       : str,
-        new_had_id : int) ->  float:
+        new_had_id : int,
+        rng        : numpy.random.Generator) -> dict[str,numpy.ndarray]:
         '''
         Parameters
         ----------------------
-        row        : Pandas dataframe row representing an entry in a ROOT tree, i.e. a candidate
         had_name   : Name of prefix for hadron in tree, e.g. H
-        kind       : Type of mass, e.g. org, swp. For swap of mass hypotheses or original ones
         new_had_id : PDGID for hadron when swapping of hypotheses is needed
+        rng        : Random number generator, used to pick among combinations
 
         Returns
         ----------------------
-        Mass of the combination of particles
+        Dictionary mapping kind of mass, org and swp, for original and swapped hypotheses,
+        with array of masses of the combination of hadron and lepton
         '''
-        old_had_id           = tut.numeric_from_series(row, f'{had_name}_ID', int)
-        had                  = part.from_pdgid(old_had_id)
-        masses : list[float] = []
+        arr_had_id  = self._df[f'{had_name}_ID'].to_numpy()
+        arr_had_chg = mhy.charges_from_ids(arr_id=arr_had_id)
+        arr_had_org = mhy.masses_from_ids(arr_id=arr_had_id)
+        had_swp     = mhy.get_mass(pid=new_had_id)
+
+        l_ok        = []
+        d_l_mass    : dict[str,list[numpy.ndarray]] = {'org' : [], 'swp' : []}
         for lep_name, new_lep_id in self._d_lep.items():
-            old_lep_id = tut.numeric_from_series(row, f'{lep_name}_ID', int)
-            lep        = part.from_pdgid(old_lep_id)
+            arr_lep_id  = self._df[f'{lep_name}_ID'].to_numpy()
+            arr_lep_chg = mhy.charges_from_ids(arr_id=arr_lep_id)
 
             # For OS candidates H - Lep combination have to be of opposite charge tracks
-            if lep.charge == had.charge and not self._use_ss:
-                continue
-
-            lep_id = new_lep_id if kind == 'swp' else old_lep_id
-            had_id = new_had_id if kind == 'swp' else old_had_id
+            arr_ok      = numpy.full(len(self._df), self._use_ss) | (arr_lep_chg != arr_had_chg)
+            l_ok.append(arr_ok)
 
-            mass   = self._build_mass(row, {had_name : had_id, lep_name : lep_id})
+            log.debug(f'{had_name}/{lep_name} -> {new_had_id}/{new_lep_id}')
 
-            masses.append(mass)
+            d_part_org  = {had_name : arr_had_org, lep_name : mhy.masses_from_ids(arr_id=arr_lep_id)}
+            d_part_swp  = {had_name : had_swp    , lep_name : mhy.get_mass(pid=new_lep_id)}
 
-        ncmb = len(masses)
-        if ncmb == 0:
-            raise ValueError('No track combinations found')
+            d_l_mass['org'].append(self._build_mass(d_part=d_part_org))
+            d_l_mass['swp'].append(self._build_mass(d_part=d_part_swp))
 
         # If multiple combinations found (e.g. SS sample with K+ l-l-)
-        # pick randomly 
-        log.debug(f'Found {ncmb} combinations with masses: {masses}')
+        # pick randomly, the same combination is used for original and swapped masses
+        arr_icmb = mhy.pick_combination(arr_ok=numpy.stack(l_ok, axis=1), rng=rng)
+        arr_ient = numpy.arange(len(self._df))
 
-        return random.choice(masses)
-    #---------------------------------
-    def _calculate_mass(self, progress_bar : bool, had_name : str, kind : str, new_had_id : int) -> pnd.Series:
-        if progress_bar:
-            # TODO: This shows error in type analyzer, progress bar is enable through TQDM
-            sr_mass = self._df.progress_apply( # type: ignore
-                self._combine, 
-                args=(had_name, kind, new_had_id), 
-                axis=1)
-        else:
-            sr_mass = self._df.apply(self._combine, args=(had_name, kind, new_had_id), axis=1)
-
-        return sr_mass
+        d_mass   = {}
+        for kind, l_mass in d_l_mass.items():
+            arr_mass     = numpy.stack(l_mass, axis=1)
+            d_mass[kind] = arr_mass[arr_ient, arr_icmb]
+
+        return d_mass
     #---------------------------------
     def get_rdf(
         self,
@@ -211,7 +176,7 @@ class SWPCalculator:
         Parameters:
         ------------------
         preffix: Will be used to name branches with masses as `{preffix}_mass_org/swp` for the original and swapped masses
-        progress_bar: If True, will show progress bar, by default false
+        progress_bar: Not used, kept for backwards compatibility
         use_ss: If true, it will combine tracks with same sign, instead of opposite, False by default
 
         Returns:
@@ -221,16 +186,20 @@ class SWPCalculator:
         if use_ss:
             log.warning('Building candidates from Same Sign tracks')
 
+        if progress_bar:
+            log.debug('Progress bar not available, candidates are processed at once')
+
         self._use_ss = use_ss
         self._initialize()
 
+        rng    = numpy.random.default_rng(self._seed)
         d_data = {}
         for had_name, new_had_id in self._d_had.items():
-            for kind in ['org', 'swp']:
-                log.info(f'Adding column for {had_name}/{new_had_id}/{kind}')
+            log.info(f'Adding columns for {had_name}/{new_had_id}')
 
-                sr_mass = self._calculate_mass(progress_bar, had_name, kind, new_had_id)
-                d_data[f'{preffix}_mass_{kind}'] = sr_mass.to_numpy().flatten()
+            d_mass = self._calculate_masses(had_name=had_name, new_had_id=new_had_id, rng=rng)
+            for kind, arr_mass in d_mass.items():
+                d_data[f'{preffix}_mass_{kind}'] = arr_mass
 
         d_extra = self._rdf.AsNumpy(self._extra_branches)
         d_data.update(d_extra)
@@ -0,0 +1,155 @@
+'''
+Module holding UUIDIndex class
+'''
+import os
+import json
+
+from pathlib import Path
+from typing  import Final
+from ROOT    import TFile # type: ignore
+from dmu     import LogStore
+
+log=LogStore.add_logger('rx_data:uuid_index')
+
+_INDEX_NAME : Final[str] = 'uuid_index.json'
+# ----------------------
+class UUIDIndex:
+    '''
+    Class meant to provide the UUIDs of ROOT files without opening them.
+
+    For each directory with ROOT files, a JSON file is kept next to the files with:
+
+    key  : Name of ROOT file
+    value: Dictionary with size, modification time and UUID of the file
+
+    Only the files that are missing in the index, or that changed, are opened
+    and the index is updated. If the index cannot be written, e.g. missing
+    permissions, the UUIDs are still returned.
+    '''
+    _d_index : dict[Path, dict[str,dict]] = {} # Indexes already read in this process, key is the directory
+    # ----------------------
+    def __init__(self, paths : list[Path]) -> None:
+        '''
+        Parameters
+        -------------
+        paths: List of paths to ROOT files
+        '''
+        self._l_path = [ Path(path) for path in paths ]
+    # ----------------------
+    def _load_index(self, dir_path : Path) -> dict[str,dict]:
+        '''
+        Parameters
+        -------------
+        dir_path: Path to directory with ROOT files
+
+        Returns
+        -------------
+        Index for this directory, empty if not found or not readable
+        '''
+        if dir_path in UUIDIndex._d_index:
+            return UUIDIndex._d_index[dir_path]
+
+        index_path = dir_path / _INDEX_NAME
+        try:
+            d_index = json.loads(index_path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            log.debug(f'Index not found: {index_path}')
+            d_index = {}
+        except (OSError, ValueError) as exc:
+            log.warning(f'Cannot read index {index_path}: {exc}')
+            d_index = {}
+
+        UUIDIndex._d_index[dir_path] = d_index
+
+        return d_index
+    # ----------------------
+    def _save_index(self, dir_path : Path, d_index : dict[str,dict]) -> None:
+        '''
+        Writes index to temporary file and then moves it, to
+        avoid other processes reading partially written files
+
+        Parameters
+        -------------
+        dir_path: Path to directory with ROOT files
+        d_index : Index for this directory
+        '''
+        index_path = dir_path / _INDEX_NAME
+        tmp_path   = dir_path / f'.{_INDEX_NAME}.{os.getpid()}'
+        try:
+            tmp_path.write_text(json.dumps(d_index, indent=2, sort_keys=True), encoding='utf-8')
+            os.replace(tmp_path, index_path)
+        except OSError as exc:
+            log.warning(f'Cannot save index {index_path}: {exc}')
+            return
+
+        log.debug(f'Saved index: {index_path}')
+    # ----------------------
+    @staticmethod
+    def _read_uuid(path : Path) -> str:
+        '''
+        Parameters
+        -------------
+        path: Path to ROOT file
+
+        Returns
+        -------------
+        UUID of file
+        '''
+        ifile = TFile.Open(str(path))
+        if not ifile or ifile.IsZombie():
+            raise RuntimeError(f'Cannot open: {path}')
+
+        uuid = ifile.GetUUID().AsString()
+        ifile.Close()
+
+        return uuid
+    # ----------------------
+    def _get_uuid(self, path : Path, d_index : dict[str,dict]) -> tuple[str, bool]:
+        '''
+        Parameters
+        -------------
+        path   : Path to ROOT file
+        d_index: Index for the directory of the file
+
+        Returns
+        -------------
+        Tuple with UUID and flag, true if index was updated
+        '''
+        stat  = path.stat()
+        entry = d_index.get(path.name)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['uuid'], False
+
+        log.debug(f'Reading UUID from: {path}')
+        uuid = self._read_uuid(path=path)
+        d_index[path.name] = {
+            'size' : stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'uuid' : uuid}
+
+        return uuid, True
+    # ----------------------
+    def get_uuids(self) -> list[str]:
+        '''
+        Returns
+        -------------
+        List of UUIDs, in the same order as the paths
+        '''
+        l_uuid    = []
+        s_updated = set()
+        for path in self._l_path:
+            dir_path      = path.parent
+            d_index       = self._load_index(dir_path=dir_path)
+            uuid, updated = self._get_uuid(path=path, d_index=d_index)
+            l_uuid.append(uuid)
+
+            if updated:
+                s_updated.add(dir_path)
+
+        for dir_path in s_updated:
+            self._save_index(dir_path=dir_path, d_index=UUIDIndex._d_index[dir_path])
+
+        log.debug(f'Found {len(l_uuid)} UUIDs, updated {len(s_updated)} indexes')
+
+        return l_uuid
+# ----------------------
@@ -5,8 +5,11 @@ Script used to create small trees with extra branches from input trees
 import os
 import glob
 import argparse
+import multiprocessing
 import tqdm
 
+from concurrent.futures import ProcessPoolExecutor, Future
+from functools    import lru_cache
 from pathlib      import Path
 from ROOT         import RDataFrame, TFileMerger, TFile, TTree, RDF # type: ignore
 from dmu          import LogLevels, LogStore
@@ -42,6 +45,7 @@ class Data:
     lvl  : int
     wild_card : str | None
     chunk_size: int
+    workers   : int
     out_dir   : Path 
 
     l_kind    = ['mass', 'hop', 'swp_jpsi_misid', 'swp_cascade', 'brem_track_2', 'mva', 'smear']
@@ -67,6 +71,7 @@ def _set_config(args : DictConfig) -> None:
     Data.lvl       = 20 
     Data.wild_card = None 
     Data.chunk_size= 100_000 
+    Data.workers   = args.get('workers', 1)
 # ---------------------------------
 def _parse_args() -> None:
     '''
@@ -83,6 +88,7 @@ def _parse_args() -> None:
     parser.add_argument('-b', '--pbar',           help='If used, will show progress bar whenever it is available', action='store_true')
     parser.add_argument('-d', '--dry' ,           help='If used, will do dry drun, e.g. stop before processing', action='store_true')
     parser.add_argument('-l', '--lvl' , type=int, help='log level', choices=[5, 10, 20, 30], default=20)
+    parser.add_argument('-W', '--workers', type=int, help='Number of processes used to process files and chunks', default=1)
     args = parser.parse_args()
 
     igroup, ngroup = args.part
@@ -99,6 +105,10 @@ def _parse_args() -> None:
     Data.lvl  = args.lvl
     Data.wild_card = args.wc
     Data.chunk_size= args.chunk
+    Data.workers   = args.workers
+
+    if Data.workers < 1:
+        raise ValueError(f'Invalid number of workers: {Data.workers}')
 # ---------------------------------
 def _set_logs():
     '''
@@ -145,6 +155,24 @@ def _get_out_path(path : Path) -> str:
 
     return out_path
 # ---------------------------------
+def _get_tmp_path(out_path : str, suffix : str) -> str:
+    '''
+    Parameters
+    -------------
+    out_path: Path to output ROOT file
+    suffix  : Appended to the name of the output file, e.g. 003_pre_merge
+
+    Returns
+    -------------
+    Path to temporary file in a hidden directory next to the outputs.
+    Thus, after a crash, it will not be picked up as an output, while it can still be moved
+    atomically into place, being in the same filesystem
+    '''
+    tmp_dir = Path(out_path).parent / '.tmp'
+    tmp_dir.mkdir(exist_ok=True)
+
+    return str(tmp_dir / f'{Path(out_path).stem}_{suffix}.root')
+# ---------------------------------
 def _process_rdf(
     rdf     : RDF.RNode,
     path    : Path) -> RDF.RNode|None:
@@ -261,13 +289,24 @@ def _get_swap_rdf(rdf : RDF.RNode, trigger : str) -> RDF.RNode:
 
     raise ValueError(f'Invalid kind: {Data.kind}')
 # ---------------------------------
-def _split_rdf(rdf : RDF.RNode) -> list[RDF.RNode]:
-    nentries = rdf.Count().GetValue()
+def _get_ranges(nentries : int) -> list[tuple[int,int]]:
+    '''
+    Parameters
+    -------------
+    nentries: Number of entries in dataframe
+
+    Returns
+    -------------
+    List of (start, stop) pairs, one per chunk
+    '''
     l_size   = range(0, nentries, Data.chunk_size)
+    l_range  = [ (start, min(start + Data.chunk_size, nentries)) for start in l_size ]
 
-    l_rdf    = [
-        rdf.Range(start, min(start + Data.chunk_size, nentries))
-        for start in l_size ]
+    return l_range
+# ----------------------
+def _split_rdf(rdf : RDF.RNode) -> list[RDF.RNode]:
+    nentries = rdf.Count().GetValue()
+    l_rdf    = [ rdf.Range(start, stop) for start, stop in _get_ranges(nentries=nentries) ]
 
     return l_rdf
 # ----------------------
@@ -321,14 +360,7 @@ def _create_file(path : Path) -> None:
     rdf   = _get_input_rdf(path=path)
     nentries = rdf.Count().GetValue()
     if nentries == 0:
-        log.warning(f'Found empty dataframe for: {path}')
-        log.info(f'Saving empty output to: {out_path}')
-
-        ofile=TFile(out_path, 'recreate')
-        ttree=TTree('DecayTree', '')
-        ttree.Write()
-        ofile.Close()
-
+        _save_empty(path=path, out_path=out_path)
         return
 
     l_rdf = _split_rdf(rdf=rdf)
@@ -353,11 +385,26 @@ def _create_file(path : Path) -> None:
         out_path  = out_path,
         nchunk    = nchunk)
 
-    tmp_wc = out_path.replace('.root', '_*_pre_merge.root')
+    tmp_wc = _get_tmp_path(out_path=out_path, suffix='*_pre_merge')
     log.info(f'Removing temporary files from: {tmp_wc}')
     for tmp_path in glob.glob(tmp_wc):
         os.remove(tmp_path)
 # ----------------------
+def _save_empty(path : Path, out_path : str) -> None:
+    '''
+    Parameters
+    -------------
+    path    : Path to input ROOT file
+    out_path: Path to output ROOT file, where an empty tree will be saved
+    '''
+    log.warning(f'Found empty dataframe for: {path}')
+    log.info(f'Saving empty output to: {out_path}')
+
+    ofile=TFile(out_path, 'recreate')
+    ttree=TTree('DecayTree', '')
+    ttree.Write()
+    ofile.Close()
+# ----------------------
 def _process_and_merge(
     l_rdf     : list[RDF.RNode],
     nchunk    : int,
@@ -378,7 +425,7 @@ def _process_and_merge(
         if rdf_out is None:
             continue
 
-        tmp_path = out_path.replace('.root', f'_{index:03}_pre_merge.root')
+        tmp_path = _get_tmp_path(out_path=out_path, suffix=f'{index:03}_pre_merge')
 
         log.debug(f'Saving tree {Data.tree_name} to {tmp_path}')
         rdf_out.Snapshot(Data.tree_name, tmp_path)
@@ -390,6 +437,173 @@ def _process_and_merge(
     log.info(f'Merging temporary files into: {out_path}')
     fmrg.Merge()
 # ----------------------
+# Parallel processing
+#
+# Files are first planned, i.e. split in chunks, by the workers,
+# then every chunk is processed by the workers and saved to a temporary file.
+# Once all the chunks of a file are ready, they are merged in order by the main process.
+# The outputs are written with temporary names, in the hidden .tmp directory, and renamed at the end,
+# such that a crash never leaves a file that looks complete.
+# ----------------------
+def _get_config() -> dict:
+    '''
+    Returns
+    -------------
+    Dictionary with configuration in `Data`, needed by the workers
+    '''
+    l_name = ['vers', 'proj', 'kind', 'nmax', 'part', 'pbar', 'dry', 'lvl', 'wild_card', 'chunk_size', 'out_dir']
+
+    return { name : getattr(Data, name) for name in l_name }
+# ----------------------
+def _initialize_worker(config : dict) -> None:
+    '''
+    Runs once in every worker, when it starts
+
+    Parameters
+    -------------
+    config: Configuration of the main process, see `_get_config`
+    '''
+    for name, value in config.items():
+        setattr(Data, name, value)
+
+    Data.workers = 1
+
+    _set_logs()
+# ----------------------
+@lru_cache(maxsize=1)
+def _get_worker_rdf(path : Path) -> RDF.RNode:
+    '''
+    Chunks of the same file tend to go to the same worker one after the other,
+    the dataframe is kept to avoid rebuilding it for each chunk
+    '''
+    return _get_input_rdf(path=path)
+# ----------------------
+def _plan_file(path : Path) -> list[tuple[int,int]]:
+    '''
+    Parameters
+    -------------
+    path: Path to input ROOT file
+
+    Returns
+    -------------
+    List of (start, stop) pairs, one for each chunk that needs processing
+    Empty list if the file needs no processing
+    '''
+    out_path = _get_out_path(path)
+    if os.path.isfile(out_path):
+        log.debug(f'Output found, skipping {out_path}')
+        return []
+
+    rdf      = _get_worker_rdf(path=path)
+    nentries = rdf.Count().GetValue()
+    if nentries == 0:
+        tmp_path = _get_tmp_path(out_path=out_path, suffix=f'{os.getpid()}_tmp')
+        _save_empty(path=path, out_path=tmp_path)
+        os.replace(tmp_path, out_path)
+        return []
+
+    l_range = _get_ranges(nentries=nentries)
+    if Data.dry:
+        log.debug('Doing dry run')
+        return []
+
+    return l_range
+# ----------------------
+def _process_chunk(
+    path  : Path,
+    index : int,
+    start : int,
+    stop  : int) -> str | None:
+    '''
+    Parameters
+    -------------
+    path       : Path to input ROOT file
+    index      : Index of chunk
+    start, stop: Range of entries in chunk
+
+    Returns
+    -------------
+    Path to temporary file with processed chunk, None if nothing was saved
+    '''
+    rdf_in  = _get_worker_rdf(path=path)
+    rdf_in  = rdf_in.Range(start, stop)
+    rdf_out = _process_rdf(rdf_in, path)
+    if rdf_out is None:
+        return None
+
+    out_path = _get_out_path(path)
+    tmp_path = _get_tmp_path(out_path=out_path, suffix=f'{index:03}_pre_merge')
+    wrk_path = _get_tmp_path(out_path=out_path, suffix=f'{index:03}_{os.getpid()}_pre_merge')
+
+    log.debug(f'Saving tree {Data.tree_name} to {tmp_path}')
+    rdf_out.Snapshot(Data.tree_name, wrk_path)
+    os.replace(wrk_path, tmp_path)
+
+    return tmp_path
+# ----------------------
+def _merge_chunks(l_tmp_path : list[str|None], path : Path) -> None:
+    '''
+    Parameters
+    -------------
+    l_tmp_path: Paths to temporary files, in the order of the chunks
+    path      : Path to input ROOT file
+    '''
+    out_path   = _get_out_path(path)
+    wrk_path   = _get_tmp_path(out_path=out_path, suffix=f'{os.getpid()}_tmp')
+    l_tmp_path = [ tmp_path for tmp_path in l_tmp_path if tmp_path is not None ]
+
+    if len(l_tmp_path) == 1:
+        log.debug(f'Single chunk, moving to: {out_path}')
+        os.replace(l_tmp_path[0], out_path)
+        return
+
+    fmrg = TFileMerger()
+    for tmp_path in l_tmp_path:
+        fmrg.AddFile(tmp_path, cpProgress=False)
+
+    fmrg.OutputFile(wrk_path)
+
+    log.info(f'Merging {len(l_tmp_path)} temporary files into: {out_path}')
+    if not fmrg.Merge():
+        raise RuntimeError(f'Could not merge files into: {wrk_path}')
+
+    os.replace(wrk_path, out_path)
+
+    for tmp_path in l_tmp_path:
+        os.remove(tmp_path)
+# ----------------------
+def _create_files_parallel(l_path : list[Path]) -> None:
+    '''
+    Parameters
+    -------------
+    l_path: List of paths to input ROOT files
+    '''
+    log.info(f'Processing {len(l_path)} files with {Data.workers} workers')
+
+    # Workers need their own ROOT and Tensorflow state, do not fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers = Data.workers,
+        mp_context  = context,
+        initializer = _initialize_worker,
+        initargs    = (_get_config(),)) as executor:
+
+        d_plan : dict[Path,Future] = { path : executor.submit(_plan_file, path) for path in l_path }
+        d_fut  : dict[Path,list[Future]] = {}
+        for path, fut_plan in tqdm.tqdm(d_plan.items(), ascii=' -'):
+            l_range = fut_plan.result()
+            if not l_range:
+                continue
+
+            log.debug(f'Submitting {len(l_range)} chunks for: {path}')
+            d_fut[path] = [
+                executor.submit(_process_chunk, path, index, start, stop)
+                for index, (start, stop) in enumerate(l_range) ]
+
+        for path, l_fut in tqdm.tqdm(d_fut.items(), ascii=' -'):
+            l_tmp_path = [ fut.result() for fut in l_fut ]
+            _merge_chunks(l_tmp_path=l_tmp_path, path=path)
+# ----------------------
 def main(args : DictConfig | None = None):
     '''
     Entry point
@@ -425,6 +639,10 @@ def main(args : DictConfig | None = None):
     if isinstance(Data.nmax, int):
         log.warning(f'Limitting dataframe to {Data.nmax} entries')
 
+    if Data.workers > 1:
+        _create_files_parallel(l_path=l_path)
+        return
+
     for path in tqdm.tqdm(l_path, ascii=' -'):
         log.debug(f'{"":<4}{path}')
         _create_file(path=path)
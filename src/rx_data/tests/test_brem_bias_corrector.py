@@ -2,6 +2,7 @@
 Module with functions needed to test BremBiasCorrector class
 '''
 import os
+import numpy
 import pytest
 import matplotlib.pyplot as plt
 
@@ -88,3 +89,38 @@ def test_scan(energy : float):
     plt.savefig(plot_path)
     plt.close()
 # -----------------------------------------------
+@pytest.mark.parametrize('energy', [1_000, 6_000, 15_000, 80_000])
+def test_batch(energy : float):
+    '''
+    Checks that batch correction agrees with the one done photon by photon
+    '''
+    brem = _get_input(energy=energy)
+    obj  = BremBiasCorrector()
+
+    l_are = []
+    l_row = []
+    l_col = []
+    l_ene = []
+    for are, _, _, row, col in Data.locations:
+        if row < 0 or col < 0:
+            continue
+
+        brem_corr = obj.correct(brem=brem, row=int(row), col=int(col), area=int(are))
+
+        l_are.append(are)
+        l_row.append(row)
+        l_col.append(col)
+        l_ene.append(brem_corr.e)
+
+    nphoton   = len(l_ene)
+    brem_corr = obj.correct_batch(
+        px    = numpy.full(nphoton, brem.px),
+        py    = numpy.full(nphoton, brem.py),
+        pz    = numpy.full(nphoton, brem.pz),
+        e     = numpy.full(nphoton, brem.e ),
+        rows  = numpy.array(l_row),
+        cols  = numpy.array(l_col),
+        areas = numpy.array(l_are))
+
+    assert numpy.array_equal(brem_corr.e, numpy.array(l_ene))
+# -----------------------------------------------
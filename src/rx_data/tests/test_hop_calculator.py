@@ -2,10 +2,14 @@
 Module containing tests for HOPVarAdder
 '''
 import os
+import math
+
+import numpy
 import pytest
 import matplotlib.pyplot as plt
 
 from ROOT       import RDF# type: ignore
+from ROOT.Math  import LorentzVector, XYZVector # type: ignore
 from pathlib    import Path
 from dmu        import LogStore
 from rx_common  import Component, Trigger
@@ -143,3 +147,114 @@ def test_data(kind : str, prefix : str, tmp_path : Path):
 
     _plot_variables(rdf=rdf_org, rdf_hop=rdf_hop, name=f'data_{kind}_{trigger}', tmp_path = tmp_path)
 # ----------------------------
+def _get_inputs() -> dict[str,numpy.ndarray]:
+    '''
+    Returns
+    ----------------
+    Dictionary with inputs for Rk trigger, random values followed by:
+
+    - Leptons with negative mass, i.e. space-like
+    - Leptons along the direction of flight, i.e. zero transverse momentum and alpha = 1
+    - Hadron along the direction of flight, i.e. alpha = 0
+    '''
+    rng     = numpy.random.default_rng(seed=42)
+    nrandom = 1_000
+    d_data  = {}
+    for name in ['L1_P', 'L2_P', 'H_P']:
+        arr_p = rng.normal(0, 5_000, size=(nrandom, 3))
+        arr_e = numpy.sqrt(numpy.sum(arr_p ** 2, axis=1) + rng.uniform(0, 500, size=nrandom) ** 2)
+        for index, axis in enumerate('XYZ'):
+            d_data[f'{name}{axis}'] = arr_p[:, index]
+        d_data[f'{name}E'] = arr_e
+
+    for name in ['B_BPV', 'B_END_V']:
+        arr_x = rng.normal(0, 10, size=(nrandom, 3))
+        for index, axis in enumerate('XYZ'):
+            d_data[f'{name}{axis}'] = arr_x[:, index]
+
+    # Flight along z, for the last three candidates
+    l_row = [
+        {'L1_P' : [100, 200, 3_000, 3_000], 'L2_P' : [-50, 100, 2_000, 2_000], 'H_P' : [300, -100, 5_000, 5_010]},
+        {'L1_P' : [  0,   0, 3_000, 3_001], 'L2_P' : [  0,   0, 2_000, 2_001], 'H_P' : [300, -100, 5_000, 5_010]},
+        {'L1_P' : [100, 200, 3_000, 3_010], 'L2_P' : [-50, 100, 2_000, 2_010], 'H_P' : [  0,    0, 5_000, 5_010]},
+    ]
+    for row in l_row:
+        for name, l_val in row.items():
+            for axis, val in zip('XYZE', l_val):
+                d_data[f'{name}{axis}'] = numpy.append(d_data[f'{name}{axis}'], val)
+
+        for axis, pv, sv in zip('XYZ', [0, 0, 0], [0, 0, 10]):
+            d_data[f'B_BPV{axis}']   = numpy.append(d_data[f'B_BPV{axis}']  , pv)
+            d_data[f'B_END_V{axis}'] = numpy.append(d_data[f'B_END_V{axis}'], sv)
+
+    nentries = len(d_data['H_PX'])
+    d_data['EVENTNUMBER'] = numpy.arange(nentries, dtype='uint64')
+    d_data['RUNNUMBER'  ] = numpy.ones(nentries, dtype='uint32')
+
+    return { name : numpy.ascontiguousarray(arr_val) for name, arr_val in d_data.items() }
+# ----------------------------
+def _get_reference(d_data : dict[str,numpy.ndarray]) -> tuple[numpy.ndarray, numpy.ndarray]:
+    '''
+    Parameters
+    ----------------
+    d_data: Dictionary with inputs for Rk trigger
+
+    Returns
+    ----------------
+    Arrays of alpha and HOP mass, calculated candidate by candidate with ROOT.Math vectors
+    '''
+    def _vector(name : str, index : int, ndim : int):
+        if ndim == 3:
+            return XYZVector(*[ float(d_data[f'{name}{axis}'][index]) for axis in 'XYZ' ])
+
+        return LorentzVector('ROOT::Math::PxPyPzE4D<double>')(*[ float(d_data[f'{name}{axis}'][index]) for axis in 'XYZE' ])
+
+    def _pt(vec, dirc) -> float:
+        cos_t = dirc.Dot(vec) / (vec.R() * dirc.R())
+
+        return vec.R() * math.sqrt(1.0 - cos_t ** 2)
+
+    def _correct(alpha : float, particle):
+        return LorentzVector('ROOT::Math::PxPyPzM4D<double>')(
+            alpha * particle.px(),
+            alpha * particle.py(),
+            alpha * particle.pz(),
+            particle.M())
+
+    l_alpha = []
+    l_mass  = []
+    for index in range(len(d_data['H_PX'])):
+        l1    = _vector('L1_P'   , index, ndim=4)
+        l2    = _vector('L2_P'   , index, ndim=4)
+        hd    = _vector('H_P'    , index, ndim=4)
+        bp_dr = _vector('B_END_V', index, ndim=3) - _vector('B_BPV', index, ndim=3)
+
+        had_pt = _pt(hd.Vect()           , bp_dr)
+        ll_pt  = _pt(l1.Vect() + l2.Vect(), bp_dr)
+        alpha  = had_pt / ll_pt if ll_pt > 0. else 1.0
+        mass   = (_correct(alpha, l1) + _correct(alpha, l2) + hd).M()
+
+        l_alpha.append(alpha)
+        l_mass.append(mass)
+
+    return numpy.array(l_alpha), numpy.array(l_mass)
+# ----------------------------
+def test_reference():
+    '''
+    Compares HOP variables with the ones calculated candidate by candidate with ROOT.Math
+    '''
+    d_data = _get_inputs()
+    rdf    = RDF.FromNumpy(d_data)
+    obj    = HOPCalculator(rdf=rdf, trigger=Trigger.rk_ee_os)
+    d_hop  = obj.get_rdf(preffix='hop').AsNumpy(['hop_alpha', 'hop_mass'])
+
+    arr_alpha, arr_mass = _get_reference(d_data=d_data)
+
+    arr_p  = numpy.array([ d_data[f'L1_P{axis}'][-3] for axis in 'XYZ' ])
+    assert d_data['L1_PE'][-3] ** 2 < numpy.sum(arr_p ** 2)
+    assert arr_alpha[-2] == 1.0
+    assert arr_alpha[-1] == 0.0
+
+    assert numpy.allclose(d_hop['hop_alpha'], arr_alpha, rtol=1e-9)
+    assert numpy.allclose(d_hop['hop_mass' ], arr_mass , rtol=1e-6)
+# ----------------------------
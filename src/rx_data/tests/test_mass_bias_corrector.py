@@ -377,3 +377,42 @@ def test_brem_threshold(sample : Component, trigger : Trigger, brem_energy_thres
     _check_corrected(rdf_cor=rdf_cor, rdf_unc=rdf_unc, trigger=trigger, name='Jpsi_M')
     _compare_masses(d_rdf, f'{trigger}/energy_{brem_energy_threshold:03}', f'$E_{{\\gamma}}>{brem_energy_threshold}$ MeV', out_dir = tmp_path)
 #-----------------------------------------
+@pytest.mark.parametrize('kind'           , ['brem_track_1', 'brem_track_2'])
+@pytest.mark.parametrize('skip_correction', [True, False])
+@pytest.mark.parametrize('sample, trigger', _SAMPLES) 
+def test_vectorized(
+    sample          : Component, 
+    trigger         : Trigger, 
+    kind            : str,
+    skip_correction : bool):
+    '''
+    Checks that the columnar implementation gives the same output as the row-wise one
+    '''
+    with RDFGetter.max_entries(value = 1000):
+        rdf_org = _get_rdf(sample=sample, trigger=trigger)
+
+    df_org  = ut.df_from_rdf(rdf=rdf_org, drop_nans=False)
+    is_mc   = ut.rdf_is_mc(rdf=rdf_org)
+
+    d_df    = {}
+    for vectorized in [True, False]:
+        cor = MassBiasCorrector(
+            df             = df_org, 
+            trigger        = trigger,
+            is_mc          = is_mc,
+            skip_correction= skip_correction,
+            vectorized     = vectorized,
+            ecorr_kind     = kind)
+
+        d_df[vectorized] = cor.get_df(suffix=kind)
+
+    df_vec = d_df[True]
+    df_row = d_df[False]
+
+    assert df_vec.columns.tolist() == df_row.columns.tolist()
+    for column in df_row.columns:
+        arr_vec = df_vec[column].to_numpy()
+        arr_row = df_row[column].to_numpy()
+
+        assert numpy.allclose(arr_vec, arr_row, rtol=1e-9, atol=1e-9), f'Column {column} differs'
+#-----------------------------------------
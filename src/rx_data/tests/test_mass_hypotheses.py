@@ -0,0 +1,61 @@
+'''
+Module with tests for functions in mass_hypotheses module
+'''
+import numpy
+import pytest
+
+from vector  import MomentumObject4D as v4d
+from dmu     import LogStore
+from rx_data import mass_hypotheses as mhy
+
+log=LogStore.add_logger('rx_data:test_mass_hypotheses')
+# ----------------------
+@pytest.mark.parametrize('pid, mass', [(11, 0.511), (-13, 105.66), (211, 139.57), (-321, 493.68)])
+def test_masses(pid : int, mass : float):
+    '''
+    Checks that masses are picked from PDG table
+    '''
+    arr_mass = mhy.masses_from_ids(arr_id=numpy.array([pid, pid]))
+
+    assert numpy.allclose(arr_mass, mass, atol=0.01)
+# ----------------------
+def test_invalid_pid():
+    '''
+    Checks that invalid PDG IDs raise
+    '''
+    with pytest.raises(ValueError):
+        mhy.get_mass(pid=999_999_999)
+# ----------------------
+def test_momentum():
+    '''
+    Checks that array of momenta agree with momenta built one by one
+    '''
+    rng = numpy.random.default_rng(seed=1)
+    px  = rng.normal(0, 1000, 100)
+    py  = rng.normal(0, 1000, 100)
+    pz  = rng.uniform(1000, 10_000, 100)
+    arr = mhy.momentum_from_px_py_pz(px=px, py=py, pz=pz, mass=139.57)
+
+    for index in range(100):
+        vec = v4d(px=px[index], py=py[index], pz=pz[index], mass=139.57)
+
+        assert numpy.isclose(arr.e[index], vec.e)
+# ----------------------
+def test_pick_combination():
+    '''
+    Checks that only valid combinations are picked, and that results are reproducible
+    '''
+    rng    = numpy.random.default_rng(seed=1)
+    arr_ok = rng.random((1000, 3)) > 0.5
+    arr_ok[:, 0] |= ~arr_ok.any(axis=1)
+
+    arr_ic1 = mhy.pick_combination(arr_ok=arr_ok, rng=numpy.random.default_rng(seed=2))
+    arr_ic2 = mhy.pick_combination(arr_ok=arr_ok, rng=numpy.random.default_rng(seed=2))
+
+    assert numpy.array_equal(arr_ic1, arr_ic2)
+    assert arr_ok[numpy.arange(1000), arr_ic1].all()
+
+    arr_ok[0] = False
+    with pytest.raises(ValueError):
+        mhy.pick_combination(arr_ok=arr_ok, rng=rng)
+# ----------------------
@@ -126,3 +126,21 @@ def test_nopid(trigger : Trigger, sample : Component, tmp_path : Path) -> None:
     rdf = cal.get_rdf(kind = 'root')
     _validate_rdf(rdf=rdf, out_dir=tmp_path, name=f'{sample}_{trigger}')
 # --------------------------------
+def test_multithreading() -> None:
+    '''
+    Test that MVACalculator raises with multithreading, the scores
+    are put back in the order of the entries through rdfentry_
+    '''
+    sample  = Component.data_24 
+    trigger = Trigger.rk_ee_os
+    with RDFGetter.max_entries(value=Data.nentries):
+        gtr = RDFGetter(sample=sample, trigger=trigger)
+        rdf = gtr.get_rdf(per_file=False)
+
+    with RDFGetter.multithreading(nthreads=4):
+        with pytest.raises(ValueError):
+            MVACalculator(
+                rdf     = rdf,
+                sample  = sample,
+                trigger = trigger,
+                version = Data.version)
@@ -532,6 +532,104 @@ def test_max_entries(
 
     assert math.isclose(nentries, requested, rel_tol=0.1)
 # ------------------------------------------------
+@pytest.mark.parametrize('sample'   , [Component.bdkstkpiee])
+@pytest.mark.parametrize('trigger'  , ['Hlt2RD_BuToKpEE_MVA', 'Hlt2RD_B0ToKpPimEE_MVA'])
+@pytest.mark.parametrize('requested', [-1, 10_000])
+def test_lazy(
+    sample    : Component, 
+    requested : int, 
+    trigger   : Trigger):
+    '''
+    Check that lazy dataframes have the same entries as the eager ones
+    '''
+    trigger = Trigger(trigger)
+
+    with RDFGetter.max_entries(value=requested):
+        gtr = RDFGetter(sample=sample, trigger=trigger)
+        rdf = gtr.get_rdf(per_file=False)
+        nexp= rdf.Count().GetValue()
+
+        with RDFGetter.lazy():
+            gtr = RDFGetter(sample=sample, trigger=trigger)
+            rdf = gtr.get_rdf(per_file=False)
+
+    nentries = rdf.Count().GetValue()
+
+    log.info(f'Found {nentries} entries')
+
+    assert nentries == nexp
+# ------------------------------------------------
+@pytest.mark.parametrize('sample'   , [Component.data_24_md_c2])
+@pytest.mark.parametrize('trigger'  , ['Hlt2RD_BuToKpEE_MVA'])
+def test_multithreading(
+    sample    : Component, 
+    trigger   : Trigger):
+    '''
+    Check that dataframes built with multithreading have the same entries
+    '''
+    trigger = Trigger(trigger)
+
+    gtr = RDFGetter(sample=sample, trigger=trigger)
+    rdf = gtr.get_rdf(per_file=False)
+    exp = rdf.Sum('EVENTNUMBER').GetValue()
+
+    with RDFGetter.multithreading(nthreads=4):
+        gtr = RDFGetter(sample=sample, trigger=trigger)
+        rdf = gtr.get_rdf(per_file=False)
+        val = rdf.Sum('EVENTNUMBER').GetValue()
+
+    assert val == exp
+# ------------------------------------------------
+def test_multithreading_max_entries():
+    '''
+    Check that picking a number of entries with multithreading raises
+    '''
+    with RDFGetter.max_entries(value=10_000),\
+         RDFGetter.multithreading(nthreads=4):
+        gtr = RDFGetter(sample=Component.data_24_md_c2, trigger=Trigger.rk_ee_os)
+        with pytest.raises(ValueError):
+            gtr.get_rdf(per_file=False)
+# ------------------------------------------------
+def test_multithreading_numba():
+    '''
+    Check that adding columns with numba, which picks values by entry number,
+    raises with multithreading, even for samples that are not patched
+    '''
+    with RDFGetter.multithreading(nthreads=4):
+        gtr = RDFGetter(sample=Component.data_24_md_c2, trigger=Trigger.rk_ee_os)
+        rdf = gtr.get_rdf(per_file=False)
+        nentries = rdf.Count().GetValue()
+
+        arr_val = numpy.zeros(nentries)
+        with pytest.raises(ValueError):
+            ut.add_column_with_numba(rdf, arr_val, 'values', identifier='test_multithreading_numba')
+# ------------------------------------------------
+@pytest.mark.parametrize('aligned', [True, False])
+def test_check_alignment_multithreading(aligned : bool):
+    '''
+    Check that the alignment check with multithreading runs on all the entries
+    '''
+    offset = 0 if aligned else 1
+    with RDFGetter.multithreading(nthreads=4):
+        rdf = RDataFrame(100_000)
+        rdf = rdf.Define('EVENTNUMBER'    , 'rdfentry_')
+        rdf = rdf.Define('mva_EVENTNUMBER', f'rdfentry_ < 99000 ? rdfentry_ : rdfentry_ + {offset}')
+
+        if aligned:
+            RDFGetter.check_alignment(rdf=rdf, index='EVENTNUMBER')
+            return
+
+        with pytest.raises(ValueError):
+            RDFGetter.check_alignment(rdf=rdf, index='EVENTNUMBER')
+# ------------------------------------------------
+def test_multithreading_invalid():
+    '''
+    Check that invalid number of threads raises
+    '''
+    with pytest.raises(ValueError):
+        with RDFGetter.multithreading(nthreads=0):
+            pass
+# ------------------------------------------------
 @pytest.mark.parametrize('kind'   , ['data', 'mc'])
 @pytest.mark.parametrize('trigger', [Trigger.rk_ee_os, Trigger.rkst_ee_os])
 def test_per_file(
@@ -8,6 +8,7 @@ import pytest
 from ROOT    import RDataFrame, RDF # type: ignore
 from dmu     import LogStore
 from rx_data import SampleEmulator
+from rx_data import RDFGetter
 
 log=LogStore.add_logger('rx_data:test_sample_emulator')
 
@@ -98,3 +99,24 @@ def test_swap_mother(sample : str, size : int):
 
         assert numpy.isclose(arr_val, expected).all()
 # --------------------------------------------
+@pytest.mark.parametrize('sample', _SAMPLES_MOTHER_SWAP)
+def test_swap_mother_multithreading(sample : str):
+    '''
+    Redefinitions of unpatched samples do not depend on the entry number
+    and should give the same values with multithreading
+
+    sample: Name of sample to emulate
+    '''
+    log.info('')
+    emu = SampleEmulator(sample=sample)
+    rdf = emu.post_process(rdf = _get_rdf(size = 100_000))
+    exp = rdf.AsNumpy(_SWAPPED_MASSES + ['B_ID'])
+
+    with RDFGetter.multithreading(nthreads=4):
+        rdf = emu.post_process(rdf = _get_rdf(size = 100_000))
+        val = rdf.AsNumpy(_SWAPPED_MASSES + ['B_ID'])
+
+    # Redefinitions are constant, thus the order of the entries does not matter
+    for name, arr_exp in exp.items():
+        assert numpy.array_equal(numpy.sort(val[name]), numpy.sort(arr_exp))
+# --------------------------------------------
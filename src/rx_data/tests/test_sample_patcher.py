@@ -9,6 +9,7 @@ from rx_common  import Component
 from rx_common  import Trigger
 from rx_data    import SamplePatcher
 from rx_data    import SpecMaker
+from rx_data    import RDFGetter
 
 _UNPATCHED_SAMPLES = [
     (Component.data_24_md_c2, Trigger.rk_ee_os  ),
@@ -63,3 +64,17 @@ def test_patched(component : Component, trigger : Trigger) -> None:
     assert spec_old != spec_new
     assert len(ptr.redefinitions) != 0
 # ----------------------
+@pytest.mark.parametrize('component, trigger', _PATCHED_SAMPLES)
+def test_patched_multithreading(component : Component, trigger : Trigger) -> None:
+    '''
+    Tests that patching raises with multithreading, the patched
+    entries are picked by entry number
+    '''
+    spk = SpecMaker(component=component, trigger=trigger, skip_patch=True)
+    ptr = SamplePatcher(sample = component, spec = spk.spec)
+    ptr.get_patched_specification()
+
+    with RDFGetter.multithreading(nthreads=4):
+        with pytest.raises(ValueError):
+            _ = ptr.redefinitions
+# ----------------------
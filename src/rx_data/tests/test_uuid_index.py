@@ -0,0 +1,68 @@
+'''
+Module holding tests for UUIDIndex class
+'''
+import json
+from pathlib import Path
+
+import pytest
+from ROOT    import RDataFrame, TFile # type: ignore
+from dmu     import LogStore
+from rx_data import UUIDIndex
+
+log=LogStore.add_logger('rx_data:test_uuid_index')
+# ----------------------
+@pytest.fixture(scope='module', autouse=True)
+def initialize():
+    '''
+    This will run before any test
+    '''
+    LogStore.set_level('rx_data:uuid_index', 10)
+# ----------------------
+def _make_files(dir_path : Path, nfiles : int) -> list[Path]:
+    l_path = []
+    for ifile in range(nfiles):
+        path = dir_path / f'file_{ifile:03}.root'
+        rdf  = RDataFrame(10)
+        rdf  = rdf.Define('x', f'{ifile}')
+        rdf.Snapshot('tree', str(path))
+
+        l_path.append(path)
+
+    return l_path
+# ----------------------
+def _uuid_from_file(path : Path) -> str:
+    ifile = TFile(str(path))
+    uuid  = ifile.GetUUID().AsString()
+    ifile.Close()
+
+    return uuid
+# ----------------------
+def test_simple(tmp_path : Path):
+    '''
+    Checks that UUIDs are the ones stored in the files
+    and that the index is created
+    '''
+    l_path = _make_files(dir_path=tmp_path, nfiles=5)
+    idx    = UUIDIndex(paths=l_path)
+    l_uuid = idx.get_uuids()
+
+    assert l_uuid == [ _uuid_from_file(path) for path in l_path ]
+
+    d_index = json.loads((tmp_path / 'uuid_index.json').read_text())
+
+    assert set(d_index) == { path.name for path in l_path }
+# ----------------------
+def test_update(tmp_path : Path):
+    '''
+    Checks that index is updated when a file is replaced
+    '''
+    l_path = _make_files(dir_path=tmp_path, nfiles=3)
+    l_old  = UUIDIndex(paths=l_path).get_uuids()
+
+    [path] = _make_files(dir_path=tmp_path, nfiles=1)
+    l_new  = UUIDIndex(paths=l_path).get_uuids()
+
+    assert l_new[0] == _uuid_from_file(path)
+    assert l_new[0] != l_old[0]
+    assert l_new[1:]== l_old[1:]
+# ----------------------
@@ -3,7 +3,6 @@ Module containing EfficiencyScanner class
 '''
 
 import numpy
-import tqdm
 import pandas as pnd
 
 from pathlib               import Path
@@ -26,6 +25,9 @@ class EfficiencyScanner(Cache):
 
     - Apply full selection, except for cuts involving variables been scanned
     - Scan those variables and provide dataframe with efficiencies
+
+    The yields for all the working points, and for the default selection,
+    are obtained from a single event loop
     '''
     # --------------------------------
     def __init__(self, cfg : dict):
@@ -40,7 +42,8 @@ class EfficiencyScanner(Cache):
         self._yvar = yvar
         self._zvar = 'yield'
 
-        self._yld_default : int = -1
+        self._wexpr       : str|None  = cfg['input'].get('weight')
+        self._yld_default : int|float = -1
     # --------------------------------
     def _get_selection(self) -> dict[str,str]:
         log.debug('Getting selection')
@@ -114,20 +117,93 @@ class EfficiencyScanner(Cache):
 
         return rdf, hsh
     # --------------------------------
-    def _scan_rdf(self, rdf : RDF.RNode) -> dict[str,RDF.RNode]:
-        d_var        = self._cfg['variables']
-        [xvar, yvar] = list(d_var.keys())
-        arr_xval     = d_var[xvar]
-        arr_yval     = d_var[yvar]
-        X, Y         = numpy.meshgrid(arr_xval, arr_yval, indexing='xy')
-        arr_bound    = numpy.stack([X.ravel(), Y.ravel()], axis=1)
-
-        d_rdf = {}
-        for [xval, yval] in arr_bound:
-            expr                = f'({xvar} > {xval}) && ({yvar} > {yval})'
-            d_rdf[(xval, yval)] = rdf.Filter(expr)
-
-        return d_rdf
+    def _get_arrays(self, rdf : RDF.RNode) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray|None]:
+        '''
+        Parameters
+        ------------------
+        rdf: ROOT dataframe with selection applied, except for scanned variables
+
+        Returns
+        ------------------
+        Tuple with arrays of scanned variables and weights, None if no weight was configured
+        This is the only event loop that runs over the sample
+        '''
+        columns = [self._xvar, self._yvar]
+        if self._wexpr is not None:
+            log.info(f'Using weights: {self._wexpr}')
+            rdf = rdf.Define('scan_weight', self._wexpr)
+            columns.append('scan_weight')
+
+        data  = rdf.AsNumpy(columns)
+        arr_x = data[self._xvar].astype('float64')
+        arr_y = data[self._yvar].astype('float64')
+        arr_w = None if self._wexpr is None else data['scan_weight'].astype('float64')
+
+        return arr_x, arr_y, arr_w
+    # --------------------------------
+    @staticmethod
+    def _count_above(
+        arr_val : numpy.ndarray,
+        arr_cut : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Parameters
+        ------------------
+        arr_val: Array with values of variable
+        arr_cut: Sorted array of thresholds
+
+        Returns
+        ------------------
+        Array with number of thresholds below each value, i.e. value passes cut
+        `var > arr_cut[i]` for i smaller than this number. NaNs pass no cut
+        '''
+        arr_num = numpy.searchsorted(arr_cut, arr_val, side='left')
+        arr_num = numpy.where(numpy.isnan(arr_val), 0, arr_num)
+
+        return arr_num
+    # --------------------------------
+    def _yields_from_arrays(
+        self,
+        arr_x : numpy.ndarray,
+        arr_y : numpy.ndarray,
+        arr_w : numpy.ndarray|None) -> pnd.DataFrame:
+        '''
+        Fills a histogram whose bins are delimited by the scanned values
+        and integrates it from each grid point upwards, to get all the yields at once
+
+        Parameters
+        ------------------
+        arr_x/y: Arrays with values of scanned variables
+        arr_w  : Array of weights, if None, will count entries
+
+        Returns
+        ------------------
+        pandas dataframe with X/Y coordinates and yields, same as `_get_yields`
+        '''
+        d_var    = self._cfg['variables']
+        arr_xval = numpy.asarray(d_var[self._xvar], dtype='float64')
+        arr_yval = numpy.asarray(d_var[self._yvar], dtype='float64')
+
+        arr_xcut = numpy.unique(arr_xval)
+        arr_ycut = numpy.unique(arr_yval)
+        nx, ny   = len(arr_xcut) + 1, len(arr_ycut) + 1
+
+        arr_ix   = self._count_above(arr_val=arr_x, arr_cut=arr_xcut)
+        arr_iy   = self._count_above(arr_val=arr_y, arr_cut=arr_ycut)
+
+        hist     = numpy.bincount(arr_ix * ny + arr_iy, weights=arr_w, minlength=nx * ny)
+        hist     = hist.reshape(nx, ny)
+        # Entry [i, j] is the yield in bins i and above for x and j and above for y
+        # i.e. the yield passing the cut i - 1 for x and j - 1 for y
+        cumul    = hist[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1]
+
+        X, Y     = numpy.meshgrid(arr_xval, arr_yval, indexing='xy')
+        arr_xgrd = X.ravel()
+        arr_ygrd = Y.ravel()
+        arr_ixgr = numpy.searchsorted(arr_xcut, arr_xgrd)
+        arr_iygr = numpy.searchsorted(arr_ycut, arr_ygrd)
+        arr_zval = cumul[arr_ixgr + 1, arr_iygr + 1]
+
+        return pnd.DataFrame({self._xvar : arr_xgrd, self._yvar : arr_ygrd, self._zvar : arr_zval})
     # --------------------------------
     def _eff_from_yield(self, df_tgt : pnd.DataFrame) -> pnd.DataFrame:
         '''
@@ -176,40 +252,39 @@ class EfficiencyScanner(Cache):
         pandas dataframe with:
 
         X/Y: Coordinates at which cuts are evaluated
-        Z  : Yield
+        Z  : Yield, sum of weights if `weight` was specified in the `input` section of the config
         '''
-        d_rdf = self._scan_rdf(rdf=rdf)
-
         log.info('Evaluating yields')
 
-        d_data= {self._xvar : [], self._yvar : [], self._zvar : []}
-        for (xval, yval), rdf_sel in tqdm.tqdm(d_rdf.items()):
-            zval = rdf_sel.Count().GetValue()
+        arr_x, arr_y, arr_w = self._get_arrays(rdf=rdf)
+        df = self._yields_from_arrays(arr_x=arr_x, arr_y=arr_y, arr_w=arr_w)
 
-            d_data[self._xvar].append(xval)
-            d_data[self._yvar].append(yval)
-            d_data[self._zvar].append(zval)
-
-        return pnd.DataFrame(d_data)
+        return df
     # ----------------------
-    def _set_default_wp_yield(self, rdf : RDF.RNode) -> None:
+    def _book_default_wp_yield(self, rdf : RDF.RNode) -> RDF.RResultPtr:
         '''
-        This method sets _yld_default value. I.e. yield of MC sample
-        for default selection.
+        This method books the yield of MC sample for default selection.
+        It will be evaluated in the same event loop as the scan
 
         Parameters
         -------------
         rdf: ROOT dataframe before selection
+
+        Returns
+        -------------
+        Lazy result with yield, sum of weights, if weights were specified
         '''
         sample  = self._cfg['input']['sample']
         trigger = self._cfg['input']['trigger']
         q2bin   = self._cfg['input']['q2bin']
 
         rdf_sel = sel.apply_full_selection(rdf=rdf, q2bin=q2bin, trigger=trigger, process=sample)
+        if self._wexpr is None:
+            return rdf_sel.Count()
 
-        self._yld_default = rdf_sel.Count().GetValue()
+        rdf_sel = rdf_sel.Define('scan_weight', self._wexpr)
 
-        log.info(f'Setting default WP yield to: {self._yld_default}')
+        return rdf_sel.Sum('scan_weight')
     # --------------------------------
     def run(self) -> pnd.DataFrame:
         '''
@@ -233,9 +308,13 @@ class EfficiencyScanner(Cache):
             return df
 
         log.info('Efficiencies not cached, recalculating them')
-        self._set_default_wp_yield(rdf=rdf)
+        res_default = self._book_default_wp_yield(rdf=rdf)
 
         df = self._get_yields(rdf=rdf)
+
+        self._yld_default = res_default.GetValue()
+        log.info(f'Setting default WP yield to: {self._yld_default}')
+
         df = self._eff_from_yield(df_tgt=df)
 
         df.to_json(out_path)
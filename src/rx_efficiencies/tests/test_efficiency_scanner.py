@@ -3,6 +3,7 @@ Module used to test EfficiencyScanner class
 '''
 
 import pytest
+import numpy
 import matplotlib.pyplot as plt
 import pandas            as pnd
 
@@ -55,6 +56,57 @@ def _plot_values(
     plt.savefig(out_path)
     plt.close()
 # -----------------------------------
+def _get_brute_force_yield(
+    arr_x : numpy.ndarray,
+    arr_y : numpy.ndarray,
+    arr_w : numpy.ndarray|None,
+    xcut  : float,
+    ycut  : float) -> float:
+    '''
+    Yield passing the working point, counting each entry, as in the original per grid point filters
+    '''
+    arr_pass = (arr_x > xcut) & (arr_y > ycut)
+    if arr_w is None:
+        return float(arr_pass.sum())
+
+    return float(arr_w[arr_pass].sum())
+# -----------------------------------
+@pytest.mark.parametrize('weighted', [False, True])
+def test_yields_from_arrays(weighted : bool, tmp_path : Path):
+    '''
+    Compares yields from single pass counting with a brute force count at each grid point
+    '''
+    # Unsorted and with duplicates, as they could come from the user
+    l_xwp = [0.8, 0.2, 0.5, 0.2]
+    l_ywp = [0.3, 0.9, 0.6]
+    cfg   = {
+        'input'     : {},
+        'variables' :
+        {
+            'mva_cmb' : l_xwp,
+            'mva_prc' : l_ywp,
+            }
+        }
+
+    rng   = numpy.random.default_rng(seed=42)
+    arr_x = rng.uniform(0, 1, size=1000)
+    arr_y = rng.uniform(0, 1, size=1000)
+    # Entries exactly on the cuts, which should fail them, and NaNs, which should fail all
+    arr_x = numpy.concatenate([arr_x, l_xwp, l_xwp[:3], [numpy.nan, 0.9]])
+    arr_y = numpy.concatenate([arr_y, [0.95] * 4, l_ywp , [0.95, numpy.nan]])
+    arr_w = rng.uniform(0, 2, size=len(arr_x)) if weighted else None
+
+    with Cache.cache_root(path = tmp_path):
+        obj = EfficiencyScanner(cfg=cfg)
+
+    df = obj._yields_from_arrays(arr_x=arr_x, arr_y=arr_y, arr_w=arr_w)
+
+    assert len(df) == len(l_xwp) * len(l_ywp)
+    for xcut, ycut, yld in df[['mva_cmb', 'mva_prc', 'yield']].itertuples(index=False):
+        expected = _get_brute_force_yield(arr_x=arr_x, arr_y=arr_y, arr_w=arr_w, xcut=xcut, ycut=ycut)
+
+        assert yld == pytest.approx(expected)
+# -----------------------------------
 @pytest.mark.parametrize('sample, q2bin', [
     ('Bu_JpsiK_ee_eq_DPC'        , 'jpsi'   ),
     ('Bu_Kee_eq_btosllball05_DPC', 'low'    ),
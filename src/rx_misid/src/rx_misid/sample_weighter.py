@@ -14,6 +14,7 @@ from dmu                import LogStore
 from numpy              import typing       as numpy_typing
 from boost_histogram    import Histogram    as bh
 from boost_histogram    import accumulators as acc
+from boost_histogram    import storage      as bh_storage
 from .types             import MisIDSampleWeights
 
 log=LogStore.add_logger('rx_misid:sample_weighter')
@@ -277,6 +278,137 @@ class SampleWeighter:
         eff = self._check_eff(eff=eff, x=x_value, y=y_value)
 
         return eff
+    # ------------------------------
+    def _get_bin_indices(
+        self,
+        hist  : bh,
+        iaxis : int,
+        values: FloatArray,
+        name  : str) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_bin_index`
+
+        Parameters
+        ------------------
+        hist  : Boost histogram
+        iaxis : Axis index, 0 or 1
+        values: Array with values of variable whose intex is read for `iaxis`
+        name  : Name of the variable corresponding to `iaxis`
+
+        Returns
+        ------------------
+        Array with indices of bins in map for given `values` in given histogram
+        '''
+        axis = hist.axes[iaxis]
+        minv = axis.edges[ 0] * 1.001
+        maxv = axis.edges[-1] * 0.999
+
+        # NaNs are left as they are and counted as low values, like in `_get_bin_index`
+        arr_low = ~(values >= minv)
+        arr_high= values > maxv
+        new_val = numpy.where(values < minv, minv, values)
+        new_val = numpy.where(new_val > maxv, maxv, new_val)
+
+        nlow    = int(numpy.sum(arr_low ))
+        nhigh   = int(numpy.sum(arr_high))
+        if nlow + nhigh > 0:
+            if name not in self._d_out_of_map:
+                self._d_out_of_map[name] = {True : 0, False : 0}
+
+            self._d_out_of_map[name][False] += nlow
+            self._d_out_of_map[name][True ] += nhigh
+
+        return numpy.asarray(axis.index(new_val), dtype=int)
+    # ------------------------------
+    @staticmethod
+    def _get_map_values(hist : bh) -> FloatArray:
+        '''
+        Parameters
+        ------------------
+        hist : Boost histogram with PID efficiencies
+
+        Returns
+        ------------------
+        Array with efficiencies, without flow bins
+        '''
+        storage = hist.storage_type
+        if storage not in (bh_storage.Double, bh_storage.Weight):
+            raise NotImplementedError(f'Unrecognized storage of type: {storage}')
+
+        return hist.values(flow=False)
+    # ------------------------------
+    def _get_lepton_effs(
+        self,
+        lep    : str,
+        is_sig : bool) -> FloatArray:
+        '''
+        Vectorized version of `_get_lepton_eff`. Candidates are grouped by block, hadron and brem,
+        such that each group uses a single map
+
+        Parameters
+        ----------------
+        lep   : L1 or L2
+        is_sig: Used to pick correct efficiency map
+
+        Returns
+        ----------------
+        Array with lepton PID efficiencies
+        '''
+        name     = f'{lep}_HASBREM'
+        varx     = self._varx.replace('PARTICLE', lep)
+        vary     = self._vary.replace('PARTICLE', lep)
+        for column in ['block', 'hadron', name, varx, vary]:
+            if column not in self._df.columns:
+                raise AttributeError(f'Missing column: {column}')
+
+        arr_brem = self._df[name].to_numpy()
+        arr_bad  = (arr_brem != 0) & (arr_brem != 1)
+        if arr_bad.any():
+            value = arr_brem[arr_bad][0]
+            raise ValueError(f'Invalid {name} value: {value}')
+
+        arr_x  = self._df[varx].to_numpy(dtype='float64')
+        arr_y  = self._df[vary].to_numpy(dtype='float64')
+        region = 'signal' if is_sig else 'control'
+
+        df_key = pnd.DataFrame({
+            'block' : self._df['block'].to_numpy().astype(int),
+            'hadron': self._df['hadron'].to_numpy(),
+            'brem'  : arr_brem})
+
+        arr_eff = numpy.zeros(len(self._df))
+        for (block, hadron, brem), arr_ind in df_key.groupby(['block', 'hadron', 'brem'], sort=False).indices.items():
+            key_map  = f'block{block}_{hadron}_{region}'
+            brem_key = BREM if brem == 1 else NOBREM
+            try:
+                hist = self._d_map[brem_key][key_map]
+            except KeyError as exc:
+                for key, d_map in sorted(self._d_map.items()):
+                    log.info(key)
+                    for val in sorted(d_map):
+                        log.info(f'   {val}')
+
+                raise KeyError(f'Cannot pick up PID map: {key_map}') from exc
+
+            arr_ix = self._get_bin_indices(hist, iaxis=0, values=arr_x[arr_ind], name=varx)
+            arr_iy = self._get_bin_indices(hist, iaxis=1, values=arr_y[arr_ind], name=vary)
+
+            values = self._get_map_values(hist=hist)
+            nx, ny = values.shape
+            arr_in = (arr_ix >= 0) & (arr_ix < nx) & (arr_iy >= 0) & (arr_iy < ny)
+
+            effs         = numpy.empty(len(arr_ind))
+            effs[arr_in] = values[arr_ix[arr_in], arr_iy[arr_in]]
+            # Flow bins, e.g. for NaN coordinates, are read from the histogram, as in `_get_lepton_eff`
+            for index in numpy.flatnonzero(~arr_in):
+                eff = hist[arr_ix[index], arr_iy[index]]
+                effs[index] = eff.value if isinstance(eff, acc.WeightedSum) else eff
+
+            arr_eff[arr_ind] = effs
+
+        arr_eff = self._check_effs(effs=arr_eff)
+
+        return arr_eff
     # ----------------------
     def _get_brem_key(self, lep : str, row : pnd.Series) -> str:
         '''
@@ -356,6 +488,43 @@ class SampleWeighter:
 
         raise ValueError(f'Unexpected efficiency value: {eff}')
     # ------------------------------
+    def _check_effs(self, effs : FloatArray) -> FloatArray:
+        '''
+        Vectorized version of `_check_eff`
+
+        Parameters
+        ---------------
+        effs: Array of efficiencies
+
+        Returns
+        ---------------
+        Array of efficiencies after sanitation step
+        '''
+        arr_inf = numpy.isinf(effs)
+        arr_nan = numpy.isnan(effs)
+        arr_in  = (effs >= 0) & (effs <= 1)
+        arr_zero= arr_in & (effs == 0)
+        arr_one = arr_in & ~arr_zero & numpy.isclose(effs, 1, rtol=0, atol=1e-5)
+        arr_neg = ~arr_inf & (effs < 0)
+        arr_abv = ~arr_inf & (effs > 1)
+
+        self._d_quality['Zeroes'  ] += int(numpy.sum(arr_zero))
+        self._d_quality['Ones'    ] += int(numpy.sum(arr_one))
+        self._d_quality['Good'    ] += int(numpy.sum(arr_in & ~arr_zero & ~arr_one))
+        self._d_quality['Inf'     ] += int(numpy.sum(arr_inf))
+        self._d_quality['NaN'     ] += int(numpy.sum(arr_nan))
+        self._d_quality['Negative'] += int(numpy.sum(arr_neg))
+        self._d_quality['Above 1' ] += int(numpy.sum(arr_abv))
+
+        nbad = numpy.sum(~arr_in)
+        if nbad > 0:
+            log.verbose(f'Found {nbad} efficiencies outside [0, 1]')
+
+        effs = numpy.where(arr_inf | arr_nan | arr_neg, 0.0, effs)
+        effs = numpy.where(arr_abv, 1.0, effs)
+
+        return effs
+    # ------------------------------
     def _print_info_from_row(self, row : pnd.Series) -> None:
         '''
         Prints coordinates at current point
@@ -458,11 +627,8 @@ class SampleWeighter:
         log.info(f'Getting signal={self._is_sig} PID weights for sample {self._sample}')
 
         try:
-            sr_eff_l1 = self._df.apply(self._get_lepton_eff, args=('L1', self._is_sig), axis=1)
-            sr_eff_l2 = self._df.apply(self._get_lepton_eff, args=('L2', self._is_sig), axis=1)
-
-            arr_eff_l1 = sr_eff_l1.to_numpy()
-            arr_eff_l2 = sr_eff_l2.to_numpy()
+            arr_eff_l1 = self._get_lepton_effs(lep='L1', is_sig=self._is_sig)
+            arr_eff_l2 = self._get_lepton_effs(lep='L2', is_sig=self._is_sig)
             arr_wgt    = arr_eff_l1 * arr_eff_l2
         except AttributeError as exc:
             log.warning('Found columns:')
@@ -290,3 +290,30 @@ def test_get_maps():
     assert len(d_map) == 32
     for hist in d_map.values():
         assert isinstance(hist, Histogram)
+# ----------------------------
+@pytest.mark.parametrize('is_sig', [True, False])
+@pytest.mark.parametrize('sample', [
+    'Bu_KplKplKmn_eq_sqDalitz_DPC',
+    'Bu_piplpimnKpl_eq_sqDalitz_DPC'])
+def test_batch(is_sig : bool, sample : str):
+    '''
+    Checks that efficiencies calculated for all the candidates at once
+    agree with the ones calculated candidate by candidate
+    '''
+    data= gut.load_data(package='rx_misid_data', fpath='weights.yaml')
+    cfg = MisIDSampleWeights(**data)
+
+    df  = _get_dataframe(good_phase_space=False, sample=sample, block=3)
+    df  = df.copy()
+
+    wgt = SampleWeighter(
+        df    = df,
+        cfg   = cfg,
+        sample= sample,
+        is_sig= is_sig)
+
+    for lep in ['L1', 'L2']:
+        arr_row = wgt._df.apply(wgt._get_lepton_eff, args=(lep, is_sig), axis=1).to_numpy()
+        arr_bat = wgt._get_lepton_effs(lep=lep, is_sig=is_sig)
+
+        assert numpy.array_equal(arr_row, arr_bat)
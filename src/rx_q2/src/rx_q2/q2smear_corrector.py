@@ -3,14 +3,12 @@ Module containing Q2SmearCalculator class
 '''
 
 import os
-import math
 from typing    import Final
-from functools import cache
 
+import numpy
 import pandas as pnd
 from ROOT                           import RDF
 from rx_common                      import info
-from dmu.generic                    import typing_utilities as tut
 from dmu.logging.log_store          import LogStore
 from dmu.generic.version_management import get_last_version
 
@@ -25,6 +23,9 @@ class Q2SmearCorrector:
     - Read mass scales and resolutions
     - Calculate smeared and scaled masses
     - Returns smeared mass for each unsmeared mass, block and brem 
+
+    The scales and resolutions are stored in an array indexed by brem and block
+    and the masses are smeared column by column.
     '''
     # ------------------------------------
     def __init__(
@@ -58,6 +59,7 @@ class Q2SmearCorrector:
         self._expected : Final[list[str]] = _expected
         self._channel  = channel
         self._df       = self._get_scales()
+        self._table    = self._get_table()
     # ------------------------------------
     def _get_scales(self) -> pnd.DataFrame:
         ana_dir = os.environ['ANADIR']
@@ -69,69 +71,94 @@ class Q2SmearCorrector:
 
         return df
     # ------------------------------------
-    @cache
-    def _read_quantity(self, nbrem : int, block : int, kind : str) -> float:
-        df = self._df.query(f'block == {block} and brem == {nbrem}')
+    def _get_table(self) -> numpy.ndarray:
+        '''
+        Returns
+        -------------
+        Array with shape (nbrem, nblock, 3), where the last axis holds
+        (mu_mc, reso, scale) for each brem category and block. 
+        Entries without exactly one data and one MC fit are NaN
+        '''
+        nbrem  = int(self._df['brem' ].max()) + 1
+        nblock = int(self._df['block'].max()) + 1
+        table  = numpy.full((nbrem, nblock, 3), numpy.nan)
 
-        if len(df) != 2:
-            log.info(df)
-            raise ValueError(f'Expected data and MC entries for brem/block: {nbrem}/{block}')
+        for (brem, block), df in self._df.groupby(['brem', 'block']):
+            if len(df) != 2:
+                log.debug(f'Expected data and MC entries for brem/block: {brem}/{block}, found {len(df)}')
+                continue
 
-        if kind == 'mu_mc':
+            mu_dt = df.loc[ (df['sample'] == 'dat'), 'mu_val' ].iloc[0]
             mu_mc = df.loc[ (df['sample'] == 'sim'), 'mu_val' ].iloc[0]
-            return mu_mc
-
-        if kind == 'reso':
             sg_dt = df.loc[ (df['sample'] == 'dat'), 'sg_val' ].iloc[0]
             sg_mc = df.loc[ (df['sample'] == 'sim'), 'sg_val' ].iloc[0]
-            return sg_dt / sg_mc
 
-        if kind == 'scale':
-            mu_dt = df.loc[ (df['sample'] == 'dat'), 'mu_val' ].iloc[0]
-            mu_mc = df.loc[ (df['sample'] == 'sim'), 'mu_val' ].iloc[0]
+            table[brem, block] = mu_mc, sg_dt / sg_mc, mu_dt - mu_mc
+
+        return table
+    # ------------------------------------
+    def _read_quantities(
+        self, 
+        nbrem : numpy.ndarray, 
+        block : numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        '''
+        Parameters
+        ---------------
+        nbrem: Array with brem category of each candidate
+        block: Array with block of each candidate
+
+        Returns
+        ---------------
+        Tuple with arrays of mu_mc, reso and scale for each candidate
+        '''
+        nbrem = nbrem.astype(int)
+        block = block.astype(int)
+
+        nbrem_max, nblock_max, _ = self._table.shape
+        arr_in = (nbrem >= 0) & (nbrem < nbrem_max) & (block >= 0) & (block < nblock_max)
 
-            return mu_dt - mu_mc
+        values = numpy.full((len(nbrem), 3), numpy.nan)
+        values[arr_in] = self._table[nbrem[arr_in], block[arr_in]]
 
-        raise NotImplementedError(f'Invalid quantity: {kind}')
+        arr_bad = numpy.isnan(values).any(axis=1)
+        if arr_bad.any():
+            s_bad = set(zip(nbrem[arr_bad].tolist(), block[arr_bad].tolist()))
+            log.info(self._df)
+            raise ValueError(f'Expected data and MC entries for brem/block: {sorted(s_bad)}')
+
+        mu_mc, reso, scale = values.T
+
+        return mu_mc, reso, scale
     # ------------------------------------
     def _smear_mass(
         self,
-        row      : pnd.Series,
-        particle : str) -> float:
+        df       : pnd.DataFrame,
+        particle : str) -> numpy.ndarray:
         '''
         Parameters:
         ---------------
-        row : DataFrame row representing candiate 
+        df      : DataFrame with candidates 
+        particle: E.g. Jpsi, needed to pick up masses
 
         Returns:
         ---------------
-        Smeared mass
+        Array with smeared masses, where smearing gives NaN, the original mass is used
         '''
-        block = tut.numeric_from_series(row=row, name='block', numeric=int)
-        nbrem = tut.numeric_from_series(row=row, name='nbrem', numeric=int)
-        recom = tut.numeric_from_series(row=row, name=f'{particle}_M_brem_track_2', numeric=float)
-        truem = tut.numeric_from_series(row=row, name=f'{particle}_TRUEM'         , numeric=float)
+        recom = df[f'{particle}_M_brem_track_2'].to_numpy(dtype='float64')
+        truem = df[f'{particle}_TRUEM'         ].to_numpy(dtype='float64')
 
-        mu_mc = self._read_quantity(nbrem=nbrem, block=block, kind='mu_mc')
-        reso  = self._read_quantity(nbrem=nbrem, block=block, kind= 'reso')
-        scale = self._read_quantity(nbrem=nbrem, block=block, kind='scale')
+        mu_mc, reso, scale = self._read_quantities(nbrem=df['nbrem'].to_numpy(), block=df['block'].to_numpy())
 
         mass  = truem + reso * (recom - truem) + scale + (1 - reso) * (mu_mc - JPSI_PDG_MASS)
 
-        log.verbose('')
-        log.verbose(f'{truem=:.0f}, {recom=:.0f}, {reso=:.3f}, {scale=:.3f}, {mu_mc=:.0f}, {JPSI_PDG_MASS=:.0f}')
-        log.verbose(f'{(reso * (recom - truem))=:.0f}, {((1 - reso) * (mu_mc - JPSI_PDG_MASS))=:.0f}')
-        log.verbose(f'{recom:<20.0f}{"->":<20}{mass:<20.0f}')
-
-        if not math.isnan(mass):
-            return mass
+        arr_nan = numpy.isnan(mass)
+        nnan    = numpy.sum(arr_nan)
+        if nnan > 0:
+            log.debug(f'Found {nnan} NaN smeared masses for {particle}, using unsmeared masses')
 
-        log.debug('')
-        log.debug(f'{truem=:.0f}, {recom=:.0f}, {reso=:.3f}, {scale=:.3f}, {mu_mc=:.0f}, {JPSI_PDG_MASS=:.0f}')
-        log.debug(f'{(reso * (recom - truem))=:.0f}, {((1 - reso) * (mu_mc - JPSI_PDG_MASS))=:.0f}')
-        log.debug(f'{recom:<20.0f}{"->":<20}{mass:<20.0f}')
+        mass    = numpy.where(arr_nan, recom, mass)
 
-        return recom 
+        return mass
     # ----------------------
     def _process_data(self, rdf : RDF.RNode) -> RDF.RNode:
         '''
@@ -224,7 +251,7 @@ class Q2SmearCorrector:
         log.info('Smearing masses')
         for particle in self._particles:
             log.debug(particle)
-            df[f'{particle}_Mass_smr'] = df.apply(self._smear_mass, args=(particle,), axis=1)
+            df[f'{particle}_Mass_smr'] = self._smear_mass(df=df, particle=particle)
 
         df = self._add_extra_columns(df=df, rdf=rdf)
         df = self._trim_columns(df=df)
@@ -159,3 +159,16 @@ def test_get_rdf(
     _plot_masses(rdf=rdf, particle='B'   , dir_path=tmp_path)
     _plot_masses(rdf=rdf, particle='Jpsi', dir_path=tmp_path)
 # -------------------------------------------
+@pytest.mark.parametrize('channel', ['ee',  'mm'])
+def test_missing_block(channel : str):
+    '''
+    Checks that candidates in blocks without scales raise
+    '''
+    df  = _get_df(uniform = True, channel = channel, is_data = False)
+    df.loc[0, 'block'] = 100
+    rdf = RDF.FromPandas(df)
+
+    obj = Q2SmearCorrector(channel=channel)
+    with pytest.raises(ValueError):
+        obj.get_rdf(rdf=rdf)
+# -------------------------------------------
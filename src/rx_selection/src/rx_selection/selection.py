@@ -14,6 +14,7 @@ from ROOT                   import RDF # type: ignore
 from dmu                    import LogStore
 from dmu.generic            import hashing
 from dmu.rdataframe         import utilities          as rut
+from dmu.rdataframe.expression_library import ExpressionLibrary
 from dmu.generic            import utilities          as gut
 from rx_selection           import truth_matching     as tm
 from rx_selection           import version_management as vman
@@ -375,12 +376,13 @@ def apply_full_selection(
     log.info(60 * '-')
     log.info('Applying cuts')
     log.info(60 * '-')
+    exl = ExpressionLibrary(rdf=rdf)
     for cut_name, cut_value in d_sel.items():
         log.debug(f'{cut_name:<40}{cut_value}')
-        try:
-            rdf = rdf.Filter(cut_value, cut_name)
-        except Exception as exc:
-            raise ValueError(f'Cannot apply cut {cut_name} = {cut_value}') from exc
+        exl = exl.Filter(cut_value, cut_name)
+
+    # Raises ValueError naming the cut, if it cannot be applied
+    rdf = exl.get_rdf()
 
     if out_path:
         _save_cutflow(path=out_path, rdf=rdf, cuts=d_sel)